@@ -0,0 +1,199 @@
+"""
+Converts codelists from the command line, without opening any window. Takes files, glob patterns and folders (which
+are searched for codelists, subfolders included), and converts each codelist to the given formats with a process pool.
+Files are written atomically, and those which would stay the same are left untouched. A JSON summary is printed at the
+end (or saved with "--summary"). Run from the program's folder with "python -m batch [options] inputs...", for example
+"python -m batch --to gct --to ini -o out codes/".
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from PyQt5.QtCore import Qt
+
+import globalstuff
+from common import CodeNode, WalkItems
+from exporting import WriteFiles, WriteCodes, WRITTEN, SKIPPED, EMPTY
+from parsers import ParseError, ParseFile, NameCodes
+from titles import TitleLookup
+
+# Formats which can be read and written
+readable = ('.txt', '.ini', '.gct', '.dol')
+writable = ('txt', 'ini', 'gct')
+
+# How each format's WriteFiles result is shown in the summary
+outcomes = {WRITTEN: 'written', SKIPPED: 'unchanged', EMPTY: 'empty'}
+
+
+def FindInputs(patterns: list):
+    """
+    Returns (file, relative path) pairs for the given files, glob patterns and folders. The relative path is where the
+    file goes in the output folder: folders keep their structure, while the other files go straight in it.
+    """
+    inputs = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for folder, subfolders, files in os.walk(pattern):
+                subfolders.sort()
+                for file in sorted(files):
+                    if os.path.splitext(file)[1].lower() in readable:
+                        path = os.path.join(folder, file)
+                        inputs.append((path, os.path.relpath(path, pattern)))
+        elif glob.has_magic(pattern):
+            inputs.extend((path, os.path.basename(path)) for path in sorted(glob.glob(pattern, recursive=True))
+                          if os.path.isfile(path) and os.path.splitext(path)[1].lower() in readable)
+        else:
+            inputs.append((pattern, os.path.basename(pattern)))  # Let the conversion complain if it's not there
+
+    # Remove the duplicates, keeping the first one
+    seen = set()
+    return [x for x in inputs if not (os.path.abspath(x[0]) in seen or seen.add(os.path.abspath(x[0])))]
+
+
+def OutputFiles(file: str, relpath: str, formats: list, outdir: str = None):
+    """
+    Returns the destination of each format. Without an output folder, files are written next to the original.
+    """
+    base = os.path.splitext(os.path.join(outdir, relpath) if outdir else file)[0]
+    return {ext: '.'.join([base, ext]) for ext in formats}
+
+
+def Convert(file: str, filenames: dict, optimize: bool, enableall: bool, wiitdb: str):
+    """
+    Converts a codelist. Runs in the worker processes, so it returns a plain dict describing the outcome.
+    """
+    try:
+        gameid, nodes, scrap = ParseFile(file)
+    except ParseError as e:
+        return Failed(file, filenames, '{}: {}'.format(e.title, e.message))
+    except OSError as e:
+        return Failed(file, filenames, "Couldn't read file: {}".format(e.strerror))
+
+    # Fill in what the codelist window would have
+    NameCodes(nodes, set())
+    root = CodeNode(None, Qt.Unchecked, children=nodes)
+    if enableall:
+        for node in WalkItems(root):
+            node.checked = Qt.Checked
+    gameid = gameid.upper() if gameid and 4 <= len(gameid) <= 6 else 'UNKW00'
+    globalstuff.wiitdb = wiitdb
+    gamename = TitleLookup(gameid) if os.path.exists(wiitdb) else 'Unknown Game'  # Don't offer to download it
+
+    # Write the files
+    savings = {} if optimize else None
+    try:
+        for filename in filenames.values():
+            os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        results = WriteFiles(filenames, WriteCodes, root, gameid, gamename, scrap, None, savings)
+    except OSError as e:
+        return Failed(file, filenames, "Couldn't write file {}: {}".format(e.filename, e.strerror))
+
+    # Report how it went. A GCT without enabled codes isn't created, which only fails the conversion if there's nothing
+    # else to show for it.
+    formats = {ext: outcomes.get(result, 'failed') for ext, result in results.items()}
+    if set(results.values()) == {EMPTY}:
+        return Failed(file, filenames, 'No valid enabled codes to put in the GCT', formats)
+    return {'input': file, 'outputs': filenames, 'status': 'converted' if WRITTEN in results.values() else 'unchanged',
+            'formats': formats, 'gameid': gameid, 'codes': CountCodes(nodes), 'savings': savings}
+
+
+def SafeConvert(file: str, filenames: dict, *args):
+    """
+    Don't let a broken codelist take the others down with it.
+    """
+    try:
+        return Convert(file, filenames, *args)
+    except Exception as e:
+        return Failed(file, filenames, '{}: {}'.format(type(e).__name__, e))
+
+
+def Failed(file: str, filenames: dict, error: str, formats: dict = None):
+    result = {'input': file, 'outputs': filenames, 'status': 'failed', 'error': error}
+    if formats:
+        result['formats'] = formats
+    return result
+
+
+def CountCodes(nodes: list):
+    return sum(CountCodes(node.children) if not node.text(1) else 1 for node in nodes)
+
+
+def WriteSummary(files: dict, summary: dict):
+    json.dump(summary, files['json'], indent=2)
+    files['json'].write('\n')
+    return {'json': WRITTEN}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m batch', description='Converts codelists to other formats.')
+    parser.add_argument('inputs', nargs='+', help='codelists, glob patterns (** included) or folders to convert')
+    parser.add_argument('--to', action='append', choices=writable, required=True, help='format to convert to, can be '
+                        'given multiple times')
+    parser.add_argument('-o', '--output', help='folder to write to, otherwise files are written next to the originals')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes, 1 to convert in this process')
+    parser.add_argument('--optimize', action='store_true', help='optimize the GCTs')
+    parser.add_argument('--enable-all', action='store_true', help='enable every code, since GCTs and DOLs are opened '
+                        'with all codes disabled')
+    parser.add_argument('--titles', default=globalstuff.wiitdb, help='title database used for the game names')
+    parser.add_argument('--summary', help='file to write the summary to, instead of printing it')
+    args = parser.parse_args()
+    formats = list(dict.fromkeys(args.to))
+
+    # Find the codelists
+    inputs = FindInputs(args.inputs)
+    if not inputs:
+        parser.error('no codelists found')
+
+    # Find their destinations. Files can't be written twice, nor overwrite the codelists being converted.
+    tasks = []
+    results = {}
+    taken = {os.path.abspath(file): file for file, relpath in inputs}
+    for index, (file, relpath) in enumerate(inputs):
+        filenames = OutputFiles(file, relpath, formats, args.output)
+        clashes = [taken[os.path.abspath(x)] for x in filenames.values() if os.path.abspath(x) in taken]
+        if clashes:
+            results[index] = Failed(file, filenames, 'Would overwrite ' + clashes[0])
+            continue
+        taken.update((os.path.abspath(x), 'the output of ' + file) for x in filenames.values())
+        tasks.append((index, (file, filenames, args.optimize, args.enable_all, args.titles)))
+
+    # Convert them
+    if args.jobs == 1 or len(tasks) < 2:
+        results.update((index, SafeConvert(*task)) for index, task in tasks)
+    else:
+        with ProcessPoolExecutor(args.jobs) as pool:
+            futures = [(index, task, pool.submit(SafeConvert, *task)) for index, task in tasks]
+            for index, task, future in futures:
+                try:
+                    results[index] = future.result()
+                except Exception as e:  # The worker itself died
+                    results[index] = Failed(task[0], task[1], '{}: {}'.format(type(e).__name__, e))
+
+    # Put together the summary
+    files = [results[index] for index in sorted(results)]
+    summary = {status: sum(x['status'] == status for x in files) for status in ('converted', 'unchanged', 'failed')}
+    summary['files'] = files
+    if args.summary:
+        try:
+            WriteFiles({'json': args.summary}, WriteSummary, summary)
+        except OSError:
+            print("Can't write file " + args.summary, file=sys.stderr)
+            return 1
+    else:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+
+    # Point out what went wrong, and the GCTs which weren't created
+    for result in files:
+        if result['status'] == 'failed':
+            print('{}: {}'.format(result['input'], result['error']), file=sys.stderr)
+        elif result['formats'].get('gct') == 'empty':
+            print('{}: GCT not created, no valid codes are enabled'.format(result['input']), file=sys.stderr)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
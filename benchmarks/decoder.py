@@ -0,0 +1,64 @@
+"""
+Measures the codetype decoder's throughput, both when splitting a whole GCT and when decoding a batch of known codes.
+Run from the repository's root with "python benchmarks/decoder.py [code count]".
+"""
+import os
+import random
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from codetypes import Decode, DecodeCodes  # noqa: E402
+
+
+def RandomCode(rand: random.Random):
+    """
+    Makes up a code with a mix of the most common codetypes.
+    """
+    address = rand.randrange(0, 0x1800000, 4)
+    kind = rand.randrange(6)
+    if kind == 0:
+        return struct.pack('>II', 0x04000000 | address, rand.getrandbits(32))
+    elif kind == 1:
+        length = rand.randrange(1, 64)
+        return struct.pack('>II', 0x06000000 | address, length) + bytes((length + 7) // 8 * 8)
+    elif kind == 2:
+        lines = rand.randrange(1, 32)
+        return struct.pack('>II', 0xC2000000 | address, lines) + bytes(lines * 8)
+    elif kind == 3:
+        return struct.pack('>IIII', 0x08000000 | address, 0, 0x20040004, 1)
+    elif kind == 4:
+        body = b''.join(struct.pack('>II', 0x04000000 | address + i * 4, i) for i in range(rand.randrange(1, 8)))
+        return struct.pack('>II', 0x20000000 | address, 0) + body + struct.pack('>II', 0xE0000000, 0x80008000)
+    return struct.pack('>II', 0x42000000, 0x90000000) + struct.pack('>II', 0x04000000 | address, 0) + \
+        struct.pack('>II', 0xE0000000, 0x80008000)
+
+
+def Measure(func, *args, repeat: int = 5):
+    """
+    Returns the best time out of a few runs.
+    """
+    best = float('inf')
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rand = random.Random(0)
+    codes = [RandomCode(rand) for _ in range(count)]
+    data = b''.join(codes)
+    lines = len(data) // 8
+
+    for name, func, arg in (('Split', Decode, data), ('Batch', DecodeCodes, codes)):
+        elapsed = Measure(func, arg)
+        print('{}: {} codes, {} lines in {:.3f}s ({:.0f} lines/s)'.format(name, count, lines, elapsed, lines / elapsed))
+
+
+if __name__ == '__main__':
+    main()
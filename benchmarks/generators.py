@@ -0,0 +1,152 @@
+"""
+Makes up codelists of any size in every format the program can open, for the benchmarks. The same seed always gives
+the same files. Codes are grouped in categories of 100, and about half of them are enabled.
+"""
+import random
+import struct
+from xml.sax.saxutils import escape, quoteattr
+
+from decoder import RandomCode
+
+gameid = 'RMCP01'
+gamename = 'Mario Kart Wii'
+gctmagic = bytes.fromhex('00D0C0DE00D0C0DE')
+gctend = bytes.fromhex('F000000000000000')
+
+
+def CodeText(data: bytes):
+    """
+    Formats a code the way the code field shows it.
+    """
+    return '\n'.join('{:08X} {:08X}'.format(*line) for line in struct.iter_unpack('>II', data))
+
+
+def Codes(count: int, seed: int = 0):
+    """
+    Returns a list of (category name, codes) pairs, where codes are (name, author, comment, data, enabled) tuples.
+    """
+    rand = random.Random(seed)
+    categories = []
+    for i in range(count):
+        if not i % 100:
+            categories.append(('Category {}'.format(i // 100), []))
+        categories[-1][1].append(('Code {}'.format(i), 'Author {}'.format(rand.randrange(50)),
+                                  'Comment for code {}'.format(i), RandomCode(rand), rand.random() < 0.5))
+    return categories
+
+
+def WriteTXT(filename: str, categories: list):
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('\n'.join([gameid, gamename]))
+        for category, codes in categories:
+            f.write('\n\n' + category)
+            for name, author, comment, data, enabled in codes:
+                code = CodeText(data)
+                if enabled:
+                    code = '\n'.join('* ' + line for line in code.splitlines())
+                f.write('\n\n{} [{}]\n{}\n{}'.format(name, author, code, comment))
+            f.write('\n\n#')
+        f.write('\n')
+
+
+def WriteINI(filename: str, categories: list):
+    enabled = []
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('[Gecko]')
+        for category, codes in categories:
+            for name, author, comment, data, isenabled in codes:
+                f.write('\n${} [{}]\n{}\n*{}'.format(name, author, CodeText(data).lower(), comment))
+                if isenabled:
+                    enabled.append(name)
+        f.write('\n[Gecko_Enabled]')
+        f.writelines('\n$' + name for name in enabled)
+        f.write('\n')
+
+
+def GCTData(categories: list):
+    """
+    Returns the regular GCT, which only has the enabled codes.
+    """
+    return b''.join([gctmagic] + [code[3] for category, codes in categories for code in codes if code[4]] + [gctend])
+
+
+def WriteGCT(filename: str, categories: list):
+    with open(filename, 'wb') as f:
+        f.write(GCTData(categories))
+
+
+def WriteExtendedGCT(filename: str, categories: list):
+    """
+    Writes a GCT with BrawlBox's code names and comments after the codelist end. The table has the game name and id
+    offsets, the code count, and an (offset, lines, name offset, comment offset) entry for every code. Entry offsets
+    are from the entry itself, the others from the beginning of the table.
+    """
+    codes = [code for category, codelist in categories for code in codelist]
+
+    # The codes come first
+    data = bytearray(gctmagic)
+    offsets = []
+    for code in codes:
+        offsets.append(len(data))
+        data += code[3]
+    data += gctend
+
+    # Then the table, and the strings right after it
+    strings = bytearray()
+
+    def AddString(text: str):
+        offset = len(strings)
+        strings.extend(text.encode('utf-8') + b'\0')
+        return offset
+
+    stringstart = 12 + 16 * len(codes)
+    entries = bytearray()
+    for i, (name, author, comment, code, enabled) in enumerate(codes):
+        entry = 12 + 16 * i
+        nameoffs = stringstart + AddString('{} [{}]'.format(name, author)) - entry
+        commentoffs = stringstart + AddString(comment) - entry
+        entries += struct.pack('IIII', offsets[i], len(code) // 8, nameoffs, commentoffs)
+    gamenameoffs = stringstart + AddString(gamename)
+    gameidoffs = stringstart + AddString(gameid)
+    data += struct.pack('III', gamenameoffs, gameidoffs, len(codes)) + entries + strings
+
+    with open(filename, 'wb') as f:
+        f.write(data)
+
+
+def WriteDOL(filename: str, categories: list):
+    """
+    Writes a DOL with the GCT in its first text section, loaded at 0x80001800 like the codehandler would be.
+    """
+    gct = GCTData(categories)
+    gct += bytes(-len(gct) % 32)
+    header = bytearray(0x100)
+    struct.pack_into('>I', header, 0, 0x100)  # Section offset
+    struct.pack_into('>I', header, 0x48, 0x80001800)  # Section address
+    struct.pack_into('>I', header, 0x90, len(gct))  # Section size
+    struct.pack_into('>I', header, 0xE0, 0x80001800)  # Entrypoint
+    with open(filename, 'wb') as f:
+        f.write(header + gct)
+
+
+def WriteXML(filename: str, categories: list):
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('<codelist>\n\t<id>{}</id>\n'.format(gameid))
+        for category, codes in categories:
+            f.write('\t<category name={}>\n'.format(quoteattr(category)))
+            for name, author, comment, data, enabled in codes:
+                f.write('\t\t<code name={} author={} comment={}>\n\t\t\t<rawcode>\n{}\n\t\t\t</rawcode>\n\t\t</code>\n'
+                        .format(quoteattr(name), quoteattr(author), quoteattr(comment), escape(CodeText(data))))
+            f.write('\t</category>\n')
+        f.write('</codelist>\n')
+
+
+# Format -> (extension, writer)
+writers = {
+    'txt': ('txt', WriteTXT),
+    'ini': ('ini', WriteINI),
+    'gct': ('gct', WriteGCT),
+    'gct_extended': ('gct', WriteExtendedGCT),
+    'dol': ('dol', WriteDOL),
+    'xml': ('xml', WriteXML),
+}
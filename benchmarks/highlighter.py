@@ -0,0 +1,52 @@
+"""
+Checks that the code editor's highlighter survives codetypes whose line count is too big for Qt, which used to abort
+the whole program. Each code is typed in an editor in a separate process, exiting with an error if any of them
+crashes. Run from the repository's root with "python benchmarks/highlighter.py".
+"""
+import os
+import subprocess
+import sys
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Codetypes reading their line count from the value, with counts past what a block state can hold
+codes = [
+    'C2000000 80000000',
+    'C0000000 FFFFFFFF',
+    'C4000000 7FFFFFFF',
+    'F2000000 FFFFFFFF',
+    'F4000000 80000000\n04000000 00000001',
+    '04000000 00000001\nC2000000 FFFFFFFF\n60000000 00000000',
+]
+
+# Opens an editor with the given code and lets the highlighter go through it
+editor = """
+import sys
+sys.path.insert(0, {repo!r})
+from PyQt5 import QtWidgets
+import globalstuff
+globalstuff.app = QtWidgets.QApplication(sys.argv[:1])
+from codeeditor import CodeEditor
+editor = CodeEditor(None)
+editor.CodeContent.setPlainText({code!r})
+QtWidgets.QApplication.processEvents()
+"""
+
+
+def main():
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    crashed = []
+    for code in codes:
+        result = subprocess.run([sys.executable, '-c', editor.format(repo=repo, code=code)], capture_output=True,
+                                text=True, env=env, cwd=repo)
+        if result.returncode:
+            crashed.append(code.replace('\n', ' / '))
+
+    if crashed:
+        print('The highlighter crashed on: {}'.format(', '.join(crashed)))
+        sys.exit(1)
+    print('All codes highlighted')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Checks that the journal keeps recording a code editor's edits after a garbage collection pass, so the crash recovery
+reopens it with the unsaved text. Runs offscreen in a temporary folder, exiting with an error if anything was lost.
+Run from the repository's root with "python benchmarks/recovery.py".
+"""
+import gc
+import os
+import sys
+import tempfile
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo)
+
+from PyQt5 import QtGui, QtWidgets  # noqa: E402
+from PyQt5.QtCore import Qt  # noqa: E402
+
+import globalstuff  # noqa: E402
+
+
+def main():
+    with tempfile.TemporaryDirectory() as folder:
+        # Set up the program, with a title database so nothing gets downloaded
+        globalstuff.wiitdb = os.path.join(folder, 'wiitdb.txt')
+        with open(globalstuff.wiitdb, 'w') as f:
+            f.write('TITLES = https://www.gametdb.com (type: Wii language: EN)\n')
+        globalstuff.app = QtWidgets.QApplication(sys.argv[:1])
+        icon = QtGui.QPixmap(1, 1)
+        icon.fill(Qt.transparent)
+        globalstuff.empty = QtGui.QIcon(icon)
+        import journal
+        import main as program
+        from codeeditor import CodeEditor
+        globalstuff.mainWindow = program.MainWindow()
+        globalstuff.journal = journal.Journal(os.path.join(folder, 'journal.log'))
+
+        # Open an editor, let the garbage collector run, then edit every field
+        editor = globalstuff.mainWindow.CreateNewWindow(CodeEditor(None))
+        gc.collect()
+        expected = {'name': 'Name', 'author': 'Author', 'code': '04000000 00000001', 'comment': 'Comment'}
+        editor.CodeName.setText(expected['name'])
+        editor.CodeAuthor.setText(expected['author'])
+        editor.CodeContent.setPlainText(expected['code'])
+        editor.CodeComment.setPlainText(expected['comment'])
+
+        # Stop the writer so everything is on disk, then read the journal back
+        QtWidgets.QApplication.processEvents()
+        globalstuff.journal.queue.put(None)
+        globalstuff.journal.thread.join()
+        recovered = list(journal.Recover(globalstuff.journal.file).editors.values())[0]
+
+        # Clean up. The editor must not be dirty, or closing it would ask to save it.
+        editor.dirty = False
+        globalstuff.journal.Close()
+
+    lost = [field for field, value in expected.items() if recovered[field] != value]
+    if lost:
+        print('Edits lost after garbage collection: {}'.format(', '.join(lost)))
+        sys.exit(1)
+    print('All edits recorded')
+
+
+if __name__ == '__main__':
+    main()
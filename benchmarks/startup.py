@@ -0,0 +1,81 @@
+"""
+Measures how long the program takes to start, both importing main.py (using "-X importtime") and until the main window
+is up. Also checks that the modules which are only loaded when first used stay that way, exiting with an error if any
+of them is imported at startup. Run from the repository's root with "python benchmarks/startup.py [runs]".
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules which must not be imported until they're needed
+lazymodules = ('exporting', 'importing', 'parsers', 'database', 'lxml', 'chardet', 'urllib.request', 'pkg_resources',
+               'PyQt5.Qt')
+
+# Starts the program up to the first paint, then quits and prints the elapsed time
+startup = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {repo!r})
+import globalstuff
+globalstuff.wiitdb = {wiitdb!r}
+from PyQt5 import QtCore, QtWidgets
+import main
+globalstuff.app = QtWidgets.QApplication(sys.argv)
+globalstuff.mainWindow = main.MainWindow()
+QtCore.QTimer.singleShot(0, globalstuff.app.quit)
+globalstuff.app.exec_()
+print(time.perf_counter() - start)
+"""
+
+
+def Run(args: list):
+    """
+    Runs Python offscreen with the given arguments, returning its output and errors.
+    """
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    result = subprocess.run([sys.executable] + args, capture_output=True, text=True, env=env, cwd=repo, check=True)
+    return result.stdout, result.stderr
+
+
+def ImportTimes():
+    """
+    Imports main.py in a fresh interpreter. Returns a module -> (self, cumulative) microseconds dict.
+    """
+    times = {}
+    for line in Run(['-X', 'importtime', '-c', 'import main'])[1].splitlines():
+        if line.startswith('import time:') and '|' in line and 'self [us]' not in line:
+            own, cumulative, name = line[12:].split('|')
+            times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    # Check the imports
+    times = ImportTimes()
+    print('Importing main: {:.1f}ms'.format(times['main'][1] / 1000))
+    for name, (own, cumulative) in sorted(times.items(), key=lambda x: x[1][0], reverse=True)[:10]:
+        print('  {:<32} {:>8.1f}ms'.format(name, own / 1000))
+
+    # Start the program a few times, with a title database so nothing gets downloaded
+    with tempfile.TemporaryDirectory() as tmp:
+        wiitdb = os.path.join(tmp, 'wiitdb.txt')
+        with open(wiitdb, 'w') as f:
+            f.write('TITLES = https://www.gametdb.com (type: Wii language: EN)\n')
+        elapsed = sorted(float(Run(['-c', startup.format(repo=repo, wiitdb=wiitdb)])[0]) for _ in range(runs))
+    print('Startup: {:.1f}ms (best of {}), {:.1f}ms (median)'.format(elapsed[0] * 1000, runs,
+                                                                     elapsed[len(elapsed) // 2] * 1000))
+
+    # Fail if a lazy module was loaded
+    loaded = [name for name in lazymodules if name in times]
+    if loaded:
+        print('Imported at startup: {}'.format(', '.join(loaded)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""
+Times the importers, the exporters, the database browser and the codelist operations which go through every code, on
+generated codelists of increasing size. Runs offscreen, with a temporary title database so nothing is downloaded and
+nothing is written next to the program. The results are printed as JSON (or saved with "--output"), so they can be
+compared between commits. Run from the repository's root with "python benchmarks/suite.py [options]".
+Once a single run of an operation takes longer than the limit, the larger sizes of that operation are skipped.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo)
+
+from PyQt5 import QtCore, QtGui, QtWidgets  # noqa: E402
+from PyQt5.QtCore import Qt  # noqa: E402
+
+import globalstuff  # noqa: E402
+from generators import Codes, CodeText, writers  # noqa: E402
+
+# Codes which the lookup benchmark searches the database for
+lookups = 10
+
+
+def CloseAll():
+    """
+    Closes every window and makes sure they're gone, so they don't slow down the next run.
+    """
+    for window in globalstuff.mainWindow.mdi.subWindowList():
+        window.close()
+    QtCore.QCoreApplication.sendPostedEvents(None, QtCore.QEvent.DeferredDelete)
+    QtWidgets.QApplication.processEvents()
+
+
+def Timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def OpenList(file: str):
+    """
+    Imports the given TXT into a new codelist, without timing it.
+    """
+    from importing import ImportTXT
+    ImportTXT(file, None)
+    return globalstuff.mainWindow.mdi.subWindowList()[-1].widget()
+
+
+def ImportBenchmark(importer, file: str):
+    def Run():
+        elapsed = Timed(importer, file, None)
+        CloseAll()
+        return elapsed
+    return Run
+
+
+def DatabaseLoadBenchmark(file: str):
+    def Run():
+        from database import Database
+        start = time.perf_counter()
+        globalstuff.mainWindow.CreateNewWindow(Database(file))
+        elapsed = time.perf_counter() - start
+        CloseAll()
+        return elapsed
+    return Run
+
+
+def DatabaseSearchBenchmark(file: str):
+    def Run():
+        from database import Database
+        database = globalstuff.mainWindow.CreateNewWindow(Database(file))
+        elapsed = Timed(database.HandleSearch, 'code 12')
+        CloseAll()
+        return elapsed
+    return Run
+
+
+def CodeLookupBenchmark(file: str, categories: list):
+    """
+    Looks up the names of the last few codes in the database, so every lookup goes through the whole tree.
+    """
+    def Run():
+        from database import Database
+        from widgets import ModdedTreeWidgetItem
+        database = globalstuff.mainWindow.CreateNewWindow(Database(file))
+        items = []
+        for code in categories[-1][1][-lookups:]:
+            items.append(ModdedTreeWidgetItem('Unknown Code', False, True))
+            items[-1].setText(1, CodeText(code[3]))
+        start = time.perf_counter()
+        for item in items:
+            globalstuff.mainWindow.CodeLookup(item, None, database.gameID)
+        elapsed = time.perf_counter() - start
+        CloseAll()
+        return elapsed
+    return Run
+
+
+def SelectItemsBenchmark(file: str):
+    def Run():
+        from common import SelectItems
+        tree = OpenList(file).TreeWidget
+        tree.blockSignals(True)  # Otherwise the codelist would select the items by itself
+        tree.selectAll()
+        tree.blockSignals(False)
+        elapsed = Timed(SelectItems, tree)
+        CloseAll()
+        return elapsed
+    return Run
+
+
+def UpdateLinesBenchmark(file: str, cached: bool):
+    """
+    Counts the lines of a freshly imported list, either with every code compiled again or with the cached results.
+    """
+    def Run():
+        from common import InvalidateCode, WalkItems
+        from conflicts import ConflictTracker
+        codelist = OpenList(file)
+        if not cached:
+            tree = codelist.TreeWidget
+            blocked = tree.model().blockSignals(True)
+            for item in WalkItems(tree.invisibleRootItem()):
+                InvalidateCode(item)
+            tree.model().blockSignals(blocked)
+            codelist.conflicts = ConflictTracker()
+        elapsed = Timed(codelist.UpdateLines)
+        CloseAll()
+        return elapsed
+    return Run
+
+
+def ExportBenchmark(file: str, output: str, formats: tuple):
+    def Run():
+        from exporting import ExportFiles
+        codelist = OpenList(file)
+        filenames = {ext: '{}.{}'.format(output, ext) for ext in formats}
+        for filename in filenames.values():
+            if os.path.isfile(filename):
+                os.remove(filename)
+        elapsed = Timed(ExportFiles, filenames, codelist, True)
+        CloseAll()
+        return elapsed
+    return Run
+
+
+def Benchmarks(folder: str, size: int, seed: int):
+    """
+    Generates the files for the given size and returns a name -> benchmark dict. Each benchmark does one run and returns
+    its time.
+    """
+    import importing
+
+    # Write the files
+    categories = Codes(size, seed)
+    files = {}
+    for name, (ext, writer) in writers.items():
+        files[name] = os.path.join(folder, '{}_{}.{}'.format(name, size, ext))
+        writer(files[name], categories)
+    output = os.path.join(folder, 'export_{}'.format(size))
+
+    return {
+        'import.txt': ImportBenchmark(importing.ImportTXT, files['txt']),
+        'import.ini': ImportBenchmark(importing.ImportINI, files['ini']),
+        'import.gct': ImportBenchmark(importing.ImportGCT, files['gct']),
+        'import.gct_extended': ImportBenchmark(importing.ImportGCT, files['gct_extended']),
+        'import.dol': ImportBenchmark(importing.ImportDOL, files['dol']),
+        'database.load': DatabaseLoadBenchmark(files['xml']),
+        'database.search': DatabaseSearchBenchmark(files['xml']),
+        'codelookup': CodeLookupBenchmark(files['xml'], categories),
+        'selectitems': SelectItemsBenchmark(files['txt']),
+        'updatelines.compile': UpdateLinesBenchmark(files['txt'], False),
+        'updatelines.cached': UpdateLinesBenchmark(files['txt'], True),
+        'export.txt': ExportBenchmark(files['txt'], output, ('txt',)),
+        'export.ini': ExportBenchmark(files['txt'], output, ('ini',)),
+        'export.gct': ExportBenchmark(files['txt'], output, ('gct',)),
+        'export.all': ExportBenchmark(files['txt'], output, ('txt', 'ini', 'gct')),
+    }
+
+
+def Commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=repo,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the benchmarks and prints the results as JSON.')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma separated code counts')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark and size')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the generated codelists')
+    parser.add_argument('--limit', type=float, default=30,
+                        help='seconds a run can take before larger sizes are skipped')
+    parser.add_argument('--only', default='', help='comma separated benchmark name prefixes to run')
+    parser.add_argument('--output', help='file to write the results to, instead of printing them')
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+    only = tuple(filter(None, args.only.split(',')))
+
+    with tempfile.TemporaryDirectory() as folder:
+        # Set up the program. Titles come from an empty database, and ImportDOL's temporary file goes in the folder.
+        os.chdir(folder)
+        globalstuff.wiitdb = os.path.join(folder, 'wiitdb.txt')
+        with open(globalstuff.wiitdb, 'w') as f:
+            f.write('TITLES = https://www.gametdb.com (type: Wii language: EN)\n')
+        globalstuff.app = QtWidgets.QApplication(sys.argv[:1])
+        icon = QtGui.QPixmap(1, 1)
+        icon.fill(Qt.transparent)
+        globalstuff.empty = QtGui.QIcon(icon)
+        import main as program
+        globalstuff.mainWindow = program.MainWindow()
+
+        # Run the benchmarks
+        results = {}
+        slow = set()
+        for size in sizes:
+            for name, benchmark in Benchmarks(folder, size, args.seed).items():
+                if only and not name.startswith(only):
+                    continue
+                result = results.setdefault(name, {})
+                if name in slow:
+                    result[str(size)] = {'skipped': 'over the time limit at a smaller size'}
+                    continue
+                try:
+                    times = []
+                    for _ in range(args.repeat):
+                        times.append(benchmark())
+                        if times[-1] > args.limit:
+                            slow.add(name)
+                            break
+                except Exception as e:
+                    CloseAll()
+                    result[str(size)] = {'error': '{}: {}'.format(type(e).__name__, e)}
+                    continue
+                result[str(size)] = {'best': min(times), 'median': statistics.median(times), 'runs': len(times)}
+                print('{:<22} {:>7} {:>10.4f}s'.format(name, size, min(times)), file=sys.stderr)
+
+        # Leave the folder so it can be deleted
+        CloseAll()
+        os.chdir(repo)
+
+    # Output the results
+    data = json.dumps({
+        'commit': Commit(),
+        'python': platform.python_version(),
+        'qt': QtCore.QT_VERSION_STR,
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'results': results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(data + '\n')
+    else:
+        print(data)
+
+
+if __name__ == '__main__':
+    main()
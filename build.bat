@@ -1 +1 @@
-pyinstaller main.py --noconsole -i icon.ico --clean -F -n "Code Manager Reborn" --exclude-module PyQt5.QtBluetooth --exclude-module PyQt5.QtDBus --exclude-module PyQt5.QtDesigner --exclude-module PyQt5.QtLocation --exclude-module PyQt5.QtMultimediaWidgets --exclude-module PyQt5.QtNetworkAuth --exclude-module PyQt5.QtNfc --exclude-module PyQt5.QtPositioning --exclude-module PyQt5.QtQuick3D --exclude-module PyQt5.QtRemoteObjects --exclude-module PyQt5.QtWebChannel --exclude-module PyQt5.QtWebSockets --exclude-module PyQt5.QtWinExtras --exclude-module PyQt5.QtXmlPatterns --exclude-module PyQt5.QtHelp --exclude-module PyQt5.QtMultimedia --exclude-module PyQt5.QtNetwork --exclude-module PyQt5.QtOpenGL --exclude-module PyQt5.QtPrintSupport --exclude-module PyQt5.QtQml --exclude-module PyQt5.QtQuick --exclude-module PyQt5.QtQuickWidgets --exclude-module PyQt5.QtSensors --exclude-module PyQt5.QtSerialPort --exclude-module PyQt5.QtSql --exclude-module PyQt5.QtSvg --exclude-module PyQt5.QtTest --exclude-module PyQt5.QtXml
\ No newline at end of file
+pyinstaller main.py --noconsole -i icon.ico --clean -F -n "Code Manager Reborn" --exclude-module PyQt5.QtBluetooth --exclude-module PyQt5.QtDBus --exclude-module PyQt5.QtDesigner --exclude-module PyQt5.QtLocation --exclude-module PyQt5.QtMultimediaWidgets --exclude-module PyQt5.QtNetworkAuth --exclude-module PyQt5.QtNfc --exclude-module PyQt5.QtPositioning --exclude-module PyQt5.QtQuick3D --exclude-module PyQt5.QtRemoteObjects --exclude-module PyQt5.QtWebChannel --exclude-module PyQt5.QtWebSockets --exclude-module PyQt5.QtWinExtras --exclude-module PyQt5.QtXmlPatterns --exclude-module PyQt5.QtHelp --exclude-module PyQt5.QtMultimedia --exclude-module PyQt5.QtOpenGL --exclude-module PyQt5.QtPrintSupport --exclude-module PyQt5.QtQml --exclude-module PyQt5.QtQuick --exclude-module PyQt5.QtQuickWidgets --exclude-module PyQt5.QtSensors --exclude-module PyQt5.QtSerialPort --exclude-module PyQt5.QtSql --exclude-module PyQt5.QtSvg --exclude-module PyQt5.QtTest --exclude-module PyQt5.QtXml
\ No newline at end of file
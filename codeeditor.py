@@ -5,9 +5,62 @@ and open it with other windows, or add it to different lists.
 import re
 
 from PyQt5 import QtGui, QtWidgets
+from PyQt5.QtCore import Qt
 
 import globalstuff
-from common import AssembleCode
+import registry
+from codetypes import EntryLength
+from common import AssembleCode, InvalidateCode
+
+# A code line, once the spaces and asterisks are gone
+hexline = re.compile('[\dA-F]{16}', re.I)
+
+# Highest block state Qt can store. Codetypes taking more lines than this (from a huge count) are cut short, as there
+# can't be that many lines anyway.
+maxstate = 0x7FFFFFFF
+
+
+class CodeHighlighter(QtGui.QSyntaxHighlighter):
+    """
+    Validates the code line by line as it's typed. Invalid lines are underlined, codetypes are bold and the lines
+    belonging to the previous codetype are grayed out. Each line's state is the amount of those lines still to come, so
+    Qt only checks the edited lines again, plus the following ones if the amount changes.
+    """
+    def __init__(self, document: QtGui.QTextDocument):
+        super().__init__(document)
+
+        # Set the formats
+        self.invalid = QtGui.QTextCharFormat()
+        self.invalid.setUnderlineStyle(QtGui.QTextCharFormat.WaveUnderline)
+        self.invalid.setUnderlineColor(Qt.red)
+        self.codetype = QtGui.QTextCharFormat()
+        self.codetype.setFontWeight(QtGui.QFont.Bold)
+        self.payload = QtGui.QTextCharFormat()
+        self.payload.setForeground(Qt.gray)
+
+    def highlightBlock(self, text: str):
+        remaining = max(self.previousBlockState(), 0)
+        line = text.replace(' ', '').replace('*', '')
+
+        # Empty lines are ignored when saving, so they don't count
+        if not line:
+            self.setCurrentBlockState(remaining)
+
+        # Invalid line, but it's still a line
+        elif not hexline.fullmatch(line):
+            self.setFormat(0, len(text), self.invalid)
+            self.setCurrentBlockState(max(remaining - 1, 0))
+
+        # Line belonging to the previous codetype
+        elif remaining:
+            self.setFormat(0, len(text), self.payload)
+            self.setCurrentBlockState(remaining - 1)
+
+        # New codetype, make the first byte bold
+        else:
+            start = len(text) - len(text.lstrip(' *'))
+            self.setFormat(start, 2, self.codetype)
+            self.setCurrentBlockState(min(EntryLength(int(line[:8], 16), int(line[8:], 16)) - 1, maxstate))
 
 
 class CodeEditor(QtWidgets.QWidget):
@@ -37,14 +90,16 @@ class CodeEditor(QtWidgets.QWidget):
         self.CommentLabel = QtWidgets.QLabel('Comment:')
         self.CodeComment = QtWidgets.QPlainTextEdit(comment)
 
-        # Use Monospaced font for the code
+        # Use Monospaced font for the code and check it as it's typed
         self.CodeContent.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        self.Highlighter = CodeHighlighter(self.CodeContent.document())
 
-        # Connect
+        # Connect. The text boxes only report when they become modified, the rest is just to update the buttons.
         self.CodeName.textEdited.connect(self.SetDirty)
         self.CodeAuthor.textEdited.connect(self.SetDirty)
-        self.CodeContent.textChanged.connect(self.SetDirty)
-        self.CodeComment.textChanged.connect(self.SetDirty)
+        self.CodeContent.modificationChanged.connect(lambda modified: modified and self.SetDirty())
+        self.CodeComment.modificationChanged.connect(lambda modified: modified and self.SetDirty())
+        self.CodeContent.textChanged.connect(self.UpdateButtons)
 
         # Save button
         self.SaveButton = QtWidgets.QPushButton('Save Changes')
@@ -84,24 +139,29 @@ class CodeEditor(QtWidgets.QWidget):
 
     def SetDirty(self):
         """
-        Enables the save button if the code is not empty and the parent is set (otherwise we'd have nowhere to save to)
+        Marks the code as modified, so that it can be saved.
         """
         # Add some dirt
         self.dirty = True
+        self.UpdateButtons()
+
+        # Add asterisk to window title
+        if not self.windowTitle().startswith('*'):
+            self.setWindowTitle('*' + self.windowTitle())
 
-        # Set the buttons
-        if self.CodeContent.toPlainText() and self.CodeName.text():
+    def UpdateButtons(self):
+        """
+        Enables the save button if the code is modified, not empty and the parent is set (otherwise we'd have nowhere to
+        save to). Doesn't copy the code, so it's fine to run it at every keystroke.
+        """
+        if not self.CodeContent.document().isEmpty() and self.CodeName.text():
             if not self.fromdb:
-                self.SaveButton.setEnabled(bool(self.parentz))
+                self.SaveButton.setEnabled(self.dirty and bool(self.parentz))
             self.AddButton.setEnabled(True)
         else:
             self.SaveButton.setEnabled(False)
             self.AddButton.setEnabled(False)
 
-        # Add asterisk to window title
-        if not self.windowTitle().startswith('*'):
-            self.setWindowTitle('*' + self.windowTitle())
-
     def SaveCode(self):
         """
         Saves the code to the designated parent.
@@ -114,10 +174,11 @@ class CodeEditor(QtWidgets.QWidget):
         # Save the stuff
         self.parentz.setText(0, self.CodeName.text())
         self.parentz.setText(1, code)
+        InvalidateCode(self.parentz)
         self.parentz.setText(2, comment)
         self.parentz.setText(4, author)
 
-        # Update the fields
+        # Update the fields. This doesn't mark them as modified.
         self.CodeContent.setPlainText(code)
         self.CodeComment.setPlainText(comment)
 
@@ -130,6 +191,8 @@ class CodeEditor(QtWidgets.QWidget):
         # Clean dirt
         self.setWindowTitle(self.windowTitle().lstrip('*'))
         self.dirty = False
+        self.CodeContent.document().setModified(False)
+        self.CodeComment.document().setModified(False)
 
     def ParseCode(self):
         """
@@ -174,23 +237,19 @@ def HandleCodeOpen(item: QtWidgets.QTreeWidgetItem, fromdb: bool, willcreate=Tru
     Opens a tree's currently selected code in a CodeEditor window.
     """
     if item.text(1):
-        for window in globalstuff.mainWindow.mdi.subWindowList():  # Find if there's an existing CodeEditor with same parent and window title
-            if isinstance(window.widget(), CodeEditor) and window.widget().parentz == item:
-                willcreate = False
-                globalstuff.mainWindow.mdi.setActiveSubWindow(window)  # This code was already opened, so let's just set the focus on the existing window
-                break
+        editor = registry.FindEditor(item)  # Find if there's an existing CodeEditor with same parent
+        if editor:
+            willcreate = False
+            globalstuff.mainWindow.mdi.setActiveSubWindow(editor.parentWidget())  # This code was already opened, so let's just set the focus on the existing window
         if willcreate:  # If the code is not already open, go ahead and do it
             globalstuff.mainWindow.CreateNewWindow(CodeEditor(item, fromdb))
 
 
-def CleanParentz(item: QtWidgets.QTreeWidgetItem, wlist: list):
+def CleanParentz(item: QtWidgets.QTreeWidgetItem):
     """
     Unsets the parentz parameter for the removed tree item.
     """
-    for window in wlist:
-        if window.parentz == item:
-            window.parentz = None
-            break
+    registry.DetachEditor(item)
 
 
 def RenameWindows(item: QtWidgets.QTreeWidgetItem):
@@ -205,11 +264,10 @@ def RenameWindows(item: QtWidgets.QTreeWidgetItem):
         return  # Since there was no update, we don't need to run the below stuff
 
     # Do the rename
-    for w in globalstuff.mainWindow.mdi.subWindowList():
-        if isinstance(w.widget(), CodeEditor) and w.widget().parentz == item:
-            w.widget().CodeName.setText(item.text(0))
-            if item.text(4):
-                w.widget().setWindowTitle('Code Editor - {} [{}]'.format(item.text(0), item.text(4)))
-            else:
-                w.widget().setWindowTitle('Code Editor - {}'.format(item.text(0)))
-            return
+    w = registry.FindEditor(item)
+    if w:
+        w.CodeName.setText(item.text(0))
+        if item.text(4):
+            w.setWindowTitle('Code Editor - {} [{}]'.format(item.text(0), item.text(4)))
+        else:
+            w.setWindowTitle('Code Editor - {}'.format(item.text(0)))
@@ -2,15 +2,25 @@
 Codelists are different from databases, as they accept adding/removing, importing/exporting, reordering, dropping
 and more.
 """
-from PyQt5 import QtWidgets
-from PyQt5.Qt import Qt
+from PyQt5 import QtGui, QtWidgets, sip
+from PyQt5.QtCore import Qt
 
 import globalstuff
+import registry
 from codeeditor import CodeEditor, HandleCodeOpen, CleanParentz, RenameWindows
-from common import CountCheckedCodes, SelectItems, GameIDMismatch, CleanChildren
+from conflicts import ConflictTracker
+from common import CountCheckedCodes, SelectItems, GameIDMismatch, BulkUpdate, GetCompiled, InvalidateCode, \
+    ChildItems
 from titles import TitleLookup
 from widgets import ModdedTreeWidget, ModdedTreeWidgetItem
 
+# Spare column holding the items' position while sorting, past the ones holding the code's data
+rankcolumn = 5
+
+
+def NameKey(item: QtWidgets.QTreeWidgetItem):
+    return item.text(0).casefold()
+
 
 class CodeList(QtWidgets.QWidget):
     def __init__(self, wintitle: str = None):
@@ -21,7 +31,9 @@ class CodeList(QtWidgets.QWidget):
         self.TreeWidget.itemSelectionChanged.connect(self.HandleSelection)
         self.TreeWidget.itemDoubleClicked.connect(lambda x: HandleCodeOpen(x, False))
         self.TreeWidget.itemChanged.connect(RenameWindows)
+        self.TreeWidget.itemChanged.connect(self.HandleEdit)
         self.TreeWidget.itemClicked.connect(self.HandleClicking)
+        self.TreeWidget.tooltips = self.CodeToolTip
 
         # Merge button, up here for widget height purposes
         self.mergeButton = QtWidgets.QPushButton('Merge Selected')
@@ -44,9 +56,12 @@ class CodeList(QtWidgets.QWidget):
 
         # Sort button+menu
         sortMenu = QtWidgets.QMenu()
-        defact = sortMenu.addAction('Alphabetical', lambda: self.TreeWidget.sortItems(0, Qt.AscendingOrder))
-        sortMenu.addAction('Alphabetical (Reverse)', lambda: self.TreeWidget.sortItems(0, Qt.DescendingOrder))
-        sortMenu.addAction('Size', self.SortListSize)
+        defact = sortMenu.addAction('Alphabetical', self.SortList)
+        sortMenu.addAction('Alphabetical (Reverse)', lambda: self.SortList(reverse=True))
+        sortMenu.addAction('Author', lambda: self.SortList(lambda x: (x.text(4).casefold(), NameKey(x))))
+        sortMenu.addAction('Size', lambda: self.SortList(lambda x: len(GetCompiled(x)[0] or b''), True))
+        sortMenu.addAction('Lines', lambda: self.SortList(lambda x: GetCompiled(x)[3], True))
+        sortMenu.addAction('Cost', lambda: self.SortList(lambda x: (GetCompiled(x)[5] or (-1,))[0], True))
         self.sortButton = QtWidgets.QToolButton()
         self.sortButton.setDefaultAction(defact)  # Do this if you click the Sort button instead of the arrow
         self.sortButton.setMenu(sortMenu)
@@ -88,8 +103,13 @@ class CodeList(QtWidgets.QWidget):
         hlyt.addWidget(self.gidInput)
         hlyt.addWidget(self.savegid)
 
+        # Keep track of the enabled codes writing to the same addresses. The items are kept here too, so their ids
+        # can't be reused while they're tracked.
+        self.conflicts = ConflictTracker()
+        self.trackeditems = {}
+
         # Line counter
-        self.lineLabel = QtWidgets.QLabel('Lines: 2')
+        self.lineLabel = QtWidgets.QLabel('Lines: 2 - Size: 16 bytes - Cost: 2/{}'.format(globalstuff.costbudget))
         self.lineLabel.setAlignment(Qt.AlignRight)
 
         # Make a layout and set it
@@ -105,9 +125,9 @@ class CodeList(QtWidgets.QWidget):
         lyt.addWidget(self.exportButton, 5, 1)
         self.setLayout(lyt)
 
-    def AddFromDatabase(self, enabledlist: list, gameid: str):
+    def AddFromDatabase(self, data: bytes, gameid: str):
         """
-        Takes a list of the enabled items and clones it in the codelist.
+        Adds the codes copied from a database (see CopyItems) to the codelist.
         """
         # Check for game id mismatch and update if necessary
         if gameid != self.gameID:
@@ -116,11 +136,7 @@ class CodeList(QtWidgets.QWidget):
             self.SetGameID(gameid)
 
         # Add the codes
-        for item in enabledlist:
-            clone = item.clone()
-            clone.setFlags(clone.flags() | Qt.ItemIsEditable)  # Enable renaming
-            self.TreeWidget.addTopLevelItem(clone)
-            CleanChildren(clone)
+        self.TreeWidget.PasteItems(data)
 
         # Update the selection
         self.HandleSelection()
@@ -142,6 +158,13 @@ class CodeList(QtWidgets.QWidget):
         self.EnableButtons()
         self.UpdateLines()
 
+    def HandleEdit(self, item: QtWidgets.QTreeWidgetItem, column: int):
+        """
+        Clears the compiled code if the item's code was changed
+        """
+        if column == 1:
+            InvalidateCode(item)
+
     def EnableButtons(self, canexport=False, canremove=False, canmerge=False):
         """
         Enables the Remove, Export and Merge button if the respective conditions are met
@@ -166,24 +189,43 @@ class CodeList(QtWidgets.QWidget):
         self.TreeWidget.addTopLevelItem(newitem)
         self.TreeWidget.editItem(newitem, 0)  # Let the user rename it immediately
 
-    def SortListSize(self):
+    def SortList(self, key=None, reverse=False):
         """
-        Temporarily removes all items without children, then orders the remaining items alphabetically. The removed
-        items will then be ordered by code size and re-added to the tree.
+        Sorts every level of the list, categories first. Codes are sorted by the given key (biggest first if reversed)
+        and categories by name, or both by name if there's no key. Keys are only computed once per item, then the tree
+        is reordered in one go.
         """
-        # Remove all codes
-        backuplist = []
-        for item in filter(lambda x: bool(x.text(1)), self.TreeWidget.findItems('', Qt.MatchContains)):
-            backuplist.append(self.TreeWidget.takeTopLevelItem(self.TreeWidget.indexOfTopLevelItem(item)))
-
-        # Sort the categories alphabetically
-        self.TreeWidget.sortItems(0, Qt.AscendingOrder)
-
-        # Sort the backup list by code size (bigger codes first)
-        backuplist.sort(key=lambda x: len(x.text(1)), reverse=True)
-
-        # Reinsert the items
-        self.TreeWidget.insertTopLevelItems(self.TreeWidget.topLevelItemCount(), backuplist)
+        with BulkUpdate(self.TreeWidget):
+            # Rank the children of each item. Don't let the view know, as the ranks are only temporary.
+            model = self.TreeWidget.model()
+            blocked = model.blockSignals(True)
+            ranked = []
+            stack = [self.TreeWidget.invisibleRootItem()]
+            while stack:
+                categories, codes = [], []
+                for child in ChildItems(stack.pop()):
+                    if child.text(1):
+                        codes.append(child)
+                    else:
+                        categories.append(child)
+                        stack.append(child)
+                categories.sort(key=NameKey, reverse=reverse and key is None)
+                codes.sort(key=key or NameKey, reverse=reverse)
+                for rank, child in enumerate(categories + codes):
+                    child.setData(rankcolumn, Qt.DisplayRole, rank)
+                ranked += categories + codes
+            model.blockSignals(blocked)
+
+            # Sort by the ranks. The tree only sorts by its visible columns, so the rank column is shown meanwhile.
+            self.TreeWidget.setColumnCount(rankcolumn + 1)
+            self.TreeWidget.sortItems(rankcolumn, Qt.AscendingOrder)
+            self.TreeWidget.setColumnCount(1)
+
+            # Remove the ranks
+            blocked = model.blockSignals(True)
+            for item in ranked:
+                item.setData(rankcolumn, Qt.DisplayRole, None)
+            model.blockSignals(blocked)
 
     def HandleMerge(self, mergedlist: list):
         """
@@ -191,50 +233,56 @@ class CodeList(QtWidgets.QWidget):
         """
         # Initialize vars
         destination = None
-        wlist = [w.widget() for w in globalstuff.mainWindow.mdi.subWindowList() if isinstance(w.widget(), CodeEditor)]
 
         # Begin working
-        for item in filter(lambda x: bool(x.text(1)), mergedlist):
-
-            # We have a destination
-            if destination:
-                # Merge the codes
-                destination.setText(1, '\n'.join([destination.text(1), item.text(1)]))
-
-                # Kill any reference to the item
-                CleanParentz(item, wlist)
-                if item.parent():
-                    item.parent().takeChild(item.parent().indexOfChild(item))
+        with BulkUpdate(self.TreeWidget):
+            for item in filter(lambda x: bool(x.text(1)), mergedlist):
+
+                # We have a destination
+                if destination:
+                    # Merge the codes
+                    destination.setText(1, '\n'.join([destination.text(1), item.text(1)]))
+                    InvalidateCode(destination)
+
+                    # Kill any reference to the item
+                    CleanParentz(item)
+                    if item.parent():
+                        item.parent().takeChild(item.parent().indexOfChild(item))
+                    else:
+                        self.TreeWidget.takeTopLevelItem(self.TreeWidget.indexOfTopLevelItem(item))
+
+                # It's the first code in the list, set it as destination
                 else:
-                    self.TreeWidget.takeTopLevelItem(self.TreeWidget.indexOfTopLevelItem(item))
+                    destination = item
+                    destination.setText(2, '')  # Clear the comment, as it no longer applies
 
-            # It's the first code in the list, set it as destination
-            else:
-                destination = item
-                destination.setText(2, '')  # Clear the comment, as it no longer applies
+        # Update the selection, since the signal was blocked during the merge
+        self.HandleSelection()
 
-        # Now find all instances of CodeEditor that have the destination code open, and update their code widget
-        for window in wlist:
-            if window.parentz == destination:
-                window.setPlainText(destination.text(1))
-                return
+        # Now find the CodeEditor that has the destination code open, and update its code widget
+        window = registry.FindEditor(destination)
+        if window:
+            window.CodeContent.setPlainText(destination.text(1))
 
     def HandleRemove(self):
         """
         Handles item removal. Not much to say here :P
         """
-        wlist = [w.widget() for w in globalstuff.mainWindow.mdi.subWindowList() if isinstance(w.widget(), CodeEditor)]
-        for item in filter(lambda x: x.checkState(0) == Qt.Checked, CountCheckedCodes(self.TreeWidget, True)):
+        with BulkUpdate(self.TreeWidget):
+            for item in filter(lambda x: x.checkState(0) == Qt.Checked, CountCheckedCodes(self.TreeWidget, True)):
 
-            # Remove the item
-            if item.parent():
-                item.parent().takeChild(item.parent().indexOfChild(item))
-            else:
-                self.TreeWidget.takeTopLevelItem(self.TreeWidget.indexOfTopLevelItem(item))
+                # Remove the item
+                if item.parent():
+                    item.parent().takeChild(item.parent().indexOfChild(item))
+                else:
+                    self.TreeWidget.takeTopLevelItem(self.TreeWidget.indexOfTopLevelItem(item))
 
-            # Set all code editor widgets that had this item as parent to None
-            if item.text(1):
-                CleanParentz(item, wlist)
+                # Set all code editor widgets that had this item as parent to None
+                if item.text(1):
+                    CleanParentz(item)
+
+        # Update the selection, since the signal was blocked during the removal
+        self.HandleSelection()
 
     def UpdateButton(self):
         """
@@ -242,23 +290,100 @@ class CodeList(QtWidgets.QWidget):
         """
         self.savegid.setEnabled(len(self.gidInput.text()) > 3)
 
-    def SetGameID(self, gameid: str):
+    def SetGameID(self, gameid: str, gamename: str = None):
         """
-        Sets the given game id in the variable, game id text field and window title. Also looks up the game name.
+        Sets the given game id in the variable, game id text field and window title. Also looks up the game name, unless
+        it's given.
         """
         if 4 <= len(gameid) <= 6:
             self.gameID = gameid
-            self.gameName = TitleLookup(gameid)
+            self.gameName = gamename if gamename else TitleLookup(gameid)
             self.gidInput.setText(gameid)
         self.savegid.setEnabled(False)
         self.setWindowTitle('Codelist - {} [{}]'.format(self.gameName, gameid if gameid else self.gameID))
-        globalstuff.mainWindow.updateboxes()
+        registry.RenameList(self)
 
     def UpdateLines(self):
         """
-        Updates the number of total code lines in the list
+        Updates the number of total code lines in the list, the size of the resulting GCT and the estimated codehandler
+        cost against the budget. Also updates the conflicts between the enabled codes. Each code is only compiled and
+        estimated again if it was edited, so this just adds up the cached values.
         """
         lines = 2  # One for the magic and one for the F0 terminator
+        size = 16  # Same as above, but only for valid codes as the others aren't exported
+        cost = 2  # Reading the magic and the terminator
+        items = {}
+        writes = {}
         for item in filter(lambda x: bool(x.text(1)), CountCheckedCodes(self.TreeWidget, True)):
-            lines += item.text(1).count('\n') + 1  # +1 is because the first line doesn't have an "\n" character
-        self.lineLabel.setText('Lines: ' + str(lines))
+            code, currline, char, codelines, info, codecost = GetCompiled(item)
+            lines += codelines
+            if code is not None:
+                size += len(code)
+                cost += codecost[0]
+                if info.writes and not info.missing:
+                    items[id(item)] = item
+                    writes[id(item)] = info.writes
+
+        # Only the codes that were enabled, disabled or edited since the last time are checked
+        changed = self.conflicts.Sync(writes)
+        if changed:
+            self.FlagConflicts(changed, items)
+        self.trackeditems = items
+
+        # Update the label, and make it red if the codes are too heavy
+        text = 'Lines: {} - Size: {} bytes - Cost: {}/{}'.format(lines, size, cost, globalstuff.costbudget)
+        if self.conflicts.conflicts:
+            text += ' - Conflicts: {}'.format(len(self.conflicts.conflicts))
+        self.lineLabel.setText(text)
+        self.lineLabel.setStyleSheet('color: red' if cost > globalstuff.costbudget else '')
+
+    def FlagConflicts(self, keys: set, items: dict):
+        """
+        Marks the given codes with a warning icon if they write to the same addresses as other enabled codes. Otherwise,
+        the mark is removed. The other codes are listed in the tooltip.
+        """
+        with BulkUpdate(self.TreeWidget):
+            for key in keys:
+                item = items.get(key) or self.trackeditems.get(key)
+                if sip.isdeleted(item) or item.treeWidget() is not self.TreeWidget:
+                    continue  # The item was removed from the list, so there's nothing to update
+                if self.conflicts.conflicts.get(key):
+                    item.setIcon(0, self.style().standardIcon(QtWidgets.QStyle.SP_MessageBoxWarning))
+                else:
+                    item.setIcon(0, QtGui.QIcon())
+
+    def CodeToolTip(self, item: QtWidgets.QTreeWidgetItem):
+        """
+        Returns the code's estimated cost and share of the budget, plus the enabled codes writing to the same addresses
+        as it. Built when the tooltip is shown, so it never goes out of date.
+        """
+        if not item.text(1):
+            return ''
+        estimate = GetCompiled(item)[5]
+        if estimate is None:
+            return 'Invalid code'
+
+        # Add the cost
+        cost, hooks, repeats = estimate
+        text = ['Cost: {} ({}% of the budget)'.format(cost, cost * 100 // globalstuff.costbudget)]
+        if hooks:
+            text.append('Hooks: {}'.format(hooks))
+        if repeats:
+            text.append('Repeats: {}'.format(repeats))
+
+        # Add the conflicts
+        others = self.conflicts.conflicts.get(id(item))
+        if others and self.trackeditems.get(id(item)) is item:
+            text.append('Writes to the same addresses as:')
+            text.extend(sorted(self.trackeditems[other].text(0) for other in others))
+        return '\n'.join(text)
+
+    def ConflictingCodes(self):
+        """
+        Returns the names of the enabled codes writing to the same addresses, in pairs.
+        """
+        self.UpdateLines()
+        pairs = set()
+        for key, others in self.conflicts.conflicts.items():
+            pairs.update((min(key, other), max(key, other)) for other in others)
+        return sorted((self.trackeditems[a].text(0), self.trackeditems[b].text(0)) for a, b in pairs)
@@ -0,0 +1,307 @@
+"""
+This file knows how Gecko codes are made. It decodes codes line by line according to their codetypes, so that they can
+be split, validated and checked for the memory they write to.
+"""
+import struct
+
+# Codetype flags
+WRITE = 1  # Writes to memory. If the address can be resolved, the written range is reported.
+UNKNOWNWRITE = 2  # Writes to memory, but where is only known at runtime
+IF = 4  # Opens a conditional block
+ENDIF = 8  # Closes one or more conditional blocks
+TERMINATOR = 16  # Closes every conditional block and resets the base address and pointer
+SETBASE = 32  # Changes the base address or pointer
+FLOW = 64  # Jumps around in the code list
+END = 128  # End of the code list
+UNKNOWN = 256  # Not a known codetype
+
+# Default base address and pointer, also restored by most terminators
+defaultbase = 0x80000000
+
+
+def StringLines(w0: int, w1: int):
+    """
+    Lines taken by a code whose length is given in bytes by the second word, plus the first line.
+    """
+    return (w1 + 7) // 8 + 1
+
+
+def ASMLines(w0: int, w1: int):
+    """
+    Lines taken by a code whose length is given in lines by the second word, plus the first line.
+    """
+    return w1 + 1
+
+
+def ByteLines(w0: int, w1: int):
+    """
+    Lines taken by a code whose length is given in lines by the last byte of the second word, plus the first line.
+    """
+    return (w1 & 0xFF) + 1
+
+
+def SearchLines(w0: int, w1: int):
+    """
+    Lines taken by a search code, whose length is given in lines by the last byte of the first word, plus the first
+    line.
+    """
+    return (w0 & 0xFF) + 1
+
+
+def SerialSize(w0: int, w1: int, extra: tuple):
+    """
+    Bytes covered by a serial write. The second line has the value size, the amount of extra writes and the address
+    increment.
+    """
+    if not extra:
+        return 0
+    valuesize = 1 << min(extra[0] >> 28, 2)
+    return ((extra[0] >> 16) & 0xFFF) * (extra[0] & 0xFFFF) + valuesize
+
+
+# The codetypes. The key is the first byte of the code, without the pointer and address bits (see Normalize). Each
+# entry has a name, the amount of lines (or a function returning it from the first line), flags and, for writes to
+# resolvable addresses, a function returning the amount of bytes written from the first line and the one after it.
+codetypes = {
+    # RAM writes
+    0x00: ('8-bit write', 1, WRITE, lambda w0, w1, extra: (w1 >> 16) + 1),
+    0x02: ('16-bit write', 1, WRITE, lambda w0, w1, extra: ((w1 >> 16) + 1) * 2),
+    0x04: ('32-bit write', 1, WRITE, lambda w0, w1, extra: 4),
+    0x06: ('String write', StringLines, WRITE, lambda w0, w1, extra: w1),
+    0x08: ('Serial write', 2, WRITE, SerialSize),
+
+    # Ifs
+    0x20: ('32-bit if equal', 1, IF, None),
+    0x22: ('32-bit if not equal', 1, IF, None),
+    0x24: ('32-bit if greater', 1, IF, None),
+    0x26: ('32-bit if lower', 1, IF, None),
+    0x28: ('16-bit if equal', 1, IF, None),
+    0x2A: ('16-bit if not equal', 1, IF, None),
+    0x2C: ('16-bit if greater', 1, IF, None),
+    0x2E: ('16-bit if lower', 1, IF, None),
+
+    # Base address and pointer
+    0x40: ('Load base address', 1, SETBASE, None),
+    0x42: ('Set base address', 1, SETBASE, None),
+    0x44: ('Store base address', 1, UNKNOWNWRITE, None),
+    0x46: ('Set base address to code location', 1, SETBASE, None),
+    0x48: ('Load pointer', 1, SETBASE, None),
+    0x4A: ('Set pointer', 1, SETBASE, None),
+    0x4C: ('Store pointer', 1, UNKNOWNWRITE, None),
+    0x4E: ('Set pointer to code location', 1, SETBASE, None),
+
+    # Flow control
+    0x60: ('Set repeat', 1, FLOW, None),
+    0x62: ('Execute repeat', 1, FLOW, None),
+    0x64: ('Return', 1, FLOW, None),
+    0x66: ('Goto', 1, FLOW, None),
+    0x68: ('Gosub', 1, FLOW, None),
+
+    # Gecko registers
+    0x80: ('Set gecko register', 1, 0, None),
+    0x82: ('Load gecko register', 1, 0, None),
+    0x84: ('Store gecko register', 1, UNKNOWNWRITE, None),
+    0x86: ('Gecko register operation', 1, 0, None),
+    0x88: ('Gecko register operation', 1, 0, None),
+    0x8A: ('Memory copy', 1, UNKNOWNWRITE, None),
+    0x8C: ('Memory copy', 1, UNKNOWNWRITE, None),
+
+    # Gecko register and counter ifs
+    0xA0: ('16-bit if equal (register)', 1, IF, None),
+    0xA2: ('16-bit if not equal (register)', 1, IF, None),
+    0xA4: ('16-bit if greater (register)', 1, IF, None),
+    0xA6: ('16-bit if lower (register)', 1, IF, None),
+    0xA8: ('16-bit if equal (counter)', 1, IF, None),
+    0xAA: ('16-bit if not equal (counter)', 1, IF, None),
+    0xAC: ('16-bit if greater (counter)', 1, IF, None),
+    0xAE: ('16-bit if lower (counter)', 1, IF, None),
+
+    # Assembly
+    0xC0: ('Execute ASM', ASMLines, 0, None),
+    0xC2: ('Insert ASM', ASMLines, WRITE, lambda w0, w1, extra: 4),
+    0xC4: ('Insert ASM', ASMLines, WRITE, lambda w0, w1, extra: 4),
+    0xC6: ('Create branch', 1, WRITE, lambda w0, w1, extra: 4),
+    0xCC: ('On/Off switch', 1, 0, None),
+    0xCE: ('Address range check', 1, IF, None),
+
+    # Miscellaneous
+    0xE0: ('Full terminator', 1, TERMINATOR, None),
+    0xE2: ('Endif', 1, ENDIF, None),
+    0xF0: ('End of code list', 1, END, None),
+    0xF2: ('16-bit XOR checksum', ByteLines, 0, None),
+    0xF4: ('16-bit XOR checksum', ByteLines, 0, None),
+    0xF6: ('Search', SearchLines, IF, None),
+}
+
+# What we get for anything else
+unknowntype = ('Unknown', 1, UNKNOWN, None)
+
+
+class CodeInfo:
+    """
+    What the decoder found out about a code. Lines are counted from the beginning of the decoded data. Writes are
+    (start, end) address pairs.
+    """
+    __slots__ = ('start', 'length', 'entries', 'writes', 'unknownwrites', 'depth', 'missing', 'terminated', 'flags')
+
+    def __init__(self, start: int):
+        self.start = start
+        self.length = 0
+        self.entries = []  # (line, codetype) pairs, one for each codetype in the code
+        self.writes = []
+        self.unknownwrites = False  # Whether the code writes to addresses which can't be resolved
+        self.depth = 0  # Conditional blocks left open at the end
+        self.missing = 0  # Lines missing at the end, if the last codetype is truncated
+        self.terminated = False  # Whether the code ends with a full terminator
+        self.flags = 0  # Every codetype's flags combined
+
+
+def Normalize(codetype: int):
+    """
+    Removes the pointer (0x10) and address (0x01) bits from the given codetype, so it can be looked up in the table.
+    Codetypes from E0 onwards don't have a pointer bit.
+    """
+    return codetype & 0xFE if codetype >= 0xE0 else codetype & 0xEE
+
+
+def GetCodetype(w0: int):
+    """
+    Returns the codetype table entry for the line starting with the given word.
+    """
+    return codetypes.get(Normalize(w0 >> 24), unknowntype)
+
+
+def EntryLength(w0: int, w1: int):
+    """
+    Returns the amount of lines taken by the codetype starting with the given line, including the line itself.
+    """
+    length = GetCodetype(w0)[1]
+    return length if isinstance(length, int) else length(w0, w1)
+
+
+def Decode(data: bytes, boundaries: list = None):
+    """
+    Decodes the given binary codes in one go. If boundaries (the line each code starts at, in ascending order) is not
+    given, the data is split according to the codetypes: a code ends after the first codetype that doesn't leave a
+    conditional block open or a base address change behind, or after the next full terminator. Returns a CodeInfo for
+    each code.
+    """
+    words = list(struct.iter_unpack('>II', data[:len(data) & ~7]))
+    if boundaries is None:
+        return DecodeRange(words, 0, len(words), True)
+    ends = boundaries[1:] + [len(words)]
+    return [DecodeRange(words, start, end, False)[0] for start, end in zip(boundaries, ends)]
+
+
+def DecodeRange(words: list, start: int, end: int, split: bool):
+    """
+    Decodes the given range of (first word, second word) lines, either as a single code or splitting it into codes.
+    """
+    # Initialize vars
+    results = []
+    info = None
+    base = pointer = changed = None
+    i = start
+
+    while i < end:
+
+        # Begin a new code if the previous one is over. Every code starts with the default base address and pointer.
+        if info is None:
+            info = CodeInfo(i)
+            results.append(info)
+            base = pointer = defaultbase
+            changed = False
+
+        # Look up the codetype
+        w0, w1 = words[i]
+        codetype = w0 >> 24
+        name, length, flags, size = codetypes.get(Normalize(codetype), unknowntype)
+        if not isinstance(length, int):
+            length = length(w0, w1)
+        info.entries.append((i, codetype))
+        info.flags |= flags
+
+        # Check if the codetype fits in the code
+        if i + length > end:
+            info.missing = i + length - end
+            length = end - i
+
+        # Calculate the written range. Codes using the pointer are never resolved.
+        if flags & WRITE:
+            if base is None or codetype & 0x10:
+                info.unknownwrites = True
+            else:
+                address = base + (w0 & 0x1FFFFFF)
+                info.writes.append((address, address + size(w0, w1, words[i + 1] if length > 1 else None)))
+        elif flags & UNKNOWNWRITE:
+            info.unknownwrites = True
+
+        # Update the conditional blocks. Ifs with the lowest address bit set apply an endif first.
+        if flags & IF:
+            if w0 & 1 and codetype < 0xC0 and info.depth:
+                info.depth -= 1
+            info.depth += 1
+        elif flags & ENDIF:
+            info.depth = max(0, info.depth - (w0 & 0xFF))
+
+        # Update the base address and pointer. Only plain sets are followed, the rest can only be known at runtime.
+        elif flags & SETBASE:
+            changed = True
+            if w0 == 0x42000000:
+                base = w1
+            elif w0 == 0x4A000000:
+                pointer = w1
+            elif Normalize(codetype) < 0x48:
+                base = None
+            else:
+                pointer = None
+
+        # Terminators can also set the base address and pointer, with the upper halves of the second word
+        if flags & (TERMINATOR | ENDIF):
+            if w1 & 0xFFFF0000:
+                base = w1 & 0xFFFF0000
+            if w1 & 0xFFFF:
+                pointer = (w1 & 0xFFFF) << 16
+        info.terminated = bool(flags & TERMINATOR)
+        if info.terminated:
+            info.depth = 0
+            changed = False
+
+        # Move on
+        i += length
+        info.length = i - info.start
+
+        # When splitting, the code is over after a terminator or once it has no open blocks and base changes left
+        if split and (info.terminated or not (info.depth or changed)):
+            info = None
+
+    # A single code is returned even if empty
+    if not split and not results:
+        results.append(CodeInfo(start))
+    return results
+
+
+def DecodeCode(data: bytes):
+    """
+    Decodes a single binary code.
+    """
+    return Decode(data, [0])[0] if data else CodeInfo(0)
+
+
+def DecodeCodes(codes: list):
+    """
+    Decodes multiple binary codes in one batch.
+    """
+    boundaries = []
+    line = 0
+    for code in codes:
+        boundaries.append(line)
+        line += len(code) // 8
+    return Decode(b''.join(codes), boundaries)
+
+
+def SplitCodes(data: bytes):
+    """
+    Splits a GCT's contents (without the magic and the terminator) into codes. Returns the binary codes.
+    """
+    return [data[info.start * 8:(info.start + info.length) * 8] for info in Decode(data)]
@@ -1,10 +1,22 @@
 """
 This file contains functions that are used by multiple windows to prevent duplication.
 """
-from PyQt5.Qt import Qt
+import re
+from contextlib import contextmanager
+
+from PyQt5.QtCore import Qt
 from PyQt5 import QtWidgets
 
 import globalstuff
+import registry
+from codetypes import DecodeCode
+from estimator import EstimateCost
+from profiler import Profiled, TreeCount
+
+# A code made only of valid lines, a single valid line and any character which can't be part of a line. Ignoring case.
+coderule = re.compile('(?:[\dA-F]{8} [\dA-F]{8}\n)*[\dA-F]{8} [\dA-F]{8}', re.I)
+linerule = re.compile('[\dA-F]{8} [\dA-F]{8}', re.I)
+charrule = re.compile('[^\dA-F ]', re.I)
 
 
 def GameIDMismatch():
@@ -14,6 +26,37 @@ def GameIDMismatch():
     return msgbox
 
 
+@contextmanager
+def BulkUpdate(source: QtWidgets.QTreeWidget):
+    """
+    Blocks the tree's signals and repaints while doing mass operations on it, then reconciles the opened code editors
+    with a single pass at the end. Nested blocks are merged into the outermost one.
+    """
+    # The tree is already being updated, let the outer block do the cleanup
+    if source.blockSignals(True):
+        yield
+        return
+
+    # Begin the update
+    source.setUpdatesEnabled(False)
+    try:
+        yield
+    finally:
+        source.setUpdatesEnabled(True)
+        source.blockSignals(False)
+        ReconcileEditors(source)
+
+
+def ReconcileEditors(source: QtWidgets.QTreeWidget):
+    """
+    Does what RenameWindows would have done for every item changed while the tree's signals were blocked
+    """
+    for w in registry.TreeEditors(source):
+        if w.CodeName.text() != w.parentz.text(0):
+            w.CodeName.setText(w.parentz.text(0))
+            w.ParseAuthor(w.parentz.text(4))
+
+
 def CheckChildren(item: QtWidgets.QTreeWidgetItem):
     """
     Recursively enables the check on an item's children
@@ -34,33 +77,87 @@ def CountCheckedCodes(source: QtWidgets.QTreeWidget, userecursive: bool):
     return filter(lambda x: bool(x.checkState(0)), source.findItems('', Qt.MatchContains | Qt.MatchFlag(64 >> 6 * int(not userecursive))))
 
 
-def SelectItems(source: QtWidgets.QTreeWidget):
+def ChildItems(item: QtWidgets.QTreeWidgetItem):
     """
-    Marks items as checked if they are selected, otherwise unchecks them
+    Lazily iterates over an item's children. Use the tree's invisibleRootItem to get the top level items.
     """
-    bucketlist = source.findItems('', Qt.MatchContains | Qt.MatchRecursive)
-    for item in bucketlist:
-        if item in source.selectedItems():
-            item.setCheckState(0, Qt.Checked)
+    return (item.child(i) for i in range(item.childCount()))
+
+
+def WalkItems(item: QtWidgets.QTreeWidgetItem):
+    """
+    Lazily iterates over all the items below the given one, in the same order as a recursive findItems
+    """
+    stack = [ChildItems(item)]
+    while stack:
+        child = next(stack[-1], None)
+        if child is None:
+            stack.pop()
         else:
-            item.setCheckState(0, Qt.Unchecked)
+            yield child
+            if child.childCount():
+                stack.append(ChildItems(child))
+
+
+class CodeNode:
+    """
+    A plain copy of a tree item, which mimics the parts of the QTreeWidgetItem interface needed to read codes. Unlike
+    tree items, it can be safely used outside of the GUI thread.
+    """
+    __slots__ = ('texts', 'checked', 'compiled', 'children')
+
+    def __init__(self, texts: tuple, checked: int, compiled: tuple = None, children: list = None):
+        self.texts = texts
+        self.checked = checked
+        self.compiled = compiled
+        self.children = children if children else []
+
+    def text(self, column: int):
+        return self.texts[column]
+
+    def checkState(self, column: int):
+        return self.checked
+
+    def childCount(self):
+        return len(self.children)
+
+    def child(self, index: int):
+        return self.children[index]
 
-    # This for categories which aren't expanded
-    for item in filter(lambda x: x in source.selectedItems() and x.childCount() and not x.isExpanded(), bucketlist):
-        CheckChildren(item)
+    def data(self, column: int, role: int):
+        return self.compiled
 
+    def setData(self, column: int, role: int, value):
+        self.compiled = value
 
-def CleanChildren(item: QtWidgets.QTreeWidgetItem):
+    def treeWidget(self):
+        return None
+
+
+def SnapshotItem(item: QtWidgets.QTreeWidgetItem):
     """
-    The clone function duplicates unchecked children as well, so we're cleaning those off. I'm sorry, little ones.
+    Recursively copies an item and its children to CodeNodes. Use the tree's invisibleRootItem to copy the whole tree.
     """
-    for i in range(item.childCount()):
-        child = item.child(i)
-        if child:  # Failsafe
-            if child.childCount():
-                CleanChildren(child)
-            elif child.checkState(0) == Qt.Unchecked:
-                item.takeChild(i)
+    return CodeNode(tuple(item.text(i) for i in range(5)), item.checkState(0), item.data(1, Qt.UserRole),
+                    [SnapshotItem(child) for child in ChildItems(item)])
+
+
+@Profiled('Select Items', lambda result, source: {'items': TreeCount(source), 'selected': len(source.selectedItems())})
+def SelectItems(source: QtWidgets.QTreeWidget):
+    """
+    Marks items as checked if they are selected, otherwise unchecks them
+    """
+    with BulkUpdate(source):
+        bucketlist = source.findItems('', Qt.MatchContains | Qt.MatchRecursive)
+        for item in bucketlist:
+            if item.isSelected():
+                item.setCheckState(0, Qt.Checked)
+            else:
+                item.setCheckState(0, Qt.Unchecked)
+
+        # This for categories which aren't expanded
+        for item in filter(lambda x: x.isSelected() and x.childCount() and not x.isExpanded(), bucketlist):
+            CheckChildren(item)
 
 
 def AssembleCode(code: str):
@@ -76,3 +173,53 @@ def AssembleCode(code: str):
         else:
             assembledcode = ''.join([assembledcode, char.upper()])
     return assembledcode
+
+
+def CompileCode(code: str):
+    """
+    Converts a code to binary. If the code is invalid, None is returned along with the first invalid line's number and
+    the offending character in it.
+    """
+    # Check the whole code in one go, then convert it. Whitespace is ignored by fromhex.
+    if coderule.fullmatch(code):
+        return bytes.fromhex(code), 0, ''
+
+    # Something's off, so go through each line to find the culprit. The code's lines might also be split by other line
+    # boundaries, which are fine.
+    lines = code.splitlines()
+    for currline, line in enumerate(lines, 1):
+        if not linerule.fullmatch(line):
+            char = charrule.search(line)
+            # No invalid characters means the line has the wrong length
+            return None, currline, char[0] if char else line
+    return bytes.fromhex(''.join(lines)), 0, ''
+
+
+def GetCompiled(item: QtWidgets.QTreeWidgetItem):
+    """
+    Returns the item's code as a (binary, invalid line, invalid character, line count, decoded code, cost) tuple. The
+    code is only decoded and estimated if valid. The result is stored in the item itself, so the code is only compiled
+    again after it's invalidated.
+    """
+    compiled = item.data(1, Qt.UserRole)
+    if compiled is None:
+        code = item.text(1)
+        data, currline, char = CompileCode(code)
+        compiled = (data, currline, char, code.count('\n') + 1,  # +1 is because the first line doesn't have an "\n"
+                    DecodeCode(data) if data is not None else None, EstimateCost(data) if data is not None else None)
+
+        # Don't let the tree know, as this is not an actual change. Blocking the model also keeps the view from looking
+        # the item up to repaint it, which gets slow with big lists.
+        tree = item.treeWidget()
+        blocked = tree.model().blockSignals(True) if tree else False
+        item.setData(1, Qt.UserRole, compiled)
+        if tree:
+            tree.model().blockSignals(blocked)
+    return compiled
+
+
+def InvalidateCode(item: QtWidgets.QTreeWidgetItem):
+    """
+    Clears the item's compiled code. Must be called whenever the code is changed.
+    """
+    item.setData(1, Qt.UserRole, None)
@@ -0,0 +1,173 @@
+"""
+This file keeps track of enabled codes writing to the same memory. The written ranges are stored in an interval tree,
+so codes can be added and removed one by one without checking the whole list again.
+"""
+import random
+
+
+class IntervalNode:
+    """
+    A treap node. Besides its own (start, end) range, each node knows the highest end in its subtree, so that subtrees
+    which can't overlap a range are skipped entirely.
+    """
+    __slots__ = ('start', 'end', 'key', 'priority', 'maxend', 'left', 'right')
+
+    def __init__(self, start: int, end: int, key):
+        self.start = start
+        self.end = end
+        self.key = key
+        self.priority = random.random()
+        self.maxend = end
+        self.left = self.right = None
+
+    def Update(self):
+        self.maxend = max(self.end, self.left.maxend if self.left else self.end,
+                          self.right.maxend if self.right else self.end)
+
+
+def RotateRight(node: IntervalNode):
+    left = node.left
+    node.left = left.right
+    left.right = node
+    node.Update()
+    left.Update()
+    return left
+
+
+def RotateLeft(node: IntervalNode):
+    right = node.right
+    node.right = right.left
+    right.left = node
+    node.Update()
+    right.Update()
+    return right
+
+
+class IntervalTree:
+    """
+    Half-open [start, end) ranges, each belonging to a key (an int, such as a tree item's id). The same key can own
+    multiple ranges, but not the same range twice.
+    """
+    def __init__(self):
+        self.root = None
+        self.count = 0
+
+    def Insert(self, start: int, end: int, key):
+        self.root = self.InsertNode(self.root, IntervalNode(start, end, key))
+        self.count += 1
+
+    def InsertNode(self, node: IntervalNode, new: IntervalNode):
+        if node is None:
+            return new
+        if (new.start, new.end, new.key) < (node.start, node.end, node.key):
+            node.left = self.InsertNode(node.left, new)
+            if node.left.priority > node.priority:
+                node = RotateRight(node)
+        else:
+            node.right = self.InsertNode(node.right, new)
+            if node.right.priority > node.priority:
+                node = RotateLeft(node)
+        node.Update()
+        return node
+
+    def Remove(self, start: int, end: int, key):
+        self.root = self.RemoveNode(self.root, (start, end, key))
+
+    def RemoveNode(self, node: IntervalNode, target: tuple):
+        if node is None:
+            return None
+
+        # Found it, rotate it down until it's a leaf and drop it
+        current = (node.start, node.end, node.key)
+        if current == target:
+            if node.left is None:
+                self.count -= 1
+                return node.right
+            if node.right is None:
+                self.count -= 1
+                return node.left
+            if node.left.priority > node.right.priority:
+                node = RotateRight(node)
+                node.right = self.RemoveNode(node.right, target)
+            else:
+                node = RotateLeft(node)
+                node.left = self.RemoveNode(node.left, target)
+        elif target < current:
+            node.left = self.RemoveNode(node.left, target)
+        else:
+            node.right = self.RemoveNode(node.right, target)
+        node.Update()
+        return node
+
+    def Overlapping(self, start: int, end: int):
+        """
+        Returns the keys of the ranges overlapping the given one.
+        """
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            if node.maxend <= start:
+                continue  # Nothing down here reaches the range
+            if node.start < end and start < node.end:
+                found.append(node.key)
+            if node.left:
+                stack.append(node.left)
+            if node.right and node.start < end:
+                stack.append(node.right)
+        return found
+
+
+class ConflictTracker:
+    """
+    Keeps the written ranges of a set of codes in an interval tree, along with which codes overlap each other. Codes
+    are identified by int keys.
+    """
+    def __init__(self):
+        self.tree = IntervalTree()
+        self.ranges = {}  # Key -> written ranges
+        self.conflicts = {}  # Key -> keys of the codes overlapping it, only for codes with conflicts
+
+    def Add(self, key, ranges: list):
+        """
+        Adds a code and returns the keys whose conflicts changed.
+        """
+        ranges = sorted(set(ranges))
+        self.ranges[key] = ranges
+        changed = set()
+        for start, end in ranges:
+            for other in self.tree.Overlapping(start, end):
+                if other != key:
+                    self.conflicts.setdefault(key, set()).add(other)
+                    self.conflicts.setdefault(other, set()).add(key)
+                    changed.update((key, other))
+            self.tree.Insert(start, end, key)
+        return changed
+
+    def Remove(self, key):
+        """
+        Removes a code and returns the keys whose conflicts changed.
+        """
+        for start, end in self.ranges.pop(key):
+            self.tree.Remove(start, end, key)
+        changed = set()
+        for other in self.conflicts.pop(key, ()):
+            changed.update((key, other))
+            self.conflicts[other].discard(key)
+            if not self.conflicts[other]:
+                del self.conflicts[other]
+        return changed
+
+    def Sync(self, codes: dict):
+        """
+        Makes the tracked codes match the given key -> ranges dict, adding and removing only what differs. Returns the
+        keys whose conflicts changed.
+        """
+        changed = set()
+        for key, ranges in list(self.ranges.items()):
+            if key not in codes or sorted(set(codes[key])) != ranges:
+                changed |= self.Remove(key)
+        for key, ranges in codes.items():
+            if key not in self.ranges:
+                changed |= self.Add(key, ranges)
+        return changed
@@ -2,39 +2,49 @@
 Databases are basically read-only lists of codes read from an xml, which adds extra information to the manager.
 """
 import os
+import re
 import shutil
-import urllib.request
-from pkg_resources import parse_version as vercomp
 
 from lxml import etree
 from PyQt5 import QtWidgets
-from PyQt5.Qt import Qt
+from PyQt5.QtCore import Qt
 
 import globalstuff
+import registry
 from codelist import CodeList
-from codeeditor import CodeEditor, HandleCodeOpen, CleanParentz
-from common import CountCheckedCodes, SelectItems
+from codeeditor import HandleCodeOpen
+from common import CountCheckedCodes, SelectItems, BulkUpdate, ChildItems
+from memory import TrackLoad
+from profiler import Profiled, FileSize, TreeCount
 from titles import TitleLookup
-from widgets import ModdedTreeWidgetItem
+from widgets import ModdedTreeWidget, ModdedTreeWidgetItem, CopyItems
+
+
+def VersionKey(version: str):
+    """
+    Turns a version string into a tuple of numbers, so that "1.10" comes after "1.9".
+    """
+    return tuple(map(int, re.findall('\d+', version)))
+
+
+def DatabaseCounts(result, database, *args):
+    return {'items': TreeCount(database.TreeWidget), 'bytes': FileSize(database.dbfile)}
 
 
 class Database(QtWidgets.QWidget):
+    @Profiled('Database Load', DatabaseCounts)
+    @TrackLoad(lambda result, database, *args: database)
     def __init__(self, name):
         super().__init__()
 
         # Create the Database Browser and connect it to the handlers
-        self.TreeWidget = QtWidgets.QTreeWidget()
+        self.TreeWidget = ModdedTreeWidget()
         self.TreeWidget.itemSelectionChanged.connect(self.HandleSelection)
         self.TreeWidget.itemDoubleClicked.connect(lambda x: HandleCodeOpen(x, True))
         self.TreeWidget.itemClicked.connect(self.EnableButtons)
 
-        # Hide header, enable multiple selection, set items as draggable and add some space on the right
-        self.TreeWidget.setHeaderHidden(True)
-        self.TreeWidget.setSelectionMode(QtWidgets.QTreeWidget.ExtendedSelection)
+        # Codes can be dragged out, but not moved around
         self.TreeWidget.setDragDropMode(QtWidgets.QAbstractItemView.DragOnly)
-        header = self.TreeWidget.header()
-        header.setStretchLastSection(False)
-        header.setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
 
         # Add the search bar
         self.SearchBar = QtWidgets.QLineEdit()
@@ -88,7 +98,8 @@ class Database(QtWidgets.QWidget):
         self.UpdateButton.setEnabled(bool(self.updateURL))
 
         # Import the codes (the second tree is because there can be codes without a category)
-        self.ParseDatabase(tree.xpath('category') + tree.xpath('code'))
+        with BulkUpdate(self.TreeWidget):
+            self.ParseDatabase(tree.xpath('category') + tree.xpath('code'))
 
     def ParseDatabase(self, tree: etree, parent: QtWidgets.QTreeWidgetItem = None):
         """
@@ -124,18 +135,20 @@ class Database(QtWidgets.QWidget):
         """
         self.AddButton.setEnabled(bool(list(CountCheckedCodes(self.TreeWidget, False))))
 
+    @Profiled('Database Search', lambda result, database, text: {'items': TreeCount(database.TreeWidget)})
     def HandleSearch(self, text: str):
         """
         Filters codes based on a given string
         """
-        for item in self.TreeWidget.findItems('', Qt.MatchContains | Qt.MatchRecursive):
-            # Hide all items
-            item.setHidden(True)
+        with BulkUpdate(self.TreeWidget):
+            for item in self.TreeWidget.findItems('', Qt.MatchContains | Qt.MatchRecursive):
+                # Hide all items
+                item.setHidden(True)
 
-            # Unhide the item if its name or code match, then unhide its parents
-            if item.text(1) and any(text.lower() in item.text(i).lower() for i in range(2)):
-                item.setHidden(False)
-                self.UnhideParent(item)
+                # Unhide the item if its name or code match, then unhide its parents
+                if item.text(1) and any(text.lower() in item.text(i).lower() for i in range(2)):
+                    item.setHidden(False)
+                    self.UnhideParent(item)
 
     def UnhideParent(self, item: QtWidgets.QTreeWidgetItem):
         """
@@ -149,18 +162,20 @@ class Database(QtWidgets.QWidget):
         """
         Transfers the selected codes to the chosen codelist
         """
-        enabledlist = CountCheckedCodes(self.TreeWidget, False)
+        data = CopyItems(list(ChildItems(self.TreeWidget.invisibleRootItem())))
         if self.Combox.currentIndex() > 0:
-            self.Combox.currentData().AddFromDatabase(enabledlist, self.gameID)
+            self.Combox.currentData().AddFromDatabase(data, self.gameID)
         else:
             win = globalstuff.mainWindow.CreateNewWindow(CodeList())
-            win.AddFromDatabase(enabledlist, self.gameID)
+            win.AddFromDatabase(data, self.gameID)
 
+    @Profiled('Database Update', DatabaseCounts)
     def UpdateDatabase(self):
         """
         Updates the database from the given url.
         """
         # Download the file
+        import urllib.request  # Slow to import and rarely needed
         try:
             with urllib.request.urlopen(self.updateURL) as src, open('tmp.xml', 'wb') as dst:
                 dst.write(src.read())
@@ -181,7 +196,7 @@ class Database(QtWidgets.QWidget):
             return
 
         # Check that the new version is actually newer, otherwise exit
-        if vercomp(ver) <= vercomp(self.ver):
+        if VersionKey(ver) <= VersionKey(self.ver):
             QtWidgets.QMessageBox.information(globalstuff.mainWindow, 'Up to date', 'Database is up to date!')
             os.remove('tmp.xml')
             return
@@ -190,14 +205,12 @@ class Database(QtWidgets.QWidget):
         self.ver = ver
 
         # Clean the parentz parameter of affected Code Editors
-        # The window list is created earlier so it isn't generated a gazillion times in the for loop
-        wlist = [w.widget() for w in globalstuff.mainWindow.mdi.subWindowList() if isinstance(w.widget(), CodeEditor)]
-        for item in filter(lambda x: bool(x.text(1)), self.TreeWidget.findItems('', Qt.MatchContains | Qt.MatchRecursive)):
-            CleanParentz(item, wlist)
+        registry.DetachTree(self.TreeWidget)
 
         # Clear the tree and import the codes
-        self.TreeWidget.clear()
-        self.ParseDatabase(tree.xpath('category') + tree.xpath('code'))
+        with BulkUpdate(self.TreeWidget):
+            self.TreeWidget.clear()
+            self.ParseDatabase(tree.xpath('category') + tree.xpath('code'))
 
         # Overwrite the original file and disable the update button, since we no longer need it.
         shutil.move('tmp.xml', self.dbfile)
@@ -0,0 +1,75 @@
+"""
+This file guesses how much work the codehandler does every frame to run a code, so that lists with too many heavy codes
+can be spotted before they make the game lag. The cost of a code is the amount of lines the codehandler reads, plus
+one for every value it writes, copies or compares. Repeated blocks count as many times as they are executed.
+"""
+import struct
+
+from codetypes import EntryLength, Normalize
+
+
+def SerialCost(w0: int, w1: int, extra: tuple):
+    """
+    A serial write does every extra write given in the second line, plus the first one.
+    """
+    return ((extra[0] >> 16) & 0xFFF) + 1 if extra else 0
+
+
+def SearchCost(w0: int, w1: int, extra: tuple):
+    """
+    A search compares every word between XXXX0000 and YYYY0000, where the second word is XXXXYYYY.
+    """
+    return max(0, (w1 & 0xFFFF) - (w1 >> 16)) << 14
+
+
+# Work done by each codetype besides reading its lines, from its first line and the one after it. Codetypes which
+# aren't listed only cost their lines.
+costs = {
+    0x00: lambda w0, w1, extra: (w1 >> 16) + 1,
+    0x02: lambda w0, w1, extra: (w1 >> 16) + 1,
+    0x04: lambda w0, w1, extra: 1,
+    0x06: lambda w0, w1, extra: w1,
+    0x08: SerialCost,
+    0x8A: lambda w0, w1, extra: (w0 >> 8) & 0xFFFF,
+    0x8C: lambda w0, w1, extra: (w0 >> 8) & 0xFFFF,
+    0xC0: lambda w0, w1, extra: w1 * 2,  # Two instructions per line
+    0xF6: SearchCost,
+}
+
+# Codetypes hooking into the game's code. They don't cost much to the codehandler, but the game runs them every time it
+# gets to the hooked instruction.
+hooks = (0xC2, 0xC4, 0xC6)
+
+
+def EstimateCost(data: bytes):
+    """
+    Returns the code's (cost, hooks, repeats) tuple.
+    """
+    # Initialize vars
+    words = list(struct.iter_unpack('>II', data[:len(data) & ~7]))
+    cost = hookcount = repeats = 0
+    stack = []  # (repeat count, cost when the repeat was set) for each repeat being set
+    i = 0
+
+    while i < len(words):
+        w0, w1 = words[i]
+        codetype = Normalize(w0 >> 24)
+        length = min(EntryLength(w0, w1), len(words) - i)
+        cost += length
+
+        # Add the codetype's work
+        if codetype in costs:
+            cost += costs[codetype](w0, w1, words[i + 1] if length > 1 else None)
+        elif codetype in hooks:
+            hookcount += 1
+
+        # The lines between a set repeat and its execute repeat are run again the given amount of times
+        elif codetype == 0x60:
+            stack.append((w0 & 0xFFFF, cost))
+            repeats += 1
+        elif codetype == 0x62 and stack:
+            count, start = stack.pop()
+            cost += (cost - start) * count
+        i += length
+
+    return cost, hookcount, repeats
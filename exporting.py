@@ -1,223 +1,388 @@
 """
 This files contains multiple functions to export codelists.
 """
+import filecmp
+import hashlib
 import os
-import re
-from binascii import unhexlify
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 
 from PyQt5 import QtWidgets
-from PyQt5.Qt import Qt
+from PyQt5.QtCore import Qt
 
 import globalstuff
 from codelist import CodeList
-from common import CountCheckedCodes
+from common import ChildItems, WalkItems, GetCompiled, SnapshotItem
+from optimizer import OptimizeCode
+from profiler import Profiled, FileSize, TreeCount
 
 
 def WriteCheck(filename: str, silent: bool):
     """
     This function performs a couple preliminary operations before importing can take place. Very informative, i know.
     """
-    # Check if we can write the file. If not, trigger an error message.
-    if not os.access(filename, os.W_OK):
+    # Check if we can write the file (and the temporary file next to it). If not, trigger an error message.
+    if os.path.exists(filename) and not os.access(filename, os.W_OK) or \
+            not os.access(os.path.dirname(os.path.abspath(filename)), os.W_OK):
         if not silent:
             QtWidgets.QMessageBox.critical(globalstuff.mainWindow, 'File Write Error', "Can't write file " + filename)
         return False
     return True
 
 
-def WriteItems(f, enabledlist, depth):
+# WriteFiles results other than failure
+WRITTEN = 1
+SKIPPED = 2
+EMPTY = 3  # The writer had nothing to put in the file, so it wasn't created
+
+
+def WriteFiles(filenames: dict, writer, *args, key: str = None):
     """
-    This recursive function is used by the TXT exporter. So much fun.
+    Runs the writer on temporary files next to the destinations (filenames maps each format to its destination), which
+    are then swapped in with a single rename each. The writer receives the opened files in the same form and must return
+    the result of each format it wrote successfully, WRITTEN or EMPTY. If it fails or crashes, the destinations are left
+    untouched, as are those of empty formats.
+    If a file's output is the same as the destination's content, the destination isn't touched at all. If the content
+    hash of the writer's input (key) matches the one of the previous export to a file and the file hasn't changed since,
+    that format isn't even written. Returns the result of each format.
     """
-    for item in enabledlist:
-
-        # It's a category. Write it only if it's not empty.
-        if not item.text(1):
-            if item.childCount():
-                f.write(''.join(['#' * depth, item.text(0), '\n\n']))  # Add the hashtags if we're in a nested category
-                WriteItems(f, [item.child(i) for i in range(item.childCount())], depth + 1)  # Recursive :o
+    # Check which exports have been done already
+    results = {}
+    pending = {}
+    for ext, filename in filenames.items():
+        if key and os.path.isfile(filename):
+            stat = os.stat(filename)
+            if globalstuff.exporthashes.get(filename) == (key, stat.st_size, stat.st_mtime_ns):
+                results[ext] = SKIPPED
+                continue
+        pending[ext] = filename
+    if not pending:
+        return results
+
+    # Write the temporary files. One per thread, in case two exports collide.
+    tmpnames = {ext: '{}.{}.tmp'.format(filename, threading.get_ident()) for ext, filename in pending.items()}
+    try:
+        with ExitStack() as stack:
+            files = {ext: stack.enter_context(open(tmpname, 'wb' if ext == 'gct' else 'w'))
+                     for ext, tmpname in tmpnames.items()}
+            written = writer(files, *args)
+
+        for ext, filename in pending.items():
+            if ext not in written or written[ext] == EMPTY:
+                results[ext] = written.get(ext, False)
+                continue
+
+            # Only replace the file if something changed
+            if os.path.isfile(filename) and filecmp.cmp(tmpnames[ext], filename, False):
+                results[ext] = SKIPPED
+            else:
+                os.replace(tmpnames[ext], filename)
+                results[ext] = WRITTEN
 
-        # It's a code
-        else:
+            # Remember what was exported to this file
+            if key:
+                stat = os.stat(filename)
+                globalstuff.exporthashes[filename] = (key, stat.st_size, stat.st_mtime_ns)
+        return results
+    finally:
+        for tmpname in tmpnames.values():
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
 
-            # Write the code name
-            f.write(item.text(0))
 
-            # If the code has an author, add it between "[]"
-            if item.text(4):
-                f.write(''.join([' [', item.text(4), ']']))
+def ExportHash(root: QtWidgets.QTreeWidgetItem, *args):
+    """
+    Returns a hash of everything that ends up in an exported file: the given writer parameters (game id, additional
+    data...) and every code's fields and check state.
+    """
+    h = hashlib.sha1()
+    h.update('\0'.join(map(str, args)).encode('utf-8', 'surrogatepass'))
+    for item in WalkItems(root):
+        h.update('\0'.join(['', str(item.checkState(0)), str(item.childCount())] +
+                           [item.text(i) for i in range(5)]).encode('utf-8', 'surrogatepass'))
+    return h.hexdigest()
 
-            # If the code is enabled, add an asterisk at the beginning of each line
-            if item.checkState(0) == Qt.Checked:
-                f.writelines(['\n* ' + line for line in item.text(1).splitlines()])
 
-            # Otherwise just add a new line and write the entire code
-            else:
-                f.write('\n')
-                f.write(item.text(1))
+def WriteCodes(files: dict, root: QtWidgets.QTreeWidgetItem, gameid: str, gamename: str, scrap: str, oninvalid=None,
+               savings: dict = None):
+    """
+    Writes the codelist to every given format (TXT, Dolphin INI and GCT in the regular format, screw BrawlBox) in a
+    single pass over the tree, so each code is only read and validated once. Invalid codes, including those whose last
+    codetype is cut short, are left out of the GCT, unless oninvalid (which receives the code name and its GetCompiled
+    result) returns False, in which case the whole export is aborted. Returns the result of each format, EMPTY for a GCT
+    without any valid enabled code.
+    """
+    # Initialize vars
+    txt, ini, gct = files.get('txt'), files.get('ini'), files.get('gct')
+    enablednames = []
+    buffer = bytearray(globalstuff.gctmagic)
 
-            # Add the comment if it exists, preceded by a newline
-            if item.text(2):
-                f.write('\n')
-                f.write(item.text(2))
+    # Write the headers. TXT entries are separated by an empty line, which is written before each entry rather than
+    # after it, so there's nothing to remove at the end of the file.
+    if txt:
+        txt.write('\n'.join([gameid, gamename]))
+    if ini:
+        ini.write('[Gecko]')
 
-            # Add the final padding newlines
-            f.write('\n\n')
+    # Write the codes!
+    stack = [ChildItems(root)]
+    while stack:
+        depth = len(stack) - 1
+        item = next(stack[-1], None)
+
+        # We have reached the end of the list (or category). If we're in the latter, write the category escape character
+        if item is None:
+            stack.pop()
+            if txt and depth > 0:
+                txt.write(''.join(['\n\n', '#' * depth]))
+            continue
 
-    # We have reached the end of the list (or category). If we're in the latter, write the category escape character and the newlines
-    if depth > 0:
-        f.write('#' * depth)
-        f.write('\n\n')
+        # It's a category. Write it only if it's not empty.
+        code = item.text(1)
+        if not code:
+            if item.childCount():
+                if txt:
+                    txt.write(''.join(['\n\n', '#' * depth, item.text(0)]))  # Add the hashtags for nested categories
+                stack.append(ChildItems(item))
+            continue
+
+        # It's a code. Get the shared stuff first.
+        name, comment, author = item.text(0), item.text(2), item.text(4)
+        checked = item.checkState(0) == Qt.Checked
+        compiled = GetCompiled(item) if checked and (ini or gct) else None
+
+        if txt:
+            # Write the code name. If the code has an author, add it between "[]".
+            txt.write('\n\n')
+            txt.write(name)
+            if author:
+                txt.write(''.join([' [', author, ']']))
+
+            # If the code is enabled, add an asterisk at the beginning of each line, otherwise write it as is
+            if checked:
+                txt.writelines(['\n* ' + line for line in code.splitlines()])
+            else:
+                txt.write('\n')
+                txt.write(code)
 
+            # Add the comment if it exists, preceded by a newline
+            if comment:
+                txt.write('\n')
+                txt.write(comment)
+
+        if ini:
+            # Add code name, code and author if present. Code must be lowercase because Dolphin.
+            if author:
+                ini.write(''.join(['\n$', name, ' [', author, ']\n', code.lower()]))
+            else:
+                ini.write(''.join(['\n$', name, '\n', code.lower()]))
 
-def InvalidCharacter(name: str, line: int, char: list):
-    msgbox = QtWidgets.QMessageBox.question(globalstuff.mainWindow, 'Invalid Line', ''.join(['Invalid character "<b>', char,
-                                                                                             '</b>" in code "<b>', name,
-                                                                                             '</b>" in line <b>', str(line),
-                                                                                             '</b>. Continue exporting?']))
+            # Add comment if present
+            if comment:
+                ini.writelines(['\n*' + line for line in comment.splitlines()])
+            else:
+                ini.write('\n*')
+
+            # Add to Gecko_Enabled if checked, but only if the code is valid
+            if checked and compiled[0] is not None:
+                enablednames.append(name)
+
+        if gct and checked:
+            # A truncated code would make the codehandler read the next one as part of it, so it can't go in
+            if compiled[0] is not None and not compiled[4].missing:
+                buffer += OptimizeCode(compiled[0], savings) if savings is not None else compiled[0]
+
+            # There's an invalid character! Caught the offender, you're under arrest!
+            elif oninvalid and not oninvalid(name, compiled):
+                return {}
+
+    # Finish off the files
+    written = {}
+    if txt:
+        # This exporter used to write an empty line after every entry and then cut the last two bytes off the file.
+        # With Windows line endings that only removed one of the two newlines, so keep that one for identical output.
+        if os.linesep == '\r\n':
+            txt.write('\n')
+        written['txt'] = WRITTEN
+
+    if ini:
+        # Only write gecko enabled if at least one code is enabled. Adding a new line because it's not at the beginning
+        # of the file.
+        if enablednames:
+            ini.write('\n[Gecko_Enabled]')
+            ini.writelines(['\n$' + name for name in enablednames])
+
+        # Port the additional data over, then write the final newline. Time to pack up and go home.
+        if scrap:
+            ini.write('\n')
+            ini.write(scrap)
+        ini.write('\n')
+        written['ini'] = WRITTEN
+
+    # If we didn't write anything at all in the gct, there's no point in creating the file
+    if gct and len(buffer) > 8:
+        buffer += globalstuff.gctend
+        gct.write(buffer)
+        written['gct'] = WRITTEN
+    elif gct:
+        written['gct'] = EMPTY
+    return written
+
+
+def InvalidCode(name: str, compiled: tuple):
+    if compiled[0] is None:
+        msg = ''.join(['Invalid character "<b>', compiled[2], '</b>" in code "<b>', name, '</b>" in line <b>',
+                       str(compiled[1]), '</b>. Continue exporting?'])
+    else:
+        msg = ''.join(['Code "<b>', name, '</b>" is missing <b>', str(compiled[4].missing),
+                       '</b> line(s) at the end. Continue exporting?'])
+    msgbox = QtWidgets.QMessageBox.question(globalstuff.mainWindow, 'Invalid Line', msg)
     return msgbox
 
 
-def ExportTXT(filename: str, source: CodeList, silent: bool):
-    # Open the file
-    f = open(filename, 'w')
-
-    # Now that we opened the file, we can check if it can be written.
-    if not WriteCheck(filename, silent):
-        f.close()
-        os.remove(filename)
-        return False
+def ResultText(results: dict):
+    """
+    Describes which files of a single export were written, for the export completion dialog.
+    """
+    written = [ext.upper() for ext, result in results.items() if result != EMPTY]
+    if len(written) == len(results):
+        return 'List exported succesfully!'
+    msg = 'The GCT was not created, since no valid codes are enabled.'
+    if written:
+        msg = '{} exported succesfully! {}'.format(' and '.join(written), msg)
+    return msg
 
-    # Initialize vars
-    enabledlist = source.TreeWidget.findItems('', Qt.MatchContains)
 
-    # Write the game id and name
-    f.write('\n'.join([source.gameID, source.gameName, '', '']))
+def SavingsText(savings: dict):
+    """
+    Describes what the optimizer saved, for the export completion dialogs.
+    """
+    if not savings:
+        return ''
+    return ' Optimizing saved {} lines ({} bytes).'.format(savings['lines'], savings['bytes'])
 
-    # Write the codes!
-    WriteItems(f, enabledlist, 0)
 
-    # Remove the extra newline at the end, then close the file!
-    f.seek(f.tell() - 2)  # We have to use seek type 0 or the program will crash
-    f.truncate()
-    f.close()
-    return True
+def ExportCounts(result, filenames: dict, source: CodeList, *args):
+    return {'items': TreeCount(source.TreeWidget), 'bytes': sum(map(FileSize, filenames.values()))}
 
 
-def ExportINI(filename: str, source: CodeList, silent: bool):
+@Profiled('Export', ExportCounts)
+def ExportFiles(filenames: dict, source: CodeList, silent: bool, savings: dict = None):
     """
-    The simplest export function so far. A real piece of cake.
+    Exports the codelist to every given format at once. Filenames maps each format to its destination. If savings is
+    given, the GCT is optimized (see WriteCodes). Returns the WriteFiles results, empty if the export was cancelled.
     """
-    # Open the file. Not using "with" here due to error handling later on
-    f = open(filename, 'w')
+    # Check if the files can be written
+    if not all(WriteCheck(filename, silent) for filename in filenames.values()):
+        return {}
 
-    # Now that we opened the file, we can check if it can be written.
-    if not WriteCheck(filename, silent):
-        f.close()
-        os.remove(filename)
-        return False
+    # Autosaved data was found, ask the user what they want to do with it. The warning is fake as per usual.
+    scrap = ''
+    if 'ini' in filenames and source.scrap:
+        if silent or QtWidgets.QMessageBox.question(globalstuff.mainWindow, 'Additional Data Found',
+                                                    'Additional data was found in a previously imported .ini file.'
+                                                    'Port the data over to this file?') == QtWidgets.QMessageBox.Yes:
+            scrap = source.scrap
+
+    # Warn the user about codes overwriting each other's stuff
+    if 'gct' in filenames and not silent:
+        pairs = source.ConflictingCodes()
+        if pairs and QtWidgets.QMessageBox.question(
+                globalstuff.mainWindow, 'Conflicting Codes',
+                'The following enabled codes write to the same addresses:<br>' +
+                '<br>'.join('<b>{}</b> and <b>{}</b>'.format(a, b) for a, b in pairs[:10]) +
+                ('<br>...and {} more'.format(len(pairs) - 10) if len(pairs) > 10 else '') +
+                '<br>Export anyway?') == QtWidgets.QMessageBox.No:
+            return {}
+
+    # Ask the user what to do with invalid codes, unless we're in silent mode
+    oninvalid = None
+    if not silent:
+        oninvalid = lambda name, compiled: InvalidCode(name, compiled) != QtWidgets.QMessageBox.No
+
+    # Write the files. If the data was ported, it's gone from the list.
+    results = WriteFiles(filenames, WriteCodes, source.TreeWidget.invisibleRootItem(), source.gameID, source.gameName,
+                         scrap, oninvalid, savings)
+    if scrap and results.get('ini'):
+        source.scrap = ''
+    return results
 
-    # Initialize vars
-    linerule = re.compile('^[\dA-F]{8} [\dA-F]{8}$', re.I | re.M)  # Ignore case + multiple lines
-    enabledlist = filter(lambda x: bool(x.text(1)), source.TreeWidget.findItems('', Qt.MatchContains | Qt.MatchRecursive))
-    geckostr = '[Gecko]'
-    geckoenabledstr = '\n[Gecko_Enabled]'  # Adding a new line because it's not at the beginning of the file
-
-    # Assemble the giant strings
-    for item in enabledlist:
-
-        # Add code name, code and author if present. Code must be lowercase because Dolphin.
-        if item.text(4):
-            geckostr = ''.join([geckostr, '\n$', item.text(0), ' [', item.text(4), ']\n', item.text(1).lower()])
-        else:
-            geckostr = ''.join([geckostr, '\n$', item.text(0), '\n', item.text(1).lower()])
-
-        # Add comment if present
-        if item.text(2):
-            for line in item.text(2).splitlines():
-                geckostr = '\n*'.join([geckostr, line])
-        else:
-            geckostr += '\n*'
-
-        # Add to Gecko_Enabled if checked, but only if the code is valid
-        if item.checkState(0) == Qt.Checked and len(re.findall(linerule, item.text(1))) == item.text(1).count('\n') + 1:
-            geckoenabledstr = '\n$'.join([geckoenabledstr, item.text(0)])
 
-    # Write the codes!
-    f.write(geckostr)
+def ExportTXT(filename: str, source: CodeList, silent: bool):
+    return ExportFiles({'txt': filename}, source, silent)
 
-    # Only write gecko enabled if at least one code is enabled
-    if len(geckoenabledstr) > 16:
-        f.write(geckoenabledstr)
 
-    # Autosaved data was found, ask the user what they want to do with it. The warning is fake as per usual.
-    if source.scrap:
-        if not silent:
-            msgbox = QtWidgets.QMessageBox.question(globalstuff.mainWindow, 'Additional Data Found',
-                                                    'Additional data was found in a previously imported .ini file.'
-                                                    'Port the data over to this file?')
-        if silent or msgbox == QtWidgets.QMessageBox.Yes:
-            f.write('\n')
-            f.write(source.scrap)
-            source.scrap = ''
-
-    # Write the final newline and close the file. Time to pack up and go home.
-    f.write('\n')
-    f.close()
-    return True
+def ExportINI(filename: str, source: CodeList, silent: bool):
+    """
+    The simplest export function so far. A real piece of cake.
+    """
+    return ExportFiles({'ini': filename}, source, silent)
 
 
 def ExportGCT(filename: str, source: CodeList, silent: bool):
     """
     Exports a GCT in the regular format (screw BrawlBox)
     """
-    # Open the file. Not using "with" here due to error handling later on
-    f = open(filename, 'wb')
+    return ExportFiles({'gct': filename}, source, silent)
 
-    # Now that we opened the file, we can check if it can be written.
-    if not WriteCheck(filename, silent):
-        f.close()
-        os.remove(filename)
-        return False
 
-    # Initialize vars
-    charrule = re.compile('[\d A-F]', re.I)
-    linerule = re.compile('^[\dA-F]{8} [\dA-F]{8}$', re.I)
-    enabledlist = filter(lambda x: bool(x.text(1)), CountCheckedCodes(source.TreeWidget, True))
-
-    # Write the gct!
-    f.write(globalstuff.gctmagic)
-    for item in enabledlist:
-        code = item.text(1).splitlines()  # Remove newlines
-        currline = 1
-        for line in code:
-
-            # Make sure there are no non-hex characters
-            if re.match(linerule, line):
-                f.write(unhexlify(line.replace(' ', '')))  # Didn't strip spaces earlier for line count purposes ;)
-                currline += 1
-
-            # There's an invalid character! FIND HIM!
+@Profiled('Export All', lambda result, jobs, *args: {'codelists': len(jobs), 'bytes': sum(
+    FileSize(filename) for filenames, codelist in jobs for filename in filenames.values())})
+def ExportMultiple(jobs: list, savings: dict = None):
+    """
+    Silently exports multiple codelists. Jobs are (filenames, codelist) pairs, where filenames maps each format to its
+    destination. The codelists are copied first, since tree items can only be touched by the GUI thread, then the files
+    are written by a thread pool. Returns the WriteFiles results of each job. Files which would stay the same aren't
+    rewritten. If savings is given, the GCTs are optimized (see WriteCodes).
+    """
+    # Copy the codelists and set up the writer's parameters. The additional data is always ported in silent mode.
+    tasks = []
+    for filenames, codelist in jobs:
+        root = SnapshotItem(codelist.TreeWidget.invisibleRootItem())
+        tasks.append((filenames, root, codelist.gameID, codelist.gameName, codelist.scrap if 'ini' in filenames else '',
+                      None, {} if savings is not None else None))  # Each job gets its own savings, added up later
+
+    # Jobs with the same destinations are run by the same worker in their original order, so the last one wins
+    groups = {}
+    for index, task in enumerate(tasks):
+        groups.setdefault(tuple(sorted(task[0].values())), []).append(index)
+
+    # Run the groups and wait for them to finish
+    with ThreadPoolExecutor() as pool:
+        futures = {pool.submit(RunTasks, [tasks[i] for i in indexes]): indexes for indexes in groups.values()}
+
+    # Put the results back in the original order
+    results = [{}] * len(tasks)
+    for future, indexes in futures.items():
+        for index, result in zip(indexes, future.result()):
+            results[index] = result
+
+    # The additional data was ported, so it's gone from the list
+    for (filenames, codelist), result in zip(jobs, results):
+        if result.get('ini'):
+            codelist.scrap = ''
+
+    # Add up the savings
+    if savings is not None:
+        for task in tasks:
+            for key, value in task[-1].items():
+                savings[key] = savings.get(key, 0) + value
+    return results
+
+
+def RunTasks(tasks: list):
+    """
+    Worker function for ExportMultiple. Runs the given writer tasks in order, without any user interaction.
+    """
+    results = []
+    for task in tasks:
+        try:
+            filenames, *args = task
+            if all(WriteCheck(filename, True) for filename in filenames.values()):
+                results.append(WriteFiles(filenames, WriteCodes, *args, key=ExportHash(*args)))
             else:
-                char = re.sub(charrule, '', line)[0]
-
-                # Caught the offender. You're under arrest!
-                if not silent and InvalidCharacter(item.text(0), currline, char) == QtWidgets.QMessageBox.No:
-                    f.close()
-                    os.remove(filename)  # Remove the incomplete file
-                    return False
-                else:
-                    f.seek(-8 * currline, 1)  # Go back to the beginning of this code
-                    f.truncate()  # Remove all lines after it, the code is broken
-                    break  # Go to next code
-
-    # Finish it off
-    f.write(globalstuff.gctend)
-    flen = f.tell()
-    f.close()
-
-    # If we didn't write anything at all, might as well remove the file
-    if flen == 16:
-        os.remove(filename)
-        return False
-    return True
+                results.append(dict.fromkeys(filenames, False))
+        except OSError:
+            results.append(dict.fromkeys(task[0], False))
+    return results
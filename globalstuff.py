@@ -5,7 +5,7 @@ import os
 import sys
 
 from PyQt5.QtGui import QPalette, QColor
-from PyQt5.Qt import Qt
+from PyQt5.QtCore import Qt
 
 # Main window
 app = None
@@ -18,9 +18,23 @@ wiitdb = os.path.join(os.path.dirname(sys.argv[0]), 'wiitdb.txt')
 gctmagic = b'\0\xd0\xc0\xde' * 2
 gctend = b'\xf0' + b'\0' * 7
 
+# Filename -> (content hash, size, modification time) of the last export to each file
+exporthashes = {}
+
 # Program settings
 nowarn = False
 theme = 'default'
+singleinstance = True  # Whether later launches hand their files to the running program
+restoresession = True  # Whether the opened windows are saved on exit and reopened on start
+sessioninterval = 0  # Minutes between session saves while running, 0 to only save on exit
+sessionfile = 'session.dat'
+usejournal = True  # Whether changes are journaled, so they can be recovered after a crash
+journalfile = 'journal.log'
+journal = None
+stallthreshold = 1000  # Milliseconds the GUI can freeze for before the watchdog records it, 0 to never record
+watchdog = None
+profiling = False  # Whether the slow operations are timed, see profiler.py
+costbudget = 5000  # Estimated codehandler work per frame before the enabled codes are deemed too heavy
 
 # Palettes
 # This palette is a workaround so that QMdiSubWindow titles don't look like crap
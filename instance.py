@@ -0,0 +1,98 @@
+"""
+Keeps a single copy of the program running. Later launches hand their files to the running one through a local socket
+and quit right away, instead of starting a whole new window.
+"""
+import getpass
+import json
+import os
+
+from PyQt5 import QtNetwork
+from PyQt5.QtCore import Qt
+
+import globalstuff
+
+# The socket's name. It's per user, so that users don't get each other's files.
+servername = 'CodeManagerReborn-' + getpass.getuser()
+
+
+def Answers(timeout: int = 250):
+    """
+    Checks whether a running instance is listening, without sending it anything.
+    """
+    socket = QtNetwork.QLocalSocket()
+    socket.connectToServer(servername)
+    answered = socket.waitForConnected(timeout)
+    socket.abort()
+    return answered
+
+
+def SendFiles(files: list, timeout: int = 250):
+    """
+    Hands the given files (with absolute paths) to the running instance. Returns False if there isn't one.
+    """
+    socket = QtNetwork.QLocalSocket()
+    socket.connectToServer(servername)
+    if not socket.waitForConnected(timeout):
+        return False
+
+    # Send the list and wait for it to go through
+    socket.write(json.dumps(files).encode('utf-8'))
+    socket.waitForBytesWritten(timeout)
+    socket.disconnectFromServer()
+    if socket.state() != QtNetwork.QLocalSocket.UnconnectedState:
+        socket.waitForDisconnected(timeout)
+    return True
+
+
+class InstanceServer(QtNetwork.QLocalServer):
+    """
+    Receives the files from later launches and opens them in the main window. If another instance got the name first,
+    it doesn't listen, see isListening.
+    """
+    def __init__(self):
+        super().__init__()
+        self.newConnection.connect(self.HandleConnection)
+
+        # The name is taken. If nobody answers, the socket was left behind by a crash, so take it over. Otherwise
+        # another copy was started at the same time as this one and got there first.
+        if not self.listen(servername) and not Answers():
+            QtNetwork.QLocalServer.removeServer(servername)
+            self.listen(servername)
+
+    def HandleConnection(self):
+        """
+        Waits for the other side to send everything, which it signals by disconnecting.
+        """
+        while self.hasPendingConnections():
+            socket = self.nextPendingConnection()
+            if socket.state() == QtNetwork.QLocalSocket.UnconnectedState:
+                self.HandleFiles(socket)
+            else:
+                socket.disconnected.connect(self.HandleDisconnected)
+
+    def HandleDisconnected(self):
+        """
+        A bound slot, since a lambda holding the socket would be dropped by the garbage collector along with it.
+        """
+        self.HandleFiles(self.sender())
+
+    def HandleFiles(self, socket: QtNetwork.QLocalSocket):
+        """
+        Brings the main window to the front and opens the received files.
+        """
+        data = bytes(socket.readAll())
+        socket.deleteLater()
+        try:
+            files = [file for file in json.loads(data.decode('utf-8')) if os.path.isfile(file)]
+        except (ValueError, TypeError):
+            return  # Not one of us
+
+        # Show the window
+        window = globalstuff.mainWindow
+        window.setWindowState(window.windowState() & ~Qt.WindowMinimized)
+        window.raise_()
+        window.activateWindow()
+
+        # Open the files
+        if files:
+            window.openCodelist(None, files)
@@ -0,0 +1,419 @@
+"""
+Records every change made to the opened codelists and code editors in an append-only journal, so that unsaved work can
+be recovered if the program crashes. Each change is stored as a small record describing only what changed, so the cost
+of recording it doesn't depend on the size of the list. A background thread writes the records and keeps a copy of the
+resulting state, which it periodically saves as the journal's base so that the journal itself stays short. The journal
+is deleted on a clean exit, so finding one on start means the last session crashed.
+"""
+import functools
+import os
+import pickle
+import queue
+import struct
+import threading
+import zlib
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+from PyQt5.QtCore import Qt
+
+import globalstuff
+from codeeditor import CodeEditor
+from codelist import CodeList
+from common import ChildItems
+from session import ItemState, RestoreCodelist
+
+# Record header: payload length and checksum. A record cut short by a crash fails the checksum and ends the replay.
+header = struct.Struct('>II')
+
+# Size the journal can grow to before it's folded into the base
+compactsize = 1 << 20
+
+
+def BaseFile(file: str):
+    return os.path.splitext(file)[0] + '.base'
+
+
+def IndexPath(index: QtCore.QModelIndex):
+    """
+    Returns the rows leading to the given index, from the top level down.
+    """
+    path = []
+    while index.isValid():
+        path.append(index.row())
+        index = index.parent()
+    path.reverse()
+    return path
+
+
+def Thaw(state):
+    """
+    Makes a copy of an ItemState tuple which can be modified in place.
+    """
+    texts, checked, expanded, children = state
+    return [list(texts), checked, expanded, None if children is None else [Thaw(child) for child in children]]
+
+
+class JournalState:
+    """
+    The opened windows as described by the journal. Codelist items are kept as ItemState lists, and windows are
+    identified by the number the journal gave them.
+    """
+    def __init__(self):
+        self.seq = 0  # Last applied record
+        self.lists = {}  # Number -> [game id, game name, scrap, items]
+        self.databases = {}  # Number -> file
+        self.editors = {}  # Number -> {'name', 'author', 'code', 'comment', 'dirty'}
+
+    def Children(self, number: int, path: list):
+        """
+        Returns the children list of the item at the given path in a codelist, or the top level list for an empty path.
+        """
+        children = self.lists[number][3]
+        for row in path:
+            children = children[row][3]
+        return children
+
+    def Item(self, number: int, path: list):
+        return self.Children(number, path[:-1])[path[-1]]
+
+    def Apply(self, record: tuple):
+        """
+        Applies a record. See Journal for the available records.
+        """
+        seq, op, number = record[:3]
+        args = record[3:]
+        self.seq = seq
+
+        # Codelists
+        if op == 'open':
+            self.lists[number] = list(args[:3]) + [[Thaw(state) for state in args[3]]]
+        elif op == 'meta':
+            self.lists[number][:3] = args
+        elif op == 'reset':
+            self.lists[number][3] = [Thaw(state) for state in args[0]]
+        elif op == 'insert':
+            path, row, states = args
+            self.Children(number, path)[row:row] = [Thaw(state) for state in states]
+        elif op == 'remove':
+            path, row, count = args
+            del self.Children(number, path)[row:row + count]
+        elif op == 'text':
+            path, column, text = args
+            self.Item(number, path)[0][column] = text
+        elif op == 'check':
+            path, checked = args
+            self.Item(number, path)[1] = checked
+        elif op == 'row':
+            path, texts, checked = args
+            item = self.Item(number, path)
+            item[0] = list(texts)
+            item[1] = checked
+
+        # Databases
+        elif op == 'database':
+            self.databases[number] = args[0]
+
+        # Code editors. Code and comment changes are (position, removed characters, added text) edits.
+        elif op == 'editor':
+            self.editors[number] = dict(zip(('name', 'author', 'code', 'comment', 'dirty'), args))
+        elif op == 'field':
+            self.editors[number][args[0]] = args[1]
+        elif op == 'edit':
+            field, position, removed, added = args
+            text = self.editors[number][field]
+            self.editors[number][field] = ''.join([text[:position], added, text[position + removed:]])
+
+        # Any window
+        elif op == 'close':
+            for windows in (self.lists, self.databases, self.editors):
+                windows.pop(number, None)
+
+    def ApplySafely(self, record: tuple):
+        """
+        Applies a record, skipping it if it doesn't fit the state. Better to recover most of the work than nothing.
+        """
+        try:
+            self.Apply(record)
+        except (IndexError, KeyError, TypeError, ValueError):
+            self.seq = record[0]
+
+
+class Journal:
+    """
+    Watches the opened windows and sends their changes to the writer thread. Records are (sequence number, operation,
+    window number, arguments...) tuples:
+    - open (game id, game name, scrap, items), meta (game id, game name, scrap) and reset (items) for whole codelists
+    - insert (parent path, row, items), remove (parent path, row, count) for added and removed items
+    - text (path, column, text), check (path, state) and row (path, texts, state) for changed items
+    - database (file) for databases
+    - editor (name, author, code, comment, dirty), field (name, value) and edit (field, position, removed, added) for
+      code editors
+    - close for any window
+    """
+    def __init__(self, file: str = None):
+        self.file = file if file else globalstuff.journalfile
+        self.seq = 0
+        self.count = 0
+        self.numbers = {}  # Window -> number
+        self.meta = {}  # Codelist -> last recorded (game id, game name, scrap)
+        self.dirty = {}  # Code editor -> last recorded dirty flag
+
+        # A base left by an earlier session would hide the new records, as their numbers start over
+        if os.path.isfile(BaseFile(self.file)):
+            os.remove(BaseFile(self.file))
+
+        # Start the writer
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.Write, daemon=True)
+        self.thread.start()
+
+        # Game ids and scraps don't signal when they change, so check them every now and then
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.CheckMeta)
+        self.timer.start(1000)
+
+    def Record(self, op: str, number: int, *args):
+        self.seq += 1
+        self.queue.put((self.seq, op, number) + args)
+
+    def Watch(self, widget: QtWidgets.QWidget):
+        """
+        Starts recording the changes to a newly opened window.
+        """
+        self.count += 1
+        number = self.numbers[widget] = self.count
+
+        # Codelist, record its contents once and then follow the model
+        if isinstance(widget, CodeList):
+            self.meta[widget] = (widget.gameID, widget.gameName, widget.scrap)
+            self.Record('open', number, *self.meta[widget], self.ListState(widget))
+            model = widget.TreeWidget.model()
+            model.rowsInserted.connect(lambda parent, first, last: self.HandleInsert(widget, parent, first, last))
+            model.rowsRemoved.connect(lambda parent, first, last: self.HandleRemove(widget, parent, first, last))
+            model.dataChanged.connect(lambda topleft, bottomright, roles: self.HandleData(widget, topleft, bottomright,
+                                                                                          roles))
+            model.layoutChanged.connect(lambda *args: self.HandleReset(widget))
+            model.modelReset.connect(lambda *args: self.HandleReset(widget))
+
+        # Database, it can't be changed so just remember the file
+        elif hasattr(widget, 'dbfile'):
+            self.Record('database', number, os.path.abspath(widget.dbfile))
+
+        # Code editor, record the text edits as they're made
+        elif hasattr(widget, 'parentz'):
+            self.dirty[widget] = widget.dirty
+            self.Record('editor', number, widget.CodeName.text(), widget.CodeAuthor.text(),
+                        widget.CodeContent.toPlainText(), widget.CodeComment.toPlainText(), widget.dirty)
+            widget.CodeName.textChanged.connect(lambda text: self.Record('field', number, 'name', text))
+            widget.CodeAuthor.textChanged.connect(lambda text: self.Record('field', number, 'author', text))
+            for field, box in (('code', widget.CodeContent), ('comment', widget.CodeComment)):
+                # A lambda holding the document would be a reference cycle with its own sender, which the garbage
+                # collector breaks by dropping the connection
+                box.document().contentsChange.connect(functools.partial(self.HandleEdit, number, field, box))
+                box.modificationChanged.connect(lambda modified: self.CheckDirty(widget))
+            widget.CodeName.textEdited.connect(lambda text: self.CheckDirty(widget))
+            widget.CodeAuthor.textEdited.connect(lambda text: self.CheckDirty(widget))
+
+    def Unwatch(self, widget: QtWidgets.QWidget):
+        """
+        Records a window being closed.
+        """
+        number = self.numbers.pop(widget, None)
+        if number:
+            self.meta.pop(widget, None)
+            self.dirty.pop(widget, None)
+            self.Record('close', number)
+
+    def ListState(self, codelist: CodeList):
+        return [ItemState(item) for item in ChildItems(codelist.TreeWidget.invisibleRootItem())]
+
+    def HandleReset(self, codelist: CodeList):
+        """
+        Records the whole list again, after it was sorted or rearranged. Closed windows are left alone, as the tree
+        might be going away.
+        """
+        if codelist in self.numbers:
+            self.Record('reset', self.numbers[codelist], self.ListState(codelist))
+
+    def HandleInsert(self, codelist: CodeList, parent: QtCore.QModelIndex, first: int, last: int):
+        """
+        Records the inserted items, along with their children.
+        """
+        if codelist not in self.numbers:
+            return
+        tree = codelist.TreeWidget
+        model = tree.model()
+        states = [ItemState(tree.itemFromIndex(model.index(row, 0, parent))) for row in range(first, last + 1)]
+        self.Record('insert', self.numbers[codelist], IndexPath(parent), first, states)
+
+    def HandleRemove(self, codelist: CodeList, parent: QtCore.QModelIndex, first: int, last: int):
+        if codelist in self.numbers:
+            self.Record('remove', self.numbers[codelist], IndexPath(parent), first, last - first + 1)
+
+    def HandleData(self, codelist: CodeList, topleft: QtCore.QModelIndex, bottomright: QtCore.QModelIndex,
+                   roles: list):
+        """
+        Records the changed texts and check states. Other roles (icons, cached codes...) aren't worth saving. If the
+        roles aren't given, the whole item is recorded.
+        """
+        if codelist not in self.numbers:
+            return
+
+        # Initialize vars
+        number = self.numbers[codelist]
+        tree = codelist.TreeWidget
+        model = tree.model()
+        parent = IndexPath(topleft.parent())
+
+        for row in range(topleft.row(), bottomright.row() + 1):
+            item = tree.itemFromIndex(model.index(row, 0, topleft.parent()))
+            path = parent + [row]
+            if not roles:
+                self.Record('row', number, path, tuple(item.text(i) for i in range(5)), int(item.checkState(0)))
+                continue
+            if Qt.DisplayRole in roles:
+                for column in range(topleft.column(), min(bottomright.column(), 4) + 1):
+                    self.Record('text', number, path, column, item.text(column))
+            if Qt.CheckStateRole in roles:
+                self.Record('check', number, path, int(item.checkState(0)))
+
+    def HandleEdit(self, number: int, field: str, box: QtWidgets.QPlainTextEdit, position: int, removed: int,
+                   added: int):
+        """
+        Records an edit to a code editor's code or comment. Only the added text is copied.
+        """
+        document = box.document()
+
+        # Paragraph separators are how Qt calls new lines
+        cursor = QtGui.QTextCursor(document)
+        cursor.setPosition(min(position + added, document.characterCount() - 1))
+        cursor.setPosition(position, QtGui.QTextCursor.KeepAnchor)
+        self.Record('edit', number, field, position, removed, cursor.selectedText().replace('\u2029', '\n'))
+
+    def CheckDirty(self, editor: CodeEditor):
+        if editor in self.dirty and self.dirty[editor] != editor.dirty:
+            self.dirty[editor] = editor.dirty
+            self.Record('field', self.numbers[editor], 'dirty', editor.dirty)
+
+    def CheckMeta(self):
+        for codelist, meta in self.meta.items():
+            current = (codelist.gameID, codelist.gameName, codelist.scrap)
+            if current != meta:
+                self.meta[codelist] = current
+                self.Record('meta', self.numbers[codelist], *current)
+
+    def Write(self):
+        """
+        The writer thread. Appends the records to the journal as they come, and folds the journal into the base once it
+        gets too big.
+        """
+        state = JournalState()
+        with open(self.file, 'wb') as f:
+            while True:
+                # Write all the pending records, then flush them together
+                record = self.queue.get()
+                while record is not None:
+                    payload = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+                    f.write(header.pack(len(payload), zlib.crc32(payload)))
+                    f.write(payload)
+                    state.ApplySafely(record)
+                    try:
+                        record = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                f.flush()
+                if record is None:
+                    return
+
+                # Compact. The base goes first, so a crash in between only leaves records which are already in it.
+                if f.tell() > compactsize:
+                    SaveBase(state, BaseFile(self.file))
+                    f.seek(0)
+                    f.truncate()
+
+    def Close(self):
+        """
+        Stops recording and deletes the journal, as there's nothing to recover after a clean exit.
+        """
+        self.timer.stop()
+        self.numbers.clear()
+        self.meta.clear()
+        self.dirty.clear()
+        self.queue.put(None)
+        self.thread.join()
+        for file in (self.file, BaseFile(self.file)):
+            if os.path.isfile(file):
+                os.remove(file)
+
+
+def SaveBase(state: JournalState, file: str):
+    data = zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+    with open(file + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(file + '.tmp', file)
+
+
+def Recover(file: str = None):
+    """
+    Rebuilds the state left by a crashed session from its journal. Returns None if there's no journal or nothing in it
+    to reopen.
+    """
+    # Initialize vars
+    file = file if file else globalstuff.journalfile
+    state = JournalState()
+    if not os.path.isfile(file):
+        return None
+
+    # Load the base
+    try:
+        with open(BaseFile(file), 'rb') as f:
+            state = pickle.loads(zlib.decompress(f.read()))
+    except (OSError, zlib.error, pickle.UnpicklingError, EOFError, AttributeError, ImportError, IndexError):
+        pass
+
+    # Replay the journal, skipping the records already in the base and stopping at the first damaged one
+    try:
+        with open(file, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return state
+    position = 0
+    while position + header.size <= len(data):
+        length, checksum = header.unpack_from(data, position)
+        payload = data[position + header.size:position + header.size + length]
+        if len(payload) != length or zlib.crc32(payload) != checksum:
+            break
+        record = pickle.loads(payload)
+        if record[0] > state.seq:
+            state.ApplySafely(record)
+        position += header.size + length
+
+    # Nothing worth reopening
+    if not state.lists and not state.databases and not any(x['dirty'] for x in state.editors.values()):
+        return None
+    return state
+
+
+def RestoreState(state: JournalState):
+    """
+    Reopens the windows recovered from the journal. Code editors are only reopened if they had unsaved changes, and
+    they're no longer linked to their code.
+    """
+    for gameid, gamename, scrap, items in state.lists.values():
+        RestoreCodelist(gameid, gamename, scrap, items)
+
+    for file in state.databases.values():
+        if os.path.isfile(file):
+            from database import Database  # Pulls in lxml, so only load it when needed
+            globalstuff.mainWindow.CreateNewWindow(Database(file))
+
+    for fields in filter(lambda x: x['dirty'], state.editors.values()):
+        editor = globalstuff.mainWindow.CreateNewWindow(CodeEditor())
+        editor.CodeName.setText(fields['name'])
+        editor.CodeAuthor.setText(fields['author'])
+        editor.CodeContent.setPlainText(fields['code'])
+        editor.CodeComment.setPlainText(fields['comment'])
+        editor.ParseAuthor(fields['author'])
+        editor.SetDirty()
+        if globalstuff.journal:
+            globalstuff.journal.CheckDirty(editor)
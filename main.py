@@ -6,17 +6,20 @@ import os
 import re
 import sys
 
-from PyQt5 import QtWidgets, QtGui
-from PyQt5.Qt import Qt
+from PyQt5 import QtCore, QtWidgets, QtGui
+from PyQt5.QtCore import Qt
 
-import exporting
-import importing
 import globalstuff
+import journal
+import registry
 from codeeditor import CodeEditor
 from codelist import CodeList
-from database import Database
+from instance import InstanceServer, SendFiles
+from session import SaveSession, RestoreSession
 from options import SettingsWidget, SetDarkPalette, readconfig, writeconfig
+from profiler import Profiled, StatsDialog
 from titles import DownloadError
+from watchdog import Watchdog
 from widgets import ModdedSubWindow, ModdedTreeWidgetItem, ModdedMdiArea
 from windowstuff import TileVertical, TileHorizontal, MinimizeAll, CloseAll, Half
 
@@ -30,7 +33,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.setCentralWidget(self.mdi)
 
         # Create the menubar
-        self.optgct = self.optini = self.opttxt = None
+        self.optgct = self.optgctopt = self.optini = self.opttxt = self.optall = None
         self.createMenubar()
 
         # Add the program icon
@@ -41,7 +44,37 @@ class MainWindow(QtWidgets.QMainWindow):
         self.setWindowTitle('Code Manager Reborn')
         self.showMaximized()
 
-        # Check for the wiitdb.txt file
+        # Check for the wiitdb.txt file once the window is up
+        QtCore.QTimer.singleShot(0, self.CheckTitles)
+
+        # Save the session every now and then, if enabled
+        self.sessiontimer = QtCore.QTimer(self)
+        self.sessiontimer.timeout.connect(self.AutoSaveSession)
+        self.UpdateSessionTimer()
+
+    def UpdateSessionTimer(self):
+        """
+        Applies the session autosave interval, in minutes. 0 disables it.
+        """
+        if globalstuff.sessioninterval:
+            self.sessiontimer.start(globalstuff.sessioninterval * 60000)
+        else:
+            self.sessiontimer.stop()
+
+    def AutoSaveSession(self):
+        """
+        Saves the session, unless restoring it is disabled. Failing to do so isn't worth bothering the user about.
+        """
+        if globalstuff.restoresession:
+            try:
+                SaveSession()
+            except OSError:
+                pass
+
+    def CheckTitles(self):
+        """
+        Offers to download the title database if it's missing.
+        """
         if not os.path.isfile(globalstuff.wiitdb):
             DownloadError()
 
@@ -67,12 +100,15 @@ class MainWindow(QtWidgets.QMainWindow):
         # Export menu
         exports = file.addMenu('Export All')
         self.optgct = exports.addAction('GCT', lambda: self.exportMultiple('gct'))
+        self.optgctopt = exports.addAction('GCT (Optimized)', lambda: self.exportMultiple('gct', optimize=True))
         self.opttxt = exports.addAction('TXT', lambda: self.exportMultiple('txt'))
         self.optini = exports.addAction('INI', lambda: self.exportMultiple('ini'))
+        self.optall = exports.addAction('All Formats', lambda: self.exportMultiple('gct', 'txt', 'ini'))
         file.addSeparator()
 
         # Settings
         file.addAction('Options', lambda: SettingsWidget().exec_())
+        file.addAction('Statistics', lambda: StatsDialog().exec_())
 
         # Exit
         file.addAction('Exit', self.close)
@@ -100,9 +136,17 @@ class MainWindow(QtWidgets.QMainWindow):
         # Mass minimize/close
         ws.addAction('Minimize All', MinimizeAll)
         ws.addAction('Close All', CloseAll)
+        ws.addSeparator()
+
+        # Memory usage
+        ws.addAction('Memory Report', self.ShowMemoryReport)
 
         # Update the menu
-        self.updateboxes()
+        self.UpdateExportAll()
+
+    def ShowMemoryReport(self):
+        from memory import MemoryDialog  # Only needed here
+        MemoryDialog().exec_()
 
     def openDatabase(self):
         """
@@ -110,6 +154,7 @@ class MainWindow(QtWidgets.QMainWindow):
         """
         name = QtWidgets.QFileDialog.getOpenFileName(self, 'Open Database', '', 'Code Database (*.xml)')[0]
         if name:
+            from database import Database  # Pulls in lxml, so only load it when needed
             self.CreateNewWindow(Database(name))
 
     def openCodelist(self, source: QtWidgets.QTreeWidget = None, files: list = None):
@@ -125,6 +170,7 @@ class MainWindow(QtWidgets.QMainWindow):
                                                            'Dolphin Executable (*.dol)')[0]
 
         # Run the correct function based on the chosen format
+        import importing
         for file in files:
             func = getattr(importing, 'Import' + os.path.splitext(file)[1].lstrip('.').upper(), None)
             if func:
@@ -134,43 +180,65 @@ class MainWindow(QtWidgets.QMainWindow):
         """
         Opens a QFileDialog to save a single codelist to a file.
         """
-        file = QtWidgets.QFileDialog.getSaveFileName(self, 'Save Codelist To', source.gameID,
-                                                     'Gecko Code Table (*.gct);;'
-                                                     'Text File (*.txt);;'
-                                                     'Dolphin INI (*.ini);;')[0]
-
-        # Run the correct function based on the chosen format
-        func = getattr(exporting, 'Export' + os.path.splitext(file)[1].lstrip('.').upper(), None)
-        if func:
-            success = func(file, source, False)
+        file, filt = QtWidgets.QFileDialog.getSaveFileName(self, 'Save Codelist To', source.gameID,
+                                                           'Gecko Code Table (*.gct);;'
+                                                           'Optimized Gecko Code Table (*.gct);;'
+                                                           'Text File (*.txt);;'
+                                                           'Dolphin INI (*.ini);;'
+                                                           'All Formats (*.gct *.txt *.ini)')
+
+        # Export to every format at once, using the given name without extension for all of them
+        import exporting
+        results = {}
+        savings = {}
+        if file and filt.startswith('Optimized'):
+            results = exporting.ExportFiles({'gct': file}, source, False, savings)
+        elif file and filt.startswith('All Formats'):
+            base = os.path.splitext(file)[0]
+            results = exporting.ExportFiles({ext: '.'.join([base, ext]) for ext in ('gct', 'txt', 'ini')}, source,
+                                            False)
+
+        # Otherwise run the correct function based on the chosen format
+        else:
+            func = getattr(exporting, 'Export' + os.path.splitext(file)[1].lstrip('.').upper(), None)
+            if func:
+                results = func(file, source, False)
 
-            # Inform the user
-            if success:
-                QtWidgets.QMessageBox.information(self, 'Export Complete', 'List exported succesfully!')
+        # Inform the user
+        if results and all(results.values()):
+            QtWidgets.QMessageBox.information(self, 'Export Complete',
+                                              exporting.ResultText(results) + exporting.SavingsText(savings))
 
-    def exportMultiple(self, ext: str):
+    def exportMultiple(self, *exts: str, optimize: bool = False):
         """
-        Exports all the currently opened codelists at once to the given format. Filename defaults to the game id.
+        Exports all the currently opened codelists at once to the given formats. Filename defaults to the game id. GCTs
+        can also be optimized.
         """
         # Get destination and codelists
         dest = QtWidgets.QFileDialog.getExistingDirectory(self, 'Save all Codelists to', '', QtWidgets.QFileDialog.ShowDirsOnly)
-        success = total = 0
+        jobs = []
         overwrite = permanent = False
 
         # Do the thing
         if dest:
-            for window in filter(lambda x: isinstance(x.widget(), CodeList), self.mdi.subWindowList()):
+
+            # Make every decision before exporting anything, so the workers never have to wait for the user. Files
+            # which will be written by an earlier job count as already existing.
+            for codelist in registry.codelists:
 
                 # Initialize vars
-                filename = os.path.join(dest, '.'.join([window.widget().gameID, ext]))
+                filenames = {ext: os.path.join(dest, '.'.join([codelist.gameID, ext])) for ext in exts}
+                planned = [filename for job in jobs for filename in job[0].values()]
+                exists = lambda: any(os.path.isfile(f) or f in planned for f in filenames.values())
                 i = 2
 
                 # If the file already exists, ask the user what to do
-                if os.path.isfile(filename) and not permanent:
+                if exists() and not permanent:
                     msgbox = QtWidgets.QMessageBox(self)
                     msgbox.setIcon(QtWidgets.QMessageBox.Question)
                     msgbox.setWindowTitle('Overwrite file?')
-                    msgbox.setText(os.path.basename(filename) + ' already exists. Overwrite?')
+                    msgbox.setText(' / '.join(os.path.basename(f) for f in filenames.values()) +
+                                   ' already exists. Overwrite?')
                     msgbox.setStandardButtons(QtWidgets.QMessageBox.YesToAll | QtWidgets.QMessageBox.Yes |
                                               QtWidgets.QMessageBox.No | QtWidgets.QMessageBox.NoToAll |
                                               QtWidgets.QMessageBox.Ignore)
@@ -184,71 +252,53 @@ class MainWindow(QtWidgets.QMainWindow):
 
                 # If we don't want to overwrite, check that the file doesn't exist and if so bump up the number
                 if not overwrite:
-                    while os.path.isfile(filename):
-                        filename = os.path.join(dest, '{}_{}.{}'.format(window.widget().gameID, i, ext))
+                    while exists():
+                        filenames = {ext: os.path.join(dest, '{}_{}.{}'.format(codelist.gameID, i, ext))
+                                     for ext in exts}
                         i += 1
-
-                # Choose the correct function based on the provided extension
-                func = getattr(exporting, 'Export' + ext.upper(), None)
-                if func:
-                    success += func(filename, window.widget(), True)
-                total += 1
+                jobs.append((filenames, codelist))
 
                 # Reset overwrite flag is permanent is not active
                 if not permanent:
                     overwrite = False
 
+            # Export everything at once
+            import exporting
+            savings = {} if optimize else None
+            results = exporting.ExportMultiple(jobs, savings)
+            success = len([result for result in results if all(result.values())])
+            skipped = len([result for result in results if set(result.values()) == {exporting.SKIPPED}])
+            empty = len([result for result in results if result.get('gct') == exporting.EMPTY])
+
             # Inform the user
             if success:
-                QtWidgets.QMessageBox.information(self, 'Export Complete', '{}/{} lists exported successfully!'.format(success, total))
-
-    def updateboxes(self):
+                msg = '{}/{} lists exported successfully!'.format(success, len(jobs))
+                if skipped:
+                    msg += ' {} of them were already up to date and have been skipped.'.format(skipped)
+                if empty:
+                    msg += ' {} of them had no valid enabled codes, so their GCT was not created.'.format(empty)
+                if savings:
+                    msg += exporting.SavingsText(savings)
+                QtWidgets.QMessageBox.information(self, 'Export Complete', msg)
+
+    def UpdateExportAll(self):
         """
-        Looks for opened codelist sub-windows and adds them to each database' combo box.
+        Enables the "Export All" options if there's at least one opened codelist.
         """
-        # Initialize vars
-        dblist = []
-        entries = []
-
-        # Fill the two lists
-        for window in self.mdi.subWindowList():
-            if isinstance(window.widget(), CodeList):
-                entries.append(window.widget())
-            else:
-                dblist.append(window.widget())
-
-        # Update the "Export All" option
-        notempty = bool(entries)
+        notempty = bool(registry.codelists)
         self.optgct.setEnabled(notempty)
+        self.optgctopt.setEnabled(notempty)
         self.opttxt.setEnabled(notempty)
         self.optini.setEnabled(notempty)
+        self.optall.setEnabled(notempty)
 
-        # Begin updating each combo box
-        for window in dblist:
-
-            # Process the combo box in reverse, so we can safely delete items without worrying about wrong indexes
-            for i in reversed(range(1, window.Combox.count())):
-                item = window.Combox.itemData(i)
-                if item.parentWidget() not in self.mdi.subWindowList():
-                    window.Combox.removeItem(i)
-                else:
-                    # Sometimes this fails, so i added an except because i'm lame
-                    try:
-                        entries.remove(item)
-                    except ValueError:
-                        continue
-
-            # Add the remaining windows if they meet the condition
-            for entry in entries:
-                window.Combox.addItem(entry.windowTitle().lstrip('Codelist - '), entry)  # Only keep game name and id
-
+    @Profiled('Code Lookup', lambda result, *args: {'windows': len(registry.databases) + len(registry.codelists)})
     def CodeLookup(self, item: QtWidgets.QTreeWidgetItem, codelist: QtWidgets.QTreeWidget, gid: str):
         """
         Looks for a possible match in opened windows with the same game id.
         """
         # Initialize vars
-        wlist = [w.widget() for w in self.mdi.subWindowList() if isinstance(w.widget(), Database)
-                 or isinstance(w.widget(), CodeList) and w.widget().TreeWidget is not codelist]
+        wlist = list(registry.databases) + [w for w in registry.codelists if w.TreeWidget is not codelist]
         lsplt = re.split('[ \n]', item.text(1))
         totalen = len(lsplt)
 
@@ -314,7 +364,7 @@ class MainWindow(QtWidgets.QMainWindow):
         Overrides the close event to warn the user of opened lists/codes.
         """
         # Check if the warning is disabled and that we have any code list/editor open
-        if not globalstuff.nowarn and len([w for w in self.mdi.subWindowList() if isinstance(w.widget(), CodeList) or isinstance(w.widget(), CodeEditor)]):
+        if not globalstuff.nowarn and (registry.codelists or registry.editors):
 
             # Raise awareness!
             msgbox = QtWidgets.QMessageBox(self)
@@ -333,13 +383,22 @@ class MainWindow(QtWidgets.QMainWindow):
             if ret == QtWidgets.QMessageBox.No:
                 e.ignore()
                 return
+
+        # Save the session before the windows are gone. Then the journal is no longer needed.
+        self.AutoSaveSession()
+        if globalstuff.journal:
+            globalstuff.journal.Close()
+            globalstuff.journal = None
         e.accept()
 
     def CreateNewWindow(self, widget: QtWidgets.QWidget):
         win = ModdedSubWindow(isinstance(widget, CodeList))
         win.setWidget(widget)
         self.mdi.addSubWindow(win)
-        self.updateboxes()
+        registry.AddWindow(widget)
+        if globalstuff.journal:
+            globalstuff.journal.Watch(widget)
+        self.UpdateExportAll()
         win.show()
         return widget
 
@@ -350,19 +409,39 @@ def main():
     config = configparser.ConfigParser()
     readconfig(config)
 
-    # Start the application
+    # If the program is already running, let it open the files passed through the shell and quit
+    flist = [os.path.abspath(file) for file in sys.argv[1:] if os.path.isfile(file)]
+    if globalstuff.singleinstance and SendFiles(flist):
+        sys.exit(0)
+
+    # Start the application. If another copy started at the same time and got to listen first, hand it the files too.
     globalstuff.app = QtWidgets.QApplication(sys.argv)
+    server = InstanceServer() if globalstuff.singleinstance else None
+    if server and not server.isListening():
+        if SendFiles(flist):
+            sys.exit(0)
+        server = None
     globalstuff.mainWindow = MainWindow()
+    globalstuff.watchdog = Watchdog()
 
     # Add the empty icon
     icon = QtGui.QPixmap(1, 1)
     icon.fill(Qt.transparent)
     globalstuff.empty = QtGui.QIcon(icon)
 
-    # Open codelists passed through the shell
-    flist = [file for file in sys.argv[1:] if os.path.isfile(file)]
+    # If the last session crashed, bring back what it had from its journal. Otherwise reopen the last session. The
+    # codelists passed through the shell come after, once the window is up. Separate copies of the program would share
+    # the journal, so it's only kept when there's a single one.
+    usejournal = globalstuff.usejournal and server is not None
+    recovered = journal.Recover() if usejournal else None
+    if usejournal:
+        globalstuff.journal = journal.Journal()
+    if recovered:
+        QtCore.QTimer.singleShot(0, lambda: journal.RestoreState(recovered))
+    elif globalstuff.restoresession:
+        QtCore.QTimer.singleShot(0, RestoreSession)
     if flist:
-        globalstuff.mainWindow.openCodelist(None, flist)
+        QtCore.QTimer.singleShot(0, lambda: globalstuff.mainWindow.openCodelist(None, flist))
 
     # Apply theme if dark mode is enabled
     if globalstuff.theme == 'dark':
@@ -370,6 +449,9 @@ def main():
 
     # Execute
     ret = globalstuff.app.exec_()
+    if server:
+        server.close()
+    globalstuff.watchdog.Stop()
 
     # Update config
     writeconfig(config)
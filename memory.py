@@ -0,0 +1,237 @@
+"""
+Estimates how much memory each opened window takes, so the heaviest ones can be found and closed. Most of it is held by
+Qt (tree items and text documents), which Python can't see, so it's estimated from the amount of items and text. If
+tracemalloc is tracing (either turned on from the report, or with the PYTHONTRACEMALLOC environment variable), the
+Python allocations made while loading each window are added to the report.
+"""
+import functools
+import os
+import weakref
+
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import Qt
+
+import globalstuff
+import registry
+from common import WalkItems
+
+# Rough size of a tree item with its columns and Python wrapper, and of a line in a code editor with its highlighting.
+# Measured on 64-bit Linux, good enough to compare windows.
+itemoverhead = 1000
+blockoverhead = 500
+
+# Window -> bytes allocated by Python while loading it. Weak, so it doesn't keep closed windows alive.
+loaded = weakref.WeakKeyDictionary()
+
+
+def TrackLoad(getwindow):
+    """
+    Decorator for the functions which load windows. If tracemalloc is tracing, the memory allocated during the call is
+    added to the window returned by getwindow, which receives the function's result followed by its arguments.
+    """
+    def Decorator(func):
+        @functools.wraps(func)
+        def Wrapper(*args, **kwargs):
+            import tracemalloc  # Slows down startup a bit, so only load it once a window is opened
+            if not tracemalloc.is_tracing():
+                return func(*args, **kwargs)
+            before = tracemalloc.get_traced_memory()[0]
+            result = func(*args, **kwargs)
+            window = getwindow(result, *args, **kwargs)
+            if window is not None:
+                loaded[window] = loaded.get(window, 0) + tracemalloc.get_traced_memory()[0] - before
+            return result
+        return Wrapper
+    return Decorator
+
+
+def LastCodelist(result, filename: str, codelist=None):
+    """
+    TrackLoad helper for the importers, which create a new codelist if none is given.
+    """
+    return codelist if codelist else next(reversed(registry.codelists), None)
+
+
+def TreeUsage(tree: QtWidgets.QTreeWidget):
+    """
+    Returns the amount of items in the tree, the bytes used by their text (stored as UTF-16) and those used by the
+    compiled codes cached in them.
+    """
+    items = textbytes = cachebytes = 0
+    for item in WalkItems(tree.invisibleRootItem()):
+        items += 1
+        textbytes += sum(len(item.text(i)) for i in range(5)) * 2
+        compiled = item.data(1, Qt.UserRole)
+        if compiled and compiled[0]:
+            cachebytes += len(compiled[0])
+    return items, textbytes, cachebytes
+
+
+def WindowUsage(widget: QtWidgets.QWidget):
+    """
+    Returns a dict describing the window's memory usage.
+    """
+    if hasattr(widget, 'parentz'):
+        kind = 'Code Editor'
+        fields = (widget.CodeName.text(), widget.CodeAuthor.text(), widget.CodeContent.toPlainText(),
+                  widget.CodeComment.toPlainText())
+        items = widget.CodeContent.document().blockCount() + widget.CodeComment.document().blockCount()
+        textbytes = sum(map(len, fields)) * 2
+        cachebytes = 0
+        estimate = textbytes + items * blockoverhead
+    else:
+        kind = 'Database' if hasattr(widget, 'dbfile') else 'Codelist'
+        items, textbytes, cachebytes = TreeUsage(widget.TreeWidget)
+        estimate = items * itemoverhead + textbytes + cachebytes
+
+    return {'window': widget.windowTitle().lstrip('*'), 'type': kind, 'items': items, 'text': textbytes,
+            'cache': cachebytes, 'loaded': loaded.get(widget), 'estimate': estimate}
+
+
+def Usage():
+    """
+    Returns (window, usage) pairs for the opened windows, biggest first.
+    """
+    widgets = [window.widget() for window in globalstuff.mainWindow.mdi.subWindowList()]
+
+    # Forget the windows which were closed
+    for widget in list(loaded):
+        if widget not in widgets:
+            del loaded[widget]
+
+    return sorted(((widget, WindowUsage(widget)) for widget in widgets), key=lambda x: x[1]['estimate'], reverse=True)
+
+
+def Report(usage: list = None):
+    """
+    Returns the usage of every opened window, biggest first, along with the process' totals.
+    """
+    import tracemalloc
+    windows = [x[1] for x in (usage if usage is not None else Usage())]
+    return {'windows': windows, 'estimate': sum(x['estimate'] for x in windows), 'process': ProcessMemory(),
+            'traced': tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None}
+
+
+def ProcessMemory():
+    """
+    Returns the process' resident memory in bytes, or None if it can't be found.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import ctypes  # Windows only
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + \
+                       [(name, ctypes.c_size_t) for name in ('PeakWorkingSetSize', 'WorkingSetSize',
+                                                             'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                                                             'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage',
+                                                             'PagefileUsage', 'PeakPagefileUsage')]
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+    except (ImportError, AttributeError, OSError):
+        pass
+    return None
+
+
+def Size(value):
+    """
+    Formats a byte count for the report.
+    """
+    if value is None:
+        return '-'
+    return '{:,.1f} KB'.format(value / 1024) if value < 1 << 20 else '{:,.1f} MB'.format(value / (1 << 20))
+
+
+class MemoryDialog(QtWidgets.QDialog):
+    """
+    Shows the memory report, with buttons to close the heaviest windows and to save the report.
+    """
+    def __init__(self):
+        super().__init__()
+
+        # Add the totals and the table
+        self.Totals = QtWidgets.QLabel()
+        self.Table = QtWidgets.QTreeWidget()
+        self.Table.setHeaderLabels(['Window', 'Type', 'Items', 'Text', 'Compiled Codes', 'Loaded', 'Estimate'])
+        self.Table.setRootIsDecorated(False)
+        self.Table.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.Table.itemSelectionChanged.connect(lambda: self.CloseButton.setEnabled(bool(self.Table.selectedItems())))
+
+        # Add the buttons
+        self.RefreshButton = QtWidgets.QPushButton('Refresh')
+        self.RefreshButton.clicked.connect(self.Refresh)
+        self.TraceButton = QtWidgets.QPushButton('Track Loading')
+        self.TraceButton.setCheckable(True)
+        self.TraceButton.setToolTip('Records the Python memory allocated while opening windows, from now on. Makes '
+                                    'loading slower.')
+        self.TraceButton.toggled.connect(self.HandleTrace)
+        self.CloseButton = QtWidgets.QPushButton('Close Selected')
+        self.CloseButton.setEnabled(False)
+        self.CloseButton.clicked.connect(self.HandleClose)
+        self.ExportButton = QtWidgets.QPushButton('Save as JSON')
+        self.ExportButton.clicked.connect(self.HandleExport)
+
+        # Make a layout and set it
+        L = QtWidgets.QGridLayout()
+        L.addWidget(self.Totals, 0, 0, 1, 4)
+        L.addWidget(self.Table, 1, 0, 1, 4)
+        L.addWidget(self.RefreshButton, 2, 0)
+        L.addWidget(self.TraceButton, 2, 1)
+        L.addWidget(self.CloseButton, 2, 2)
+        L.addWidget(self.ExportButton, 2, 3)
+        self.setLayout(L)
+        self.setWindowTitle('Memory Report')
+        self.resize(800, 400)
+        self.Refresh()
+
+    def Refresh(self):
+        usages = Usage()
+        report = Report(usages)
+        self.TraceButton.setChecked(report['traced'] is not None)
+
+        # Fill the table
+        self.Table.clear()
+        for widget, usage in usages:
+            item = QtWidgets.QTreeWidgetItem([usage['window'], usage['type'], str(usage['items'])] +
+                                             [Size(usage[key]) for key in ('text', 'cache', 'loaded', 'estimate')])
+            item.setData(0, Qt.UserRole, widget)
+            self.Table.addTopLevelItem(item)
+        for column in range(self.Table.columnCount()):
+            self.Table.resizeColumnToContents(column)
+
+        # Show the totals
+        text = 'Estimated for the windows: {} - Process: {}'.format(Size(report['estimate']), Size(report['process']))
+        if report['traced'] is not None:
+            text += ' - Traced by Python: {}'.format(Size(report['traced']))
+        self.Totals.setText(text)
+
+    def HandleTrace(self, checked: bool):
+        import tracemalloc
+        if checked and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not checked and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            loaded.clear()
+
+    def HandleClose(self):
+        for item in self.Table.selectedItems():
+            item.data(0, Qt.UserRole).parentWidget().close()
+        self.Refresh()
+
+    def HandleExport(self):
+        file = QtWidgets.QFileDialog.getSaveFileName(self, 'Save Memory Report', 'memory.json', 'JSON (*.json)')[0]
+        if file:
+            import json  # Only needed here
+            try:
+                with open(file, 'w') as f:
+                    json.dump(Report(), f, indent=2)
+            except OSError:
+                QtWidgets.QMessageBox.critical(self, 'File Write Error', "Can't write file " + file)
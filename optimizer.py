@@ -0,0 +1,270 @@
+"""
+This file rewrites codes into equivalent ones with less lines, so the GCT is smaller and the codehandler has less work
+to do every frame. Only runs of plain RAM writes are touched; each run is emulated and written back in the shortest
+form. Every optimized code is verified by emulating both versions before being used.
+"""
+import struct
+
+from codetypes import EntryLength, Normalize, IF, ENDIF, TERMINATOR, SETBASE, FLOW, GetCodetype
+
+# RAM writes that can be merged
+mergeable = (0x00, 0x02, 0x04, 0x06)
+
+# Identical bytes needed before a fill write is used instead of being part of a string write
+fillmin = 12
+
+
+def WalkEntries(data: bytes):
+    """
+    Lazily splits a code into its codetypes. Yields (entry, mergeable) pairs, where mergeable tells whether the entry is
+    a RAM write using the base address, made while the base address is known and outside of any conditional block.
+    """
+    # Initialize vars
+    words = list(struct.iter_unpack('>II', data[:len(data) & ~7]))
+    depth = 0
+    known = True
+    i = 0
+
+    while i < len(words):
+        w0, w1 = words[i]
+        codetype = w0 >> 24
+        flags = GetCodetype(w0)[2]
+        length = EntryLength(w0, w1)
+        mergeok = known and not depth and not codetype & 0x10 and Normalize(codetype) in mergeable
+        yield data[i * 8:(i + length) * 8], mergeok
+
+        # Track the conditional blocks. Ifs with the lowest address bit set apply an endif first.
+        if flags & IF:
+            if w0 & 1 and codetype < 0xC0 and depth:
+                depth -= 1
+            depth += 1
+        elif flags & ENDIF:
+            depth = max(0, depth - (w0 & 0xFF))
+        elif flags & SETBASE:
+            known = False
+
+        # The terminators' base address is 64KB aligned, so it's as good as the default one
+        if flags & TERMINATOR:
+            depth = 0
+            known = True
+        elif flags & ENDIF and w1 & 0xFFFF0000:
+            known = True
+        i += length
+
+
+def CanOptimize(data: bytes):
+    """
+    Codes jumping around or using their own location rely on line offsets, so they must be left as they are. Same for
+    truncated codes.
+    """
+    words = list(struct.iter_unpack('>II', data[:len(data) & ~7]))
+    i = 0
+    while i < len(words):
+        w0, w1 = words[i]
+        if GetCodetype(w0)[2] & FLOW or Normalize(w0 >> 24) in (0x46, 0x4E):
+            return False
+        i += EntryLength(w0, w1)
+    return i == len(words) and len(data) % 8 == 0
+
+
+def EmulateWrites(entries: list, memory: dict = None):
+    """
+    Runs the given RAM writes on a blank memory, returning the resulting offset -> byte dict.
+    """
+    memory = {} if memory is None else memory
+    for entry in entries:
+        w0, w1 = struct.unpack_from('>II', entry)
+        codetype = Normalize(w0 >> 24)
+        offset = w0 & 0x1FFFFFF
+
+        if codetype == 0x00:
+            value = bytes([w1 & 0xFF]) * ((w1 >> 16) + 1)
+        elif codetype == 0x02:
+            value = struct.pack('>H', w1 & 0xFFFF) * ((w1 >> 16) + 1)
+        elif codetype == 0x04:
+            value = struct.pack('>I', w1)
+        else:
+            value = entry[8:8 + w1]
+
+        for i, byte in enumerate(value):
+            memory[offset + i] = byte
+    return memory
+
+
+def Segments(memory: dict):
+    """
+    Groups the written memory into (offset, bytes) pairs of contiguous bytes.
+    """
+    segments = []
+    start = previous = None
+    buffer = bytearray()
+    for offset in sorted(memory):
+        if previous is None or offset != previous + 1:
+            if buffer:
+                segments.append((start, bytes(buffer)))
+            start = offset
+            buffer = bytearray()
+        buffer.append(memory[offset])
+        previous = offset
+    if buffer:
+        segments.append((start, bytes(buffer)))
+    return segments
+
+
+def WriteEntry(codetype: int, offset: int, w1: int, payload: bytes = b''):
+    """
+    Builds a RAM write. The address' 25th bit goes in the codetype, which is what OR-ing the offset does.
+    """
+    return struct.pack('>II', codetype << 24 | offset, w1) + payload
+
+
+def EncodeSmall(offset: int, data: bytes):
+    """
+    Encodes a few bytes with fill writes and aligned 32, 16 and 8-bit writes.
+    """
+    entries = []
+    i = 0
+    while i < len(data):
+        address = offset + i
+        run = 1
+        while i + run < len(data) and data[i + run] == data[i] and run < 0x10000:
+            run += 1
+
+        if run >= 4:
+            entries.append(WriteEntry(0x00, address, (run - 1) << 16 | data[i]))
+            i += run
+        elif address % 4 == 0 and i + 4 <= len(data):
+            entries.append(WriteEntry(0x04, address, struct.unpack_from('>I', data, i)[0]))
+            i += 4
+        elif address % 2 == 0 and i + 2 <= len(data):
+            entries.append(WriteEntry(0x02, address, struct.unpack_from('>H', data, i)[0]))
+            i += 2
+        else:
+            entries.append(WriteEntry(0x00, address, data[i]))
+            i += 1
+    return entries
+
+
+def EncodeSegment(offset: int, data: bytes):
+    """
+    Encodes a contiguous block of memory with as few lines as possible. Long runs of the same byte become fill writes,
+    the rest is written either as a string write or with EncodeSmall, whichever is shorter.
+    """
+    # Split the segment at the long runs
+    pieces = []
+    i = start = 0
+    while i < len(data):
+        run = 1
+        while i + run < len(data) and data[i + run] == data[i]:
+            run += 1
+        if run >= fillmin:
+            if start < i:
+                pieces.append((start, data[start:i], False))
+            pieces.append((i, data[i:i + run], True))
+            start = i + run
+        i += run
+    if start < len(data):
+        pieces.append((start, data[start:], False))
+
+    # Encode each piece
+    entries = []
+    for position, piece, isfill in pieces:
+        if isfill:
+            for chunk in range(0, len(piece), 0x10000):
+                count = min(0x10000, len(piece) - chunk)
+                entries.append(WriteEntry(0x00, offset + position + chunk, (count - 1) << 16 | piece[0]))
+            continue
+
+        small = EncodeSmall(offset + position, piece)
+        if (len(piece) + 15) // 8 < len(small):  # One line for the codetype, plus one for every 8 bytes
+            entries.append(WriteEntry(0x06, offset + position, len(piece), piece + bytes(-len(piece) % 8)))
+        else:
+            entries.extend(small)
+    return entries
+
+
+def EncodeRun(entries: list):
+    """
+    Rewrites a run of RAM writes, if it saves any lines. Otherwise, the run is returned as is.
+    """
+    # Don't bother if the writes go past what an address can reach
+    memory = EmulateWrites(entries)
+    if max(memory, default=0) > 0x1FFFFFF:
+        return entries
+
+    encoded = [entry for segment in Segments(memory) for entry in EncodeSegment(*segment)]
+    if sum(map(len, encoded)) < sum(map(len, entries)):
+        return encoded
+    return entries
+
+
+def Optimize(data: bytes):
+    """
+    Returns the optimized code. Runs of RAM writes are merged, and full terminators right after an identical one are
+    dropped.
+    """
+    if not CanOptimize(data):
+        return data
+
+    # Initialize vars
+    output = []
+    run = []
+
+    for entry, ismergeable in WalkEntries(data):
+        if ismergeable:
+            run.append(entry)
+            continue
+
+        # Write the pending run
+        if run:
+            output.extend(EncodeRun(run))
+            run = []
+
+        # Another full terminator won't do anything
+        if not (entry[0] == 0xE0 and output and output[-1] == entry):
+            output.append(entry)
+
+    if run:
+        output.extend(EncodeRun(run))
+    return b''.join(output)
+
+
+def Effects(data: bytes):
+    """
+    Describes what a code does: the memory written by each run of RAM writes and every other codetype, in order.
+    Repeated full terminators are only counted once, as they don't do anything.
+    """
+    effects = []
+    memory = {}
+    for entry, ismergeable in WalkEntries(data):
+        if ismergeable:
+            EmulateWrites([entry], memory)
+            continue
+        if memory:
+            effects.append(('memory', sorted(memory.items())))
+            memory = {}
+        if not (entry[0] == 0xE0 and effects and effects[-1] == ('code', entry)):
+            effects.append(('code', entry))
+    if memory:
+        effects.append(('memory', sorted(memory.items())))
+    return effects
+
+
+def Verify(original: bytes, optimized: bytes):
+    """
+    Checks that the two codes do the same thing, by emulating their writes.
+    """
+    return original == optimized or Effects(original) == Effects(optimized)
+
+
+def OptimizeCode(data: bytes, savings: dict):
+    """
+    Optimizes a code, keeping the original if the result doesn't check out. The lines and bytes saved are added to the
+    savings dict.
+    """
+    optimized = Optimize(data)
+    if len(optimized) >= len(data) or not Verify(data, optimized):
+        return data
+    savings['lines'] = savings.get('lines', 0) + (len(data) - len(optimized)) // 8
+    savings['bytes'] = savings.get('bytes', 0) + len(data) - len(optimized)
+    return optimized
@@ -5,9 +5,10 @@ import configparser
 import os
 
 from PyQt5 import QtWidgets
-from PyQt5.Qt import Qt
+from PyQt5.QtCore import Qt
 
 import globalstuff
+from watchdog import minthreshold
 
 
 class SettingsWidget(QtWidgets.QDialog):
@@ -28,6 +29,47 @@ class SettingsWidget(QtWidgets.QDialog):
         self.NoWarnCheckbox.setChecked(globalstuff.nowarn)
         self.NoWarnCheckbox.stateChanged.connect(self.HandleNoWarn)
 
+        # Single instance checkbox
+        self.SingleLabel = QtWidgets.QLabel('Open Files in the Running Window')
+        self.SingleCheckbox = QtWidgets.QCheckBox()
+        self.SingleCheckbox.setChecked(globalstuff.singleinstance)
+        self.SingleCheckbox.stateChanged.connect(self.HandleSingleInstance)
+
+        # Session checkbox and autosave interval
+        self.SessionLabel = QtWidgets.QLabel('Restore Last Session')
+        self.SessionCheckbox = QtWidgets.QCheckBox()
+        self.SessionCheckbox.setChecked(globalstuff.restoresession)
+        self.SessionCheckbox.stateChanged.connect(self.HandleSession)
+        self.IntervalLabel = QtWidgets.QLabel('Save Session Every')
+        self.Interval = QtWidgets.QSpinBox()
+        self.Interval.setRange(0, 1440)
+        self.Interval.setSuffix(' min')
+        self.Interval.setSpecialValueText('Only on Exit')
+        self.Interval.setValue(globalstuff.sessioninterval)
+        self.Interval.valueChanged.connect(self.HandleInterval)
+
+        # Journal checkbox
+        self.JournalLabel = QtWidgets.QLabel('Recover Unsaved Changes After a Crash')
+        self.JournalCheckbox = QtWidgets.QCheckBox()
+        self.JournalCheckbox.setChecked(globalstuff.usejournal)
+        self.JournalCheckbox.stateChanged.connect(self.HandleJournal)
+
+        # Freeze threshold
+        self.StallLabel = QtWidgets.QLabel('Record Freezes Longer Than')
+        self.Stall = QtWidgets.QSpinBox()
+        self.Stall.setRange(minthreshold - 100, 60000)  # The minimum stands for 0
+        self.Stall.setSingleStep(100)
+        self.Stall.setSuffix(' ms')
+        self.Stall.setSpecialValueText('Never')
+        self.Stall.setValue(globalstuff.stallthreshold)
+        self.Stall.valueChanged.connect(self.HandleStall)
+
+        # Profiling checkbox
+        self.ProfilingLabel = QtWidgets.QLabel('Time Operations (see File > Statistics)')
+        self.ProfilingCheckbox = QtWidgets.QCheckBox()
+        self.ProfilingCheckbox.setChecked(globalstuff.profiling)
+        self.ProfilingCheckbox.stateChanged.connect(self.HandleProfiling)
+
         # Theme selector
         self.ThemeLabel = QtWidgets.QLabel('Theme')
         self.Theme = QtWidgets.QComboBox()
@@ -38,12 +80,33 @@ class SettingsWidget(QtWidgets.QDialog):
                 break
         self.Theme.currentIndexChanged.connect(self.HandleThemeChoose)
 
+        # Cost budget selector
+        self.BudgetLabel = QtWidgets.QLabel('Codehandler Cost Budget')
+        self.Budget = QtWidgets.QSpinBox()
+        self.Budget.setRange(1, 10000000)
+        self.Budget.setValue(globalstuff.costbudget)
+        self.Budget.valueChanged.connect(self.HandleBudget)
+
         # Add elements to layout
         L = QtWidgets.QGridLayout()
         L.addWidget(self.NoWarnLabel, 0, 0)
         L.addWidget(self.NoWarnCheckbox, 0, 1)
-        L.addWidget(self.ThemeLabel, 1, 0)
-        L.addWidget(self.Theme, 1, 1)
+        L.addWidget(self.SingleLabel, 1, 0)
+        L.addWidget(self.SingleCheckbox, 1, 1)
+        L.addWidget(self.SessionLabel, 2, 0)
+        L.addWidget(self.SessionCheckbox, 2, 1)
+        L.addWidget(self.IntervalLabel, 3, 0)
+        L.addWidget(self.Interval, 3, 1)
+        L.addWidget(self.JournalLabel, 4, 0)
+        L.addWidget(self.JournalCheckbox, 4, 1)
+        L.addWidget(self.ProfilingLabel, 5, 0)
+        L.addWidget(self.ProfilingCheckbox, 5, 1)
+        L.addWidget(self.StallLabel, 6, 0)
+        L.addWidget(self.Stall, 6, 1)
+        L.addWidget(self.ThemeLabel, 7, 0)
+        L.addWidget(self.Theme, 7, 1)
+        L.addWidget(self.BudgetLabel, 8, 0)
+        L.addWidget(self.Budget, 8, 1)
         self.setLayout(L)
         self.setWindowTitle('Settings')
 
@@ -53,6 +116,31 @@ class SettingsWidget(QtWidgets.QDialog):
     def HandleNoWarn(self, state: int):
         globalstuff.nowarn = bool(state)
 
+    def HandleSingleInstance(self, state: int):
+        globalstuff.singleinstance = bool(state)
+
+    def HandleSession(self, state: int):
+        globalstuff.restoresession = bool(state)
+
+    def HandleInterval(self, value: int):
+        globalstuff.sessioninterval = value
+        globalstuff.mainWindow.UpdateSessionTimer()
+
+    def HandleJournal(self, state: int):
+        globalstuff.usejournal = bool(state)
+
+    def HandleProfiling(self, state: int):
+        globalstuff.profiling = bool(state)
+
+    def HandleStall(self, value: int):
+        globalstuff.stallthreshold = 0 if value == self.Stall.minimum() else value
+
+    def HandleBudget(self, value: int):
+        globalstuff.costbudget = value
+        for window in globalstuff.mainWindow.mdi.subWindowList():
+            if hasattr(window.widget(), 'UpdateLines'):
+                window.widget().UpdateLines()
+
     def HandleThemeChoose(self, index: int):
         globalstuff.theme = self.Theme.itemText(index).lower()
         if globalstuff.theme == 'dark':
@@ -75,6 +163,14 @@ def readconfig(config: configparser.ConfigParser, file='config.ini'):
     # Set the globals
     globalstuff.nowarn = config.getboolean('General', 'NoWarning')
     globalstuff.theme = config['General']['Theme']
+    globalstuff.singleinstance = config.getboolean('General', 'SingleInstance', fallback=True)
+    globalstuff.restoresession = config.getboolean('General', 'RestoreSession', fallback=True)
+    globalstuff.sessioninterval = max(0, config.getint('General', 'SessionInterval', fallback=0))
+    globalstuff.usejournal = config.getboolean('General', 'Journal', fallback=True)
+    globalstuff.profiling = config.getboolean('General', 'Profiling', fallback=False)
+    stallthreshold = config.getint('General', 'StallThreshold', fallback=1000)
+    globalstuff.stallthreshold = max(stallthreshold, minthreshold) if stallthreshold > 0 else 0
+    globalstuff.costbudget = max(1, config.getint('General', 'CostBudget', fallback=globalstuff.costbudget))
 
 
 def writeconfig(config: configparser.ConfigParser, file='config.ini'):
@@ -83,6 +179,13 @@ def writeconfig(config: configparser.ConfigParser, file='config.ini'):
     """
     config.set('General', 'NoWarning', str(globalstuff.nowarn))
     config.set('General', 'Theme', globalstuff.theme)
+    config.set('General', 'SingleInstance', str(globalstuff.singleinstance))
+    config.set('General', 'RestoreSession', str(globalstuff.restoresession))
+    config.set('General', 'SessionInterval', str(globalstuff.sessioninterval))
+    config.set('General', 'Journal', str(globalstuff.usejournal))
+    config.set('General', 'Profiling', str(globalstuff.profiling))
+    config.set('General', 'StallThreshold', str(globalstuff.stallthreshold))
+    config.set('General', 'CostBudget', str(globalstuff.costbudget))
     with open(file, 'w') as file:
         config.write(file)
 
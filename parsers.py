@@ -0,0 +1,358 @@
+"""
+The codelist parsers, without any GUI. Each one reads a file's content and returns the game id it found (or None), the
+parsed codes as CodeNode trees and any additional data to port over. Codes without a name get an empty one, see
+NameCodes. The importers put the results in a codelist, while the batch converter writes them straight to other
+formats, so this must not create any widget.
+"""
+import io
+import locale
+import os
+import re
+import struct
+from itertools import chain
+
+from PyQt5.QtCore import Qt
+
+import globalstuff
+from codetypes import SplitCodes
+from common import CodeNode, AssembleCode, WalkItems
+
+
+class ParseError(Exception):
+    """
+    The file can't be parsed. Title and message are meant for the error dialog.
+    """
+    def __init__(self, title: str, message: str):
+        super().__init__(message)
+        self.title = title
+        self.message = message
+
+
+def CodeItem(name: str, code: str, comment: str, author: str, enabled: bool):
+    return CodeNode((name, code, comment, '', author), Qt.Checked if enabled else Qt.Unchecked)
+
+
+def FileGameID(filename: str):
+    """
+    Regular GCTs and Dolphin INIs are usually named after their game id.
+    """
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def SplitAuthor(name: str):
+    """
+    Splits "name [author]" into its parts.
+    """
+    lspl = name.split(' [')
+    return lspl[0], lspl[1].rstrip(']') if len(lspl) > 1 else ''  # Remove the last character
+
+
+def ParseTXT(data: bytes):
+    """
+    Parses a TXT. This took longer than it should have.
+    """
+    # Initialize vars
+    linerule = re.compile('^(\* )?[\w]{8} [\w]{8}$', re.I)
+    currdepth = 0  # Current depth, used for sub-categories
+    root = CodeNode(None, Qt.Unchecked)
+    parents = {0: root}  # This dict stores the parent for each level. Not the best solution, but it gets the job done.
+    parent = root
+
+    # Detect the file's encoding and split it into groups (there's an empty line between each). This is done because
+    # the original Code Manager saves in UTF-16, which would fuck up the formatting if not decoded. The line endings are
+    # normalized first, so files made on other systems are split correctly.
+    from chardet import detect  # Slow to import, so only load it for the files that need it
+    rawdata = data.decode(detect(data)['encoding'] or 'utf-8', 'ignore').replace('\r\n', '\n').split('\n\n')
+
+    # The first group contains the gameid
+    lines = rawdata.pop(0).splitlines()
+    gameid = lines[0].strip() if lines else ''
+
+    # Begin parsing codes
+    for group in rawdata:
+
+        # Initialize vars
+        name = code = comment = author = ''
+        isenabled = False
+
+        # Parse group
+        for line in group.splitlines():
+            m = re.match(linerule, line)
+
+            # It's a code line
+            if m:
+                if not isenabled and '*' in m[0]:  # Asterisks are used to mark enabled codes, so mark it as such
+                    isenabled = True
+                code = '\n'.join([code, m[0].lstrip('* ')])
+
+            # It's not a code line
+            else:
+                if name:  # We already have a name set, so add this line to the comment
+                    comment = '\n'.join([comment, line])
+                else:  # The code doesn't have a name yet, so set it to this line. Also check for the author name
+                    name, author = SplitAuthor(line)
+
+        # If the name only contains "#" characters, it represents the end of a category, so don't add it to the tree
+        if name and not name.lstrip('#'):
+            currdepth = name.count('#') - 1
+            continue
+
+        # It's a category, so set the depth and the parents key
+        if not code:
+            newitem = CodeItem(name.lstrip('#'), '', '', '', False)
+            currdepth = name.count('#')
+            parents[currdepth+1] = newitem
+
+        # Otherwise, it's a code. Force uppercase, because lowercase sucks.
+        else:
+            newitem = CodeItem(name.lstrip('#'), code.lstrip('\n').upper(), comment.lstrip('\n'), author, isenabled)
+
+        # Set the item's parent. If there's a key error, keep the previous one. Gotta stay safe.
+        parent = parents.get(currdepth, parent)
+        parent.children.append(newitem)
+
+        # Add 1 to depth, as children will be 1 level further down
+        if not code:
+            currdepth += 1
+
+    return gameid, root.children, ''
+
+
+def ParseINI(data: bytes, filename: str):
+    """
+    ParseTXT's uglier brother. Also, Dolphin is an asshole.
+    """
+    rawdata = data.decode(locale.getpreferredencoding(False)).splitlines()
+
+    # First, we have to find the sections containing the codes between all the file's sections
+    length = len(rawdata)
+    n = o = 0
+    m = p = length  # These will be set to the end of the file, in case there are no other sections than what we need
+    for i, line in enumerate(rawdata, 1):  # This starts from 1, in case of the first section being at index 0
+        if line == '[Gecko]':
+            n = i
+        elif line == '[Gecko_Enabled]':
+            o = i
+        elif i < length - 1 and rawdata[i].startswith('['):
+            """
+            If the next line begins a section, set this line as the end of the current section, but with some limits:
+            - If n > o, we're in the Gecko section. But if m is set, we're somewhere between them, so don't do anything
+            - If n < o, we're in the Gecko_Enabled section. But if p is set, we're somewhere between them, so don't do anything
+            - Finally, if n = o, it means we're in an unknown section, so don't do anything either.
+            """
+            if n > o and m == length:
+                m = i
+            elif n < o and p == length:
+                p = i
+
+    # We got the indexes, create the subsections. My palms are already sweating.
+    gecko = rawdata[n:m]
+    geckoenabled = set(rawdata[o:p])
+
+    # The rest of the file won't be wasted! It will be stored so if the user exports the list as ini, this data will be
+    # ported over.
+    scrap = ''
+    if n or p != length or m != o-1:
+        scrap = '\n'.join(chain(rawdata[:n-1], rawdata[m:o-1], rawdata[p:]))
+
+    # Parse the gecko section. Each entry is a [name, code, comment, author] list.
+    entrylist = []
+    for line in gecko:
+
+        # It's a code name. The author must be excluded from the code name, as it will fuck up Gecko_Enabled otherwise.
+        if line.startswith('$'):
+            name, author = SplitAuthor(line)
+            entrylist.append([name.lstrip('$'), '', '', author])  # Remove the first character
+
+        # Lines before the first code name have nowhere to go
+        elif not entrylist:
+            continue
+
+        # It's a comment line. Not using "and" because the line would end up in the "else"
+        elif line.startswith('*'):
+            if len(line) > 1:
+                entrylist[-1][2] = '\n'.join([entrylist[-1][2], line.lstrip('*')])  # Only add if the line is not empty
+
+        # It's a code line
+        else:
+            entrylist[-1][1] = '\n'.join([entrylist[-1][1], line.upper()])
+
+    # Enable the codes whose name is in the geckoenabled section, and remove the extra newlines at the beginning of the
+    # code and comment
+    nodes = [CodeItem(name, code.lstrip('\n'), comment.lstrip('\n'), author, '$' + name in geckoenabled)
+             for name, code, comment, author in entrylist]
+    return FileGameID(filename), nodes, scrap
+
+
+def ParseGCT(data: bytes):
+    """
+    This GCT parser is for the normal format. It lets the decoder split the codes according to the codetypes. Magic and
+    codelist end are skipped.
+    """
+    return [CodeItem('', AssembleCode(code.hex()), '', '', False) for code in SplitCodes(data[8:-8])]
+
+
+def ReadString(f, filelen: int):
+    """
+    Reads a null terminated string from the current offset.
+    """
+    string = ''
+    while f.tell() < filelen:
+        char = f.read(1)
+        if char == b'\0':
+            break
+        string += char.decode('utf-8', 'ignore')
+    return string
+
+
+def ParseExtendedGCT(data: bytes):
+    """
+    BrawlBox allows you to store code names and offsets in the GCT. So, this is for GCTs using that feature.
+    """
+    # Initialize vars
+    backupoffset = 0
+    nodes = []
+    f = io.BytesIO(data)
+    filelen = len(data)
+
+    # Let's find the codelist end
+    while f.tell() < filelen:
+        if f.read(8) == globalstuff.gctend:
+            f.seek(4, 1)
+            backupoffset = f.tell()  # Saving this for when i need to go back
+            break
+
+    # Failsafe time
+    if f.tell() == filelen:
+        raise ParseError('Invalid file', 'This file is invalid')
+
+    # Now let's find the game id. Why -8 ?
+    # First, the offset is according to the entry's beginning (aka the game name which was skipped)
+    # Second, the seek needs to be re-adjusted due to the read operation
+    f.seek(struct.unpack('I', f.read(4))[0]-8, 1)
+    gameid = ReadString(f, filelen)
+
+    # Read the amount of codes
+    f.seek(backupoffset)  # Go back
+    f.seek(4, 1)
+    amount = struct.unpack('I', f.read(4))[0]
+
+    # Begin reading codes!
+    while amount > 0:
+        # Read the offsets
+        codeoffs, codelen = struct.unpack('II', f.read(8))
+        nameoffs = f.tell() + struct.unpack('I', f.read(4))[0] - 8  # Offset starts at beginning of entry
+        commentoffs = f.tell() + struct.unpack('I', f.read(4))[0] - 12  # Same here
+        if commentoffs < f.tell():  # If there's no comment the value is 0, so if we subtract 12 we'll be at a smaller offset
+            commentoffs = 0
+        backupoffset = f.tell()
+
+        # Go to the code and read it
+        f.seek(codeoffs)
+        code = AssembleCode(f.read(codelen * 8).hex())  # Convert to hex string and add spaces and newlines
+
+        # Go to the code name and read it, then find the author inside the name
+        f.seek(nameoffs)
+        codename, author = SplitAuthor(ReadString(f, filelen))
+
+        # Go the comment and read it
+        comment = ''
+        if commentoffs:
+            f.seek(commentoffs)
+            comment = ReadString(f, filelen)
+
+        nodes.append(CodeItem(codename, code, comment, author, False))
+
+        # Go back to the offset we backed up earlier
+        f.seek(backupoffset)
+        amount -= 1
+
+    return gameid, nodes, ''
+
+
+def ReadGCT(data: bytes, filename: str):
+    """
+    Parses either type of GCT.
+    """
+    # This ain't it, chief
+    if data[:8] != globalstuff.gctmagic:
+        raise ParseError('Invalid file', 'This file is invalid')
+
+    # If the "Codelist End" is at the end of the file, we have a regular GCT. Otherwise we have an extended one.
+    if data[-8:] == globalstuff.gctend:
+        return FileGameID(filename), ParseGCT(data), ''
+    return ParseExtendedGCT(data)
+
+
+def ParseDOL(data: bytes):
+    """
+    ReadGCT's older sister. Looks for a GCT in the text sections.
+    """
+    # Get the entrypoint
+    entrypoint = struct.unpack_from('>I', data, 0xE0)[0]
+
+    # Check the text sections' loading address. The one with the same address as the entrypoint usually contains the
+    # codehandler+gct. But other custom code might override this, so as an additional check for 0x80001800 is made
+    for section, secmem in enumerate(struct.unpack_from('>7I', data, 0x48)):
+        if secmem != entrypoint and secmem != 0x80001800:
+            continue
+
+        # Get the section offset and length
+        sectionoffset = struct.unpack_from('>I', data, section * 4)[0]
+        sectionend = min(sectionoffset + struct.unpack_from('>I', data, 0x90 + section * 4)[0], len(data))
+
+        # Read the section until we find the GCT magic, then add everything up to the GCT EOF to the buffer
+        shouldadd = False
+        buffer = bytearray(globalstuff.gctmagic)
+        for offset in range(sectionoffset, sectionend, 8):
+            bytez = data[offset:offset+8]
+            if shouldadd:
+                buffer += bytez
+                if bytez == globalstuff.gctend:
+                    break
+            elif bytez == globalstuff.gctmagic:
+                shouldadd = True
+
+        # We're assuming there is only one GCT here. Who in their right mind would add more than one?!
+        if len(buffer) > 8:
+            return None, ParseGCT(bytes(buffer)), ''
+
+    # If there are no matches, it means there's no codes here for us to find
+    raise ParseError('Empty DOL', 'No GCTs were found in this file')
+
+
+def ParseFile(filename: str, data: bytes = None):
+    """
+    Parses the file with the parser for its extension. The content is read from the file if not given.
+    """
+    if data is None:
+        with open(filename, 'rb') as f:
+            data = f.read()
+
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.txt':
+        return ParseTXT(data)
+    if ext == '.ini':
+        return ParseINI(data, filename)
+    if ext == '.gct':
+        return ReadGCT(data, filename)
+    if ext == '.dol':
+        try:
+            return ParseDOL(data)
+        except struct.error:  # Too short to have a header
+            raise ParseError('Empty DOL', 'No GCTs were found in this file')
+    raise ParseError('Unknown Format', "Can't open {} files".format(ext or 'extensionless'))
+
+
+def NameCodes(nodes: list, taken: set):
+    """
+    Names the unnamed items "Unknown Code N", with N counting up from 1 and skipping the names already taken. The new
+    names are added to taken.
+    """
+    unkcount = 1
+    for node in WalkItems(CodeNode(None, Qt.Unchecked, children=nodes)):
+        if not node.texts[0]:
+            while 'Unknown Code ' + str(unkcount) in taken:
+                unkcount += 1
+            node.texts = ('Unknown Code ' + str(unkcount),) + node.texts[1:]
+            taken.add(node.texts[0])
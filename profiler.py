@@ -0,0 +1,209 @@
+"""
+Optional timing of the operations which can get slow with big codelists (importing, exporting, searching...). It's
+off unless enabled in the options or by setting the CODEMANAGER_PROFILE environment variable. The results can be seen
+in the statistics dialog and saved as JSON, and a single run of any operation can be profiled with cProfile.
+"""
+import collections
+import functools
+import os
+import time
+
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import Qt
+
+import globalstuff
+
+# Whether timing was forced on from outside the program
+forced = bool(os.environ.get('CODEMANAGER_PROFILE'))
+
+# Operation name -> {'calls', 'total', 'max', 'last', 'counts'}, in the order they were registered
+operations = {}
+
+# The latest calls, as (operation, start time, duration, counts) tuples
+history = collections.deque(maxlen=500)
+
+# Operation name -> file to write its next run's cProfile stats to
+armed = {}
+
+# The running profile, if any
+profiles = []
+
+
+def Enabled():
+    return forced or globalstuff.profiling
+
+
+def Profiled(name: str, counts=None):
+    """
+    Decorator which times every call to the function under the given operation name. If given, counts receives the
+    function's result followed by its arguments, and returns a dict of the amounts worth knowing (items, bytes...).
+    Those are collected after the timing ends, so they don't add to it.
+    """
+    operations[name] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0, 'counts': {}}
+
+    def Decorator(func):
+        @functools.wraps(func)
+        def Wrapper(*args, **kwargs):
+            # Don't get in the way if nobody is looking
+            if not Enabled() and name not in armed:
+                return func(*args, **kwargs)
+
+            # Run the function, through cProfile if requested. Only one profile can run at a time, so operations called
+            # by a profiled one stay armed.
+            start = time.perf_counter()
+            if name in armed and not profiles:
+                import cProfile  # Only needed here
+                file = armed.pop(name)
+                profiles.append(cProfile.Profile())
+                try:
+                    result = profiles[0].runcall(func, *args, **kwargs)
+                finally:
+                    try:
+                        profiles.pop().dump_stats(file)
+                    except OSError:
+                        pass
+            else:
+                result = func(*args, **kwargs)
+            Record(name, start, time.perf_counter() - start, counts(result, *args, **kwargs) if counts else {})
+            return result
+        return Wrapper
+    return Decorator
+
+
+def Record(name: str, start: float, duration: float, counts: dict):
+    stats = operations[name]
+    stats['calls'] += 1
+    stats['total'] += duration
+    stats['max'] = max(stats['max'], duration)
+    stats['last'] = duration
+    stats['counts'] = counts
+    history.append((name, start, duration, counts))
+
+
+def Reset():
+    for stats in operations.values():
+        stats.update(calls=0, total=0.0, max=0.0, last=0.0, counts={})
+    history.clear()
+
+
+def DumpStats(file: str):
+    """
+    Writes the collected timings (in seconds) to a JSON file.
+    """
+    import json  # Only needed here
+    data = {'operations': operations,
+            'history': [dict(operation=name, start=start, duration=duration, counts=counts)
+                        for name, start, duration, counts in history]}
+    with open(file, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def TreeCount(tree: QtWidgets.QTreeWidget):
+    """
+    Returns the amount of items in a tree.
+    """
+    return len(tree.findItems('', Qt.MatchContains | Qt.MatchRecursive))
+
+
+def FileSize(file: str):
+    return os.path.getsize(file) if os.path.isfile(file) else 0
+
+
+class StatsDialog(QtWidgets.QDialog):
+    """
+    Shows the collected timings, with buttons to save them and to profile an operation. The freezes caught by the
+    watchdog can be saved from here too.
+    """
+    def __init__(self):
+        super().__init__()
+
+        # Explain how to turn it on
+        self.Notice = QtWidgets.QLabel('Timing is off. Enable it in the options, or set the CODEMANAGER_PROFILE '
+                                       'environment variable before starting the program.')
+        self.Notice.setWordWrap(True)
+        self.Notice.setVisible(not Enabled())
+
+        # Add the table
+        self.Table = QtWidgets.QTreeWidget()
+        self.Table.setHeaderLabels(['Operation', 'Calls', 'Total (ms)', 'Average (ms)', 'Max (ms)', 'Last (ms)',
+                                    'Last Counts'])
+        self.Table.setRootIsDecorated(False)
+        self.Table.itemSelectionChanged.connect(lambda: self.ProfileButton.setEnabled(
+                                                bool(self.Table.selectedItems())))
+
+        # Add the buttons
+        self.RefreshButton = QtWidgets.QPushButton('Refresh')
+        self.RefreshButton.clicked.connect(self.Refresh)
+        self.ResetButton = QtWidgets.QPushButton('Reset')
+        self.ResetButton.clicked.connect(self.HandleReset)
+        self.ExportButton = QtWidgets.QPushButton('Save as JSON')
+        self.ExportButton.clicked.connect(self.HandleExport)
+        self.ProfileButton = QtWidgets.QPushButton('Profile Next Run')
+        self.ProfileButton.setEnabled(False)
+        self.ProfileButton.clicked.connect(self.HandleProfile)
+        self.StallButton = QtWidgets.QPushButton('Save Freezes')
+        self.StallButton.clicked.connect(self.HandleStalls)
+
+        # Make a layout and set it
+        L = QtWidgets.QGridLayout()
+        L.addWidget(self.Notice, 0, 0, 1, 5)
+        L.addWidget(self.Table, 1, 0, 1, 5)
+        L.addWidget(self.RefreshButton, 2, 0)
+        L.addWidget(self.ResetButton, 2, 1)
+        L.addWidget(self.ExportButton, 2, 2)
+        L.addWidget(self.ProfileButton, 2, 3)
+        L.addWidget(self.StallButton, 2, 4)
+        self.setLayout(L)
+        self.setWindowTitle('Statistics')
+        self.resize(800, 400)
+        self.Refresh()
+
+    def Refresh(self):
+        self.Table.clear()
+        for name, stats in operations.items():
+            calls = stats['calls']
+            item = QtWidgets.QTreeWidgetItem([name, str(calls)] + ['{:.1f}'.format(value * 1000) for value in (
+                stats['total'], stats['total'] / calls if calls else 0, stats['max'], stats['last'])] + [
+                ', '.join('{}: {}'.format(key, value) for key, value in stats['counts'].items())])
+            if name in armed:
+                item.setText(0, name + ' (profiling next run)')
+            item.setData(0, Qt.UserRole, name)
+            self.Table.addTopLevelItem(item)
+        for column in range(self.Table.columnCount()):
+            self.Table.resizeColumnToContents(column)
+
+        # Show how many freezes there are to save
+        stalls = len(globalstuff.watchdog.stalls) if globalstuff.watchdog else 0
+        self.StallButton.setText('Save Freezes ({})'.format(stalls))
+        self.StallButton.setEnabled(bool(stalls))
+
+    def HandleReset(self):
+        Reset()
+        self.Refresh()
+
+    def HandleExport(self):
+        file = QtWidgets.QFileDialog.getSaveFileName(self, 'Save Statistics', 'stats.json', 'JSON (*.json)')[0]
+        if file:
+            try:
+                DumpStats(file)
+            except OSError:
+                QtWidgets.QMessageBox.critical(self, 'File Write Error', "Can't write file " + file)
+
+    def HandleStalls(self):
+        file = QtWidgets.QFileDialog.getSaveFileName(self, 'Save Freezes', 'freezes.json', 'JSON (*.json)')[0]
+        if file:
+            try:
+                globalstuff.watchdog.DumpStalls(file)
+            except OSError:
+                QtWidgets.QMessageBox.critical(self, 'File Write Error', "Can't write file " + file)
+
+    def HandleProfile(self):
+        """
+        Asks where to save the profile, then arms it for the operation's next run.
+        """
+        name = self.Table.selectedItems()[0].data(0, Qt.UserRole)
+        file = QtWidgets.QFileDialog.getSaveFileName(self, 'Save Profile', name.replace(' ', '') + '.prof',
+                                                     'cProfile Stats (*.prof)')[0]
+        if file:
+            armed[name] = file
+            self.Refresh()
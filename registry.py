@@ -0,0 +1,125 @@
+"""
+Keeps track of the opened windows, so they can be looked up without scanning the whole mdi area every time.
+"""
+from PyQt5 import QtWidgets
+
+# Opened windows, in opening order. Dicts are used as ordered sets.
+codelists = {}
+databases = {}
+editors = {}
+
+# Tree item -> CodeEditor which has it as parentz. Tree items can't be hashed, so their id is used as key instead.
+# The editor keeps a reference to its item, so the id can't be reused while the entry exists.
+parents = {}
+
+# Combo boxes listing the opened codelists. The first entry of each box is always "Create New Codelist", followed by
+# the codelists in opening order, so a codelist's index is the same in every box.
+boxes = {}
+
+
+def AddWindow(widget: QtWidgets.QWidget):
+    """
+    Registers a newly opened window.
+    """
+    if hasattr(widget, 'parentz'):
+        editors[widget] = None
+        if widget.parentz:
+            parents[id(widget.parentz)] = widget
+    elif hasattr(widget, 'dbfile'):
+        databases[widget] = None
+    else:
+        codelists[widget] = None
+        for box in boxes:
+            box.addItem(ListTitle(widget), widget)
+
+    # Let the window know about the opened codelists
+    if hasattr(widget, 'Combox'):
+        Subscribe(widget.Combox)
+
+
+def RemoveWindow(widget: QtWidgets.QWidget):
+    """
+    Unregisters a window that is being closed.
+    """
+    if hasattr(widget, 'Combox'):
+        boxes.pop(widget.Combox, None)
+
+    if widget in editors:
+        del editors[widget]
+        if widget.parentz and parents.get(id(widget.parentz)) is widget:
+            del parents[id(widget.parentz)]
+    else:
+        if widget in codelists:
+            index = ListIndex(widget)
+            del codelists[widget]
+            for box in boxes:
+                box.removeItem(index)
+
+        # The tree is about to be deleted, so its items must not be referenced anymore
+        databases.pop(widget, None)
+        DetachTree(widget.TreeWidget)
+
+
+def Subscribe(box: QtWidgets.QComboBox):
+    """
+    Fills the given combo box with the opened codelists and keeps it updated from now on.
+    """
+    boxes[box] = None
+    for codelist in codelists:
+        box.addItem(ListTitle(codelist), codelist)
+
+
+def ListIndex(codelist: QtWidgets.QWidget):
+    """
+    Returns the index of the given codelist in the combo boxes.
+    """
+    return list(codelists).index(codelist) + 1
+
+
+def ListTitle(codelist: QtWidgets.QWidget):
+    """
+    Returns the codelist's title as shown in the combo boxes. Only the game name and id are kept.
+    """
+    return codelist.windowTitle().replace('Codelist - ', '', 1)
+
+
+def RenameList(codelist: QtWidgets.QWidget):
+    """
+    Updates the given codelist's title in every combo box.
+    """
+    if codelist in codelists:
+        index = ListIndex(codelist)
+        title = ListTitle(codelist)
+        for box in boxes:
+            box.setItemText(index, title)
+
+
+def FindEditor(item: QtWidgets.QTreeWidgetItem):
+    """
+    Returns the CodeEditor which has the given item as parent, if any.
+    """
+    return parents.get(id(item))
+
+
+def DetachEditor(item: QtWidgets.QTreeWidgetItem):
+    """
+    Unsets the parentz parameter of the CodeEditor which has the given item as parent.
+    """
+    editor = parents.pop(id(item), None)
+    if editor:
+        editor.parentz = None
+
+
+def DetachTree(tree: QtWidgets.QTreeWidget):
+    """
+    Unsets the parentz parameter of every CodeEditor which has an item of the given tree as parent.
+    """
+    for editor in TreeEditors(tree):
+        DetachEditor(editor.parentz)
+
+
+def TreeEditors(tree: QtWidgets.QTreeWidget):
+    """
+    Returns the CodeEditors whose parent belongs to the given tree.
+    """
+    return [w for w in parents.values() if w.parentz.treeWidget() is tree]
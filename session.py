@@ -0,0 +1,142 @@
+"""
+Saves the opened codelists, databases and window layout to a compressed snapshot, so they can be brought back on the
+next start. Codelists are rebuilt straight from the snapshot, without going through the importers. Databases are only
+saved as a reference to their file.
+"""
+import os
+import pickle
+import zlib
+
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import Qt
+
+import globalstuff
+from codelist import CodeList
+from common import BulkUpdate, ChildItems
+from memory import TrackLoad
+from widgets import ModdedTreeWidgetItem
+
+# Bumped whenever the snapshot's layout changes, so that old snapshots are ignored instead of misread
+version = 1
+
+
+def ItemState(item: QtWidgets.QTreeWidgetItem):
+    """
+    Returns a (texts, check state, expanded, children) tuple for the item and its children. Codes have no children list.
+    """
+    texts = tuple(item.text(i) for i in range(5))
+    if texts[1]:
+        return texts, int(item.checkState(0)), False, None
+    return texts, int(item.checkState(0)), item.isExpanded(), [ItemState(child) for child in ChildItems(item)]
+
+
+def BuildState(state: tuple, expanded: list):
+    """
+    Recreates an item and its children from ItemState's tuple. The categories to expand once the item is in the tree
+    are added to the given list.
+    """
+    texts, checked, isexpanded, children = state
+    item = ModdedTreeWidgetItem(texts[0], children is not None, True)
+    for column in range(1, 5):
+        if texts[column]:
+            item.setText(column, texts[column])
+    if children:
+        item.addChildren([BuildState(child, expanded) for child in children])
+    if not item.childCount():
+        item.setCheckState(0, Qt.CheckState(checked))  # Categories follow their children
+    if isexpanded:
+        expanded.append(item)
+    return item
+
+
+def Snapshot():
+    """
+    Collects the session's state.
+    """
+    windows = []
+    for window in globalstuff.mainWindow.mdi.subWindowList(QtWidgets.QMdiArea.CreationOrder):
+        widget = window.widget()
+        layout = (window.geometry().getRect(), int(window.windowState()))
+        if isinstance(widget, CodeList):
+            windows.append(('codelist', layout, widget.gameID, widget.gameName, widget.scrap,
+                            [ItemState(item) for item in ChildItems(widget.TreeWidget.invisibleRootItem())]))
+        elif hasattr(widget, 'dbfile'):
+            windows.append(('database', layout, os.path.abspath(widget.dbfile)))
+    return version, bytes(globalstuff.mainWindow.saveGeometry()), windows
+
+
+def SaveSession(file: str = None):
+    """
+    Writes the session's snapshot. The file is replaced in one go, so a crash can't leave half of it behind.
+    """
+    file = file if file else globalstuff.sessionfile
+    data = zlib.compress(pickle.dumps(Snapshot(), pickle.HIGHEST_PROTOCOL))
+    with open(file + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(file + '.tmp', file)
+
+
+def LoadSession(file: str = None):
+    """
+    Reads a session snapshot. Returns None if there's no usable one.
+    """
+    file = file if file else globalstuff.sessionfile
+    try:
+        with open(file, 'rb') as f:
+            snapshot = pickle.loads(zlib.decompress(f.read()))
+    except (OSError, zlib.error, pickle.UnpicklingError, EOFError, AttributeError, ImportError, IndexError):
+        return None
+    if not isinstance(snapshot, tuple) or len(snapshot) != 3 or snapshot[0] != version:
+        return None
+    return snapshot
+
+
+@TrackLoad(lambda result, *args: result)
+def RestoreCodelist(gameid: str, gamename: str, scrap: str, items: list):
+    """
+    Opens a codelist with the given contents.
+    """
+    codelist = globalstuff.mainWindow.CreateNewWindow(CodeList())
+    codelist.SetGameID(gameid, gamename)
+    codelist.scrap = scrap
+
+    # Add the codes
+    expanded = []
+    with BulkUpdate(codelist.TreeWidget):
+        codelist.TreeWidget.addTopLevelItems([BuildState(state, expanded) for state in items])
+        for item in expanded:
+            item.setExpanded(True)
+
+    # Update the buttons and line counter
+    codelist.EnableButtons()
+    codelist.UpdateLines()
+    return codelist
+
+
+def RestoreSession(file: str = None):
+    """
+    Reopens the windows from the last session. Databases whose file is gone are skipped.
+    """
+    snapshot = LoadSession(file)
+    if not snapshot:
+        return
+    geometry, windows = snapshot[1:]
+
+    # Reopen the windows
+    for entry in windows:
+        if entry[0] == 'codelist':
+            widget = RestoreCodelist(*entry[2:])
+        elif entry[0] == 'database' and os.path.isfile(entry[2]):
+            from database import Database  # Pulls in lxml, so only load it when needed
+            widget = globalstuff.mainWindow.CreateNewWindow(Database(entry[2]))
+        else:
+            continue
+
+        # Put the window back where it was. Setting the state would undo the geometry, so only set it if needed.
+        rect, state = entry[1]
+        window = widget.parentWidget()
+        window.setGeometry(*rect)
+        if state:
+            window.setWindowState(Qt.WindowStates(state))
+
+    globalstuff.mainWindow.restoreGeometry(geometry)
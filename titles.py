@@ -1,5 +1,4 @@
 import os
-import urllib.request
 
 import globalstuff
 from PyQt5 import QtWidgets
@@ -14,6 +13,7 @@ def DownloadError():
 
 
 def DownloadTitles():
+    import urllib.request  # Slow to import and rarely needed
     try:
         with urllib.request.urlopen('https://www.gametdb.com/wiitdb.txt?LANG=EN') as src, open(globalstuff.wiitdb, 'wb') as dst:
             dst.write(src.read())
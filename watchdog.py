@@ -0,0 +1,121 @@
+"""
+Catches the GUI freezing. A timer on the GUI thread keeps updating a heartbeat, and a background thread checks it. If
+the heartbeat stops for longer than the configured threshold, the background thread takes samples of the GUI thread's
+Python stack until it starts beating again, so the code responsible for the freeze can be found. The latest freezes are
+kept and can be saved as JSON.
+"""
+import collections
+import sys
+import threading
+import time
+import traceback
+
+from PyQt5 import QtCore
+
+import globalstuff
+
+# Milliseconds between heartbeats, and between stack samples during a freeze
+interval = 100
+
+# Shortest threshold allowed. Anything close to the interval would take every late heartbeat for a freeze.
+minthreshold = interval * 2
+
+# Stacks kept per freeze. Further samples only count towards the ones already taken.
+maxsamples = 50
+
+
+class Stall:
+    """
+    A freeze of the GUI thread. Samples maps each stack (a tuple of "file:line function" strings) to how many times it
+    was seen.
+    """
+    def __init__(self, beat: float):
+        self.beat = beat  # Heartbeat it followed
+        self.start = time.time() - (time.monotonic() - beat)
+        self.duration = None  # Seconds, set once it's over
+        self.samples = collections.OrderedDict()
+
+    def AddSample(self, frame):
+        stack = tuple('{}:{} {}'.format(entry.filename, entry.lineno, entry.name)
+                      for entry in traceback.extract_stack(frame))
+        if stack in self.samples or len(self.samples) < maxsamples:
+            self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def Export(self):
+        return {'start': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.start)),
+                'duration': self.duration,
+                'samples': [{'count': count, 'stack': list(stack)} for stack, count in self.samples.items()]}
+
+
+class Watchdog:
+    """
+    Must be created on the GUI thread. The threshold is read from globalstuff.stallthreshold every time, so that it can
+    be changed while running. 0 turns the sampling off.
+    """
+    def __init__(self, keep: int = 20):
+        self.stalls = collections.deque(maxlen=keep)
+        self.current = None  # Ongoing freeze
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.guithread = threading.get_ident()
+        self.beat = time.monotonic()
+
+        # Start beating
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.Beat)
+        self.timer.start(interval)
+
+        # Start watching
+        self.thread = threading.Thread(target=self.Watch, daemon=True)
+        self.thread.start()
+
+    def Beat(self):
+        """
+        Updates the heartbeat. If the watcher caught a freeze, this is where it ends.
+        """
+        now = time.monotonic()
+        with self.lock:
+            if self.current:
+                self.current.duration = now - self.current.beat
+                self.current = None
+            self.beat = now
+
+    def Watch(self):
+        """
+        The watcher thread.
+        """
+        while not self.stopped.wait(interval / 1000):
+            if not globalstuff.stallthreshold:
+                continue
+            threshold = max(globalstuff.stallthreshold, minthreshold) / 1000
+
+            with self.lock:
+                if time.monotonic() - self.beat <= threshold:
+                    continue
+
+                # The heartbeat is late, so take a sample of what the GUI thread is doing
+                frame = sys._current_frames().get(self.guithread)
+                if frame is None:
+                    continue
+                if not self.current:
+                    self.current = Stall(self.beat)
+                    self.stalls.append(self.current)
+                self.current.AddSample(frame)
+                del frame  # Don't keep the GUI thread's locals alive
+
+    def Export(self):
+        """
+        Returns the recorded freezes, oldest first.
+        """
+        with self.lock:
+            return [stall.Export() for stall in self.stalls]
+
+    def DumpStalls(self, file: str):
+        import json  # Only needed here
+        with open(file, 'w') as f:
+            json.dump(self.Export(), f, indent=2)
+
+    def Stop(self):
+        self.timer.stop()
+        self.stopped.set()
+        self.thread.join()
@@ -1,9 +1,70 @@
 """
 This file contains modified widgets used by various windows.
 """
+import json
+
 import globalstuff
-from PyQt5 import QtWidgets, QtGui
-from PyQt5.Qt import Qt
+import registry
+from PyQt5 import QtCore, QtWidgets, QtGui
+from PyQt5.QtCore import Qt
+
+from common import BulkUpdate, ChildItems
+
+# Mime type of the codes dragged between windows
+codemime = 'application/x-codemanager-codes'
+
+
+def ItemNode(item: QtWidgets.QTreeWidgetItem):
+    """
+    Converts a checked code, or a category with checked codes, to a dict. Unchecked children are left out.
+    """
+    texts = [item.text(i) for i in range(5)]
+    if item.text(1):
+        return {'texts': texts} if item.checkState(0) == Qt.Checked else None
+    children = [node for node in map(ItemNode, ChildItems(item)) if node]
+    if children or item.checkState(0) == Qt.Checked:
+        return {'texts': texts, 'children': children}
+    return None
+
+
+def CopyItems(items: list):
+    """
+    Serializes the checked codes among the given items, keeping the categories they're in. Items inside other given
+    items are only copied once, and everything is kept in the tree's order.
+    """
+    # Initialize vars
+    nodes = []
+    if not items:
+        return b'[]'
+    wanted = set(map(id, items))
+
+    # Walk the tree, stopping at the given items
+    stack = [ChildItems(items[0].treeWidget().invisibleRootItem())]
+    while stack:
+        item = next(stack[-1], None)
+        if item is None:
+            stack.pop()
+        elif id(item) in wanted:
+            node = ItemNode(item)
+            if node:
+                nodes.append(node)
+        elif item.childCount():
+            stack.append(ChildItems(item))
+    return json.dumps(nodes).encode('utf-8')
+
+
+def BuildItem(node: dict):
+    """
+    Recreates an item and its children from the dict made by ItemNode. The children are added before the item is put
+    in a tree, so they don't cause any updates.
+    """
+    texts = node['texts']
+    item = ModdedTreeWidgetItem(texts[0], 'children' in node, True)
+    for column in range(1, 5):
+        if texts[column]:
+            item.setText(column, texts[column])
+    item.addChildren([BuildItem(child) for child in node.get('children', ())])
+    return item
 
 
 class ModdedTreeWidget(QtWidgets.QTreeWidget):
@@ -22,26 +83,83 @@ class ModdedTreeWidget(QtWidgets.QTreeWidget):
         header.setStretchLastSection(False)
         header.setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
 
+        # Function returning the tooltip of a given item, for tooltips which would be too slow to keep up to date
+        self.tooltips = None
+
+    def viewportEvent(self, e: QtCore.QEvent):
+        """
+        Asks for the hovered item's tooltip only when it's about to be shown, if a tooltip function is set.
+        """
+        if e.type() == QtCore.QEvent.ToolTip and self.tooltips:
+            item = self.itemAt(e.pos())
+            text = self.tooltips(item) if item else ''
+            if text:
+                QtWidgets.QToolTip.showText(e.globalPos(), text, self.viewport())
+            else:
+                QtWidgets.QToolTip.hideText()
+            return True
+        return super().viewportEvent(e)
+
+    def mimeData(self, items: list):
+        """
+        Adds the dragged codes to the drag data, hidden columns and categories included.
+        """
+        data = super().mimeData(items)
+        data.setData(codemime, CopyItems(items))
+        return data
+
+    def PasteItems(self, data: bytes, parent: QtWidgets.QTreeWidgetItem = None, index: int = -1):
+        """
+        Adds the codes copied by CopyItems to the given parent (or the top level) at the given index (or the end), all
+        in one go. Returns the new top level items.
+        """
+        items = [BuildItem(node) for node in json.loads(bytes(data).decode('utf-8'))]
+        parent = parent if parent else self.invisibleRootItem()
+        with BulkUpdate(self):
+            parent.insertChildren(index if index >= 0 else parent.childCount(), items)
+        return items
+
     def dragEnterEvent(self, e: QtGui.QDragEnterEvent):
         """
-        This forces the widget to accept drops, which would otherwise be rejected due to the InternalMove flag.
+        This forces the widget to accept codes from other windows, which would otherwise be rejected due to the
+        InternalMove flag.
         """
-        src = e.source()
-        if isinstance(src, QtWidgets.QTreeWidget):
+        if e.source() is self or e.mimeData().hasFormat(codemime):
+            e.accept()
+
+    def dragMoveEvent(self, e: QtGui.QDragMoveEvent):
+        """
+        Codes from other windows are copied, so the source keeps them.
+        """
+        if e.source() is self:
+            super().dragMoveEvent(e)
+        elif e.mimeData().hasFormat(codemime):
+            e.setDropAction(Qt.CopyAction)
             e.accept()
 
     def dropEvent(self, e: QtGui.QDropEvent):
         """
-        This bad hack adds a copy of the source widget's selected items in the destination widget. This is due to PyQt
-        clearing the hidden columns, which we don't want.
+        Codes from other windows are pasted into the category they're dropped on, or right after the code they're
+        dropped on. Dropping them anywhere else adds them at the end. Moving codes within the tree is left to Qt.
         """
-        src = e.source()
-        if src is not self:
-            for item in src.selectedItems():
-                clone = item.clone()
-                clone.setFlags(clone.flags() | Qt.ItemIsEditable)
-                self.addTopLevelItem(clone)
-        super().dropEvent(e)  # Call the original function
+        if e.source() is self:
+            super().dropEvent(e)
+            return
+        if not e.mimeData().hasFormat(codemime):
+            e.ignore()
+            return
+
+        # Find where to put the codes
+        target = self.itemAt(e.pos())
+        if target is None:
+            self.PasteItems(e.mimeData().data(codemime))
+        elif not target.text(1):
+            self.PasteItems(e.mimeData().data(codemime), target)
+        else:
+            parent = target.parent() if target.parent() else self.invisibleRootItem()
+            self.PasteItems(e.mimeData().data(codemime), parent, parent.indexOfChild(target) + 1)
+        e.setDropAction(Qt.CopyAction)
+        e.accept()
 
 
 class ModdedTreeWidgetItem(QtWidgets.QTreeWidgetItem):
@@ -83,7 +201,7 @@ class ModdedTreeWidgetItem(QtWidgets.QTreeWidgetItem):
 
 class ModdedSubWindow(QtWidgets.QMdiSubWindow):
     """
-    Dark mode and box updating functionality.
+    Dark mode and window tracking functionality.
     """
     def __init__(self, islist: bool):
         super().__init__()
@@ -104,8 +222,12 @@ class ModdedSubWindow(QtWidgets.QMdiSubWindow):
 
     def closeEvent(self, e: QtGui.QCloseEvent):
         super().closeEvent(e)
+        if e.isAccepted():
+            registry.RemoveWindow(self.widget())
+            if globalstuff.journal:
+                globalstuff.journal.Unwatch(self.widget())
         if self.islist:
-            globalstuff.mainWindow.updateboxes()
+            globalstuff.mainWindow.UpdateExportAll()
 
 
 class ModdedMdiArea(QtWidgets.QMdiArea):